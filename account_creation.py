@@ -637,6 +637,10 @@ async def handle_contact_sharing(message):
             if not phone_number.startswith('+'):
                 phone_number = f"+{phone_number}"
 
+            from main import ensure_contact_available
+            if not await ensure_contact_available(message, user_id, phone_number=phone_number):
+                return
+
             # Store phone number and move to next step
             user_state[user_id]["data"]["phone_number"] = phone_number
             user_state[user_id]["current_step"] = "waiting_email"
@@ -728,6 +732,10 @@ async def handle_contact_sharing(message):
                 if not phone_number.startswith('+'):
                     phone_number = f"+{phone_number}"
 
+                from main import ensure_contact_available
+                if not await ensure_contact_available(message, user_id, phone_number=phone_number):
+                    return
+
                 user_state[user_id]["data"]["phone_number"] = phone_number
                 user_state[user_id]["current_step"] = "waiting_email"
 
@@ -859,12 +867,9 @@ async def handle_login_phone_verification(message, user_id):
     """Handle login phone verification"""
     phone = message.text.strip()
 
-    # Find user with matching phone number
-    matching_user = None
-    for uid, data in users_data.items():
-        if data.get('phone_number') == phone:
-            matching_user = uid
-            break
+    # Find user with matching phone number (normalized phone index)
+    from main import find_user_id_by
+    matching_user = await find_user_id_by(phone_number=phone)
 
     if matching_user and matching_user == user_id:
         # Phone matches, complete login
@@ -1094,6 +1099,11 @@ async def handle_manual_phone_input(message, user_id):
         )
         return
 
+    # Phone numbers are unique per account
+    from main import ensure_contact_available
+    if not await ensure_contact_available(message, user_id, phone_number=phone_cleaned):
+        return
+
     # Store phone number and move to next step
     user_state[user_id]["data"]["phone_number"] = phone_cleaned
     user_state[user_id]["current_step"] = "waiting_email"
@@ -1173,6 +1183,11 @@ async def handle_email_input(message, user_id):
         await message.answer(error_text)
         return
 
+    # Emails are unique per account
+    from main import ensure_contact_available
+    if not await ensure_contact_available(message, user_id, email=email):
+        return
+
     # Store email and complete account creation
     user_state[user_id]["data"]["email"] = email
 
@@ -1184,8 +1199,7 @@ async def handle_email_input(message, user_id):
     import string
     import time
     
-    def generate_referral_code_local():
-        return f"ISP{''.join(random.choices(string.ascii_uppercase + string.digits, k=6))}"
+    from main import generate_referral_code
     
     def generate_access_token_local():
         return f"ISP-{''.join(random.choices(string.ascii_letters + string.digits, k=32))}"
@@ -1203,8 +1217,9 @@ async def handle_email_input(message, user_id):
             'balance': 0.0,
             'total_spent': 0.0,
             'orders_count': 0,
-            'referral_code': generate_referral_code_local(),
-            'referred_by': None,
+            'referral_code': existing_record.get('referral_code') or await generate_referral_code(),
+            # Set by /start <code> before the account was created
+            'referred_by': existing_record.get('referred_by'),
             'access_token': generate_access_token_local(),  # Generate access token for UI
             'status': 'active',
             'account_created': True,  # Mark account as completed
@@ -1234,7 +1249,7 @@ async def handle_email_input(message, user_id):
 
     # Store the access token for future reference
     users_data[user_id]['access_token'] = access_token
-    save_users_data()
+    save_users_data(user_id)
 
     # Send admin notification with new account details and token
     telegram_username = message.from_user.username if message.from_user and message.from_user.username else ""
@@ -1496,14 +1511,16 @@ async def handle_access_token_login(message, user_id):
         decoded_email = decoded_data.get('email', '')
         is_telegram_name = decoded_data.get('is_telegram_name', False)
 
-        # Find matching user in database by phone and email combination
+        # Find the account by phone index, then confirm email and name match
+        from main import find_user_id_by, reindex_user, generate_referral_code
+        from user_index import normalize_email
         matching_user_id = None
-        for uid, data in users_data.items():
-            if (data.get('phone_number') == decoded_phone and 
-                data.get('email') == decoded_email and 
+        candidate_id = await find_user_id_by(phone_number=decoded_phone)
+        if candidate_id is not None:
+            data = users_data.get(candidate_id, {})
+            if (normalize_email(data.get('email')) == normalize_email(decoded_email) and
                 data.get('full_name') == decoded_username):
-                matching_user_id = uid
-                break
+                matching_user_id = candidate_id
 
         if matching_user_id:
             # Existing account found - login the user
@@ -1511,9 +1528,16 @@ async def handle_access_token_login(message, user_id):
                 # Account belongs to different Telegram user - create new entry
                 users_data[user_id] = users_data[matching_user_id].copy()
                 users_data[user_id]['created_at'] = init_user(user_id)
+                # Codes are unique per account, and the referrer was credited once already
+                users_data[user_id]['referral_code'] = await generate_referral_code()
+                users_data[user_id]['referred_by'] = None
 
             # Mark account as created and clear state (but protect admin broadcast state)
             users_data[user_id]['account_created'] = True
+            if matching_user_id != user_id:
+                # The token proves ownership - claim the phone/email before the save re-indexes this account
+                reindex_user(user_id, claim=True)
+            save_users_data(user_id)
 
             # Only clear state if it's not an admin broadcast operation
             current_step = user_state[user_id].get("current_step")
@@ -1573,6 +1597,7 @@ async def handle_access_token_login(message, user_id):
                 'access_token': access_token,  # Store the original token
                 'created_at': init_user(user_id)
             }
+            save_users_data(user_id)
 
             # Clear user state (but protect admin broadcast state)
             current_step = user_state[user_id].get("current_step")
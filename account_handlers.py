@@ -4,9 +4,12 @@ My Account Handlers - India Social Panel
 All account-related functionality and handlers
 """
 
+import json
+import os
 import time
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional, Callable, Union
+from typing import Dict, Any, Optional, Callable, Tuple, Union
 from aiogram import F
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 import pytz
@@ -25,6 +28,11 @@ require_account: Optional[Callable] = None
 is_account_created: Optional[Callable[[int], bool]] = None
 is_admin: Optional[Callable[[int], bool]] = None
 
+# Rendered order-history pages kept for repeat taps
+ORDER_HISTORY_PAGE_CACHE = int(os.getenv("ORDER_HISTORY_PAGE_CACHE", "2000"))
+# Orders per order-history page - keeps every page well under Telegram's 4096-character limit
+ORDER_HISTORY_PAGE_SIZE = int(os.getenv("ORDER_HISTORY_PAGE_SIZE", "8"))
+
 def format_join_date_with_timezone(join_date_str: str, user_timezone: str = "Asia/Kolkata") -> str:
     """Format join date with timezone information"""
     try:
@@ -110,6 +118,8 @@ def init_account_handlers(main_dp, main_users_data, main_orders_data, main_requi
         # Register handlers after initialization
         dp.callback_query.register(require_account(cb_my_account), F.data == "my_account")
         dp.callback_query.register(require_account(cb_order_history), F.data == "order_history")
+        dp.callback_query.register(require_account(cb_order_history),
+                                   F.data.startswith(ORDER_HISTORY_OLDER) | F.data.startswith(ORDER_HISTORY_NEWER))
         dp.callback_query.register(require_account(cb_refill_history), F.data == "refill_history")
         dp.callback_query.register(require_account(cb_api_key), F.data == "api_key")
         dp.callback_query.register(require_account(cb_edit_profile), F.data == "edit_profile")
@@ -266,59 +276,24 @@ Select any option below to manage your account settings and preferences.
     await callback.answer()
 
 # ========== ORDER HISTORY ==========
-async def cb_order_history(callback: CallbackQuery):
-    """Show user's order history with proper details"""
-    if not callback.message or not callback.from_user:
-        return
-
-    user_id = callback.from_user.id
-
-    # CRITICAL FIX: Force fresh data reload to avoid cached references
-    from main import load_data_from_json
-    import main
-
-    # Force reload fresh data directly from JSON file every time
-    print(f"🔄 DEBUG: Force reloading fresh data from files...")
-    fresh_orders_data = load_data_from_json("orders.json") 
-    user_orders = []
-
-    print(f"🔍 DEBUG: Checking order history for user {user_id}")
-    print(f"🔍 DEBUG: fresh_orders_data has {len(fresh_orders_data)} orders")
-    print(f"🔍 DEBUG: main.order_temp has user {user_id}: {user_id in main.order_temp}")
-    print(f"🔍 DEBUG: local orders_data has {len(orders_data)} orders")
-
-    # Get from fresh_orders_data (guaranteed fresh from file)
-    for order_id, order in fresh_orders_data.items():
-        # CRITICAL FIX: Check both user_id and customer_id for compatibility
-        order_user_id = order.get('user_id') or order.get('customer_id')
-        if order_user_id == user_id:
-            order_status = order.get('status', 'pending')
-            print(f"🔍 Found order in fresh_orders_data: {order_id} - Status: {order_status} - UserID: {order_user_id}")
-            user_orders.append(order)
-
-    # Get from main.order_temp (recent orders) 
-    if user_id in main.order_temp:
-        temp_order = main.order_temp[user_id].copy()
-        temp_order['is_recent'] = True
-        temp_order_status = temp_order.get('status', 'processing')
-        print(f"🔍 Found recent order in main.order_temp: {temp_order.get('order_id', 'NO_ID')} - Status: {temp_order_status}")
-        user_orders.append(temp_order)
-
-    # Also get from local orders_data if it exists
-    if orders_data:
-        for order_id, order in orders_data.items():
-            # CRITICAL FIX: Check both user_id and customer_id for compatibility
-            order_user_id = order.get('user_id') or order.get('customer_id')
-            if order_user_id == user_id:
-                # Check if not already added
-                existing_ids = [o.get('order_id') for o in user_orders]
-                if order.get('order_id') not in existing_ids:
-                    order_status = order.get('status', 'pending')
-                    print(f"🔍 Found order in local orders_data: {order_id} - Status: {order_status} - UserID: {order_user_id}")
-                    user_orders.append(order)
-
-    print(f"🔍 DEBUG: Total orders found for user {user_id}: {len(user_orders)}")
-
+# Cursor callbacks - the order ID the next page starts after ("oh:o:ISP-123456-AB12CD" = 21 bytes)
+ORDER_HISTORY_OLDER = "oh:o:"
+ORDER_HISTORY_NEWER = "oh:n:"
+
+# (user_id, callback data) -> ((order index version, order_temp signature), page text, nav row),
+# least recently used first
+_order_history_pages: "OrderedDict[Tuple[int, str], Tuple[Any, str, list]]" = OrderedDict()
+
+def _history_cursor(prefix: str, order: Dict[str, Any]) -> Optional[str]:
+    """Callback data for a page next to order, None when it can't fit Telegram's 64-byte limit"""
+    order_id = order.get('order_id')
+    if not order_id:
+        return None
+    data = f"{prefix}{order_id}"
+    return data if len(data.encode()) <= 64 else None
+
+def _render_order_history(user_orders, total: int, offset: int = 0) -> str:
+    """Order history text for one page of a user's orders, newest first"""
     if not user_orders:
         text = """
 ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -363,15 +338,12 @@ async def cb_order_history(callback: CallbackQuery):
         text = f"""
 📜 <b>Order History</b>
 
-📊 <b>Total Orders Found:</b> {len(user_orders)}
+📊 <b>Total Orders Found:</b> {total}
 
-📋 <b>Recent Orders (Latest First):</b>
+📋 <b>Orders {offset + 1}-{offset + len(user_orders)} (Latest First):</b>
 
 """
-        # Sort orders by created_at (newest first)
-        sorted_orders = sorted(user_orders, key=lambda x: x.get('created_at', ''), reverse=True)
-
-        for i, order in enumerate(sorted_orders[:15], 1):  # Show last 15 orders
+        for i, order in enumerate(user_orders, offset + 1):
             status_emoji = {"processing": "⏳", "completed": "✅", "failed": "❌", "pending": "🔄", "cancelled": "❌"}
             emoji = status_emoji.get(order.get('status', 'processing'), "⏳")
 
@@ -427,8 +399,62 @@ async def cb_order_history(callback: CallbackQuery):
 • Contact Support: @tech_support_admin
 • Don't forget to mention the Order ID
 """
+    return text
 
-    back_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+async def cb_order_history(callback: CallbackQuery):
+    """Show user's order history with proper details"""
+    if not callback.message or not callback.from_user:
+        return
+
+    user_id = callback.from_user.id
+
+    import main
+
+    data = callback.data or ""
+    older_than = data[len(ORDER_HISTORY_OLDER):] if data.startswith(ORDER_HISTORY_OLDER) else None
+    newer_than = data[len(ORDER_HISTORY_NEWER):] if data.startswith(ORDER_HISTORY_NEWER) else None
+
+    temp_order = main.order_temp.get(user_id)
+    page_key = None
+    if isinstance(main.orders_data, dict):
+        # Every order change in this process goes through save_order, which bumps the index version
+        temp_signature = json.dumps(temp_order, sort_keys=True, default=str) if temp_order else None
+        page_key = (main.order_index.index.version(user_id), temp_signature)
+
+    cache_key = (user_id, data)
+    cached = _order_history_pages.get(cache_key)
+    if page_key is not None and cached and cached[0] == page_key:
+        _order_history_pages.move_to_end(cache_key)
+        text, nav_row = cached[1], cached[2]
+    else:
+        # Per-user index (JSON) or indexed query on orders(user_id, created_at) (SQLite),
+        # covering legacy customer_id orders too - only this page is fetched and formatted
+        page = await main.repository.order_history_page(user_id, older_than, newer_than, ORDER_HISTORY_PAGE_SIZE)
+        user_orders, total = list(page['orders']), page['total']
+
+        nav_row = []
+        newer = _history_cursor(ORDER_HISTORY_NEWER, user_orders[0]) if page['has_newer'] else None
+        older = _history_cursor(ORDER_HISTORY_OLDER, user_orders[-1]) if page['has_older'] else None
+        if newer:
+            nav_row.append(InlineKeyboardButton(text="⬅️ Newer", callback_data=newer))
+        if older:
+            nav_row.append(InlineKeyboardButton(text="Older ➡️", callback_data=older))
+
+        # Newest page - add the order in main.order_temp (recent order) unless it has been stored already
+        if not page['has_newer'] and temp_order and \
+                temp_order.get('order_id') not in {order.get('order_id') for order in user_orders}:
+            temp_order = dict(temp_order)
+            temp_order['is_recent'] = True
+            user_orders.insert(0, temp_order)
+            total += 1
+
+        text = _render_order_history(user_orders, total, page['offset'])
+        if page_key is not None:
+            _order_history_pages[cache_key] = (page_key, text, nav_row)
+            if len(_order_history_pages) > ORDER_HISTORY_PAGE_CACHE:
+                _order_history_pages.popitem(last=False)
+
+    back_keyboard = InlineKeyboardMarkup(inline_keyboard=([nav_row] if nav_row else []) + [
         [
             InlineKeyboardButton(text="🚀 New Order", callback_data="new_order"),
             InlineKeyboardButton(text="📞 Contact Support", url="https://t.me/tech_support_admin")
@@ -629,7 +655,7 @@ async def cb_create_api_key(callback: CallbackQuery):
 
     # Save user data to persistent storage
     from main import save_data_to_json
-    save_data_to_json(users_data, "users.json")
+    save_data_to_json(users_data, "users.json", user_id)
 
     text = f"""
 🎉 <b>API Key Successfully Created!</b>
@@ -812,7 +838,7 @@ async def cb_confirm_regenerate_api(callback: CallbackQuery):
 
     # Save user data to persistent storage
     from main import save_data_to_json
-    save_data_to_json(users_data, "users.json")
+    save_data_to_json(users_data, "users.json", user_id)
 
     text = f"""
 🎉 <b>API Key Successfully Regenerated!</b>
@@ -1709,7 +1735,7 @@ async def cb_sync_telegram_data(callback: CallbackQuery):
 
         # Save user data to persistent storage
         from main import save_data_to_json
-        save_data_to_json(users_data, "users.json")
+        save_data_to_json(users_data, "users.json", user_id)
 
     text = f"""
 🔄 <b>Telegram Data Synced Successfully!</b>
@@ -1846,9 +1872,11 @@ async def cb_user_stats(callback: CallbackQuery):
     user_id = callback.from_user.id
     user_data = users_data.get(user_id, {})
 
-    # Calculate stats
-    total_orders = len([o for o in orders_data.values() if o.get('user_id') == user_id])
-    completed_orders = len([o for o in orders_data.values() if o.get('user_id') == user_id and o.get('status') == 'completed'])
+    # Calculate stats from the user's own orders only
+    import main
+    user_orders = await main.repository.orders_for_user(user_id)
+    total_orders = len(user_orders)
+    completed_orders = sum(1 for o in user_orders if o.get('status') == 'completed')
     success_rate = (completed_orders / total_orders * 100) if total_orders > 0 else 0
 
     text = f"""
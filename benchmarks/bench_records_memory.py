@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Record Memory Benchmark
+Resident memory of users_data / orders_data as plain dicts vs slotted records
+
+Usage: python benchmarks/bench_records_memory.py [users] [orders]   (default 100000 1000000)
+"""
+
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import UserRecord, OrderRecord  # noqa: E402
+from benchmarks.synthetic import make_user, make_order  # noqa: E402
+
+
+def measure(label: str, build) -> float:
+    """Build a structure under tracemalloc and return its resident size in MB"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    data = build()
+    elapsed = time.perf_counter() - started
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size_mb = current / (1024 * 1024)
+    print(f"   {label:<28} {size_mb:>9.1f} MB   (built in {elapsed:.1f}s, {len(data)} records)")
+    del data
+    gc.collect()
+    return size_mb
+
+
+def main() -> None:
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    orders = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    random.seed(42)
+
+    print(f"👥 users_data - {users} users")
+    user_dicts = measure("dict records", lambda: {i: make_user(i) for i in range(1, users + 1)})
+    user_slots = measure("UserRecord", lambda: {i: UserRecord(make_user(i)) for i in range(1, users + 1)})
+
+    print(f"📦 orders_data - {orders} orders")
+    order_dicts = measure("dict records", lambda: {f"ORD{n:09d}": make_order(n, users) for n in range(orders)})
+    order_slots = measure("OrderRecord", lambda: {f"ORD{n:09d}": OrderRecord(make_order(n, users))
+                                                  for n in range(orders)})
+
+    print("📊 Savings")
+    print(f"   users:  {user_dicts - user_slots:.1f} MB ({(1 - user_slots / user_dicts) * 100:.0f}%)")
+    print(f"   orders: {order_dicts - order_slots:.1f} MB ({(1 - order_slots / order_dicts) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Storage Benchmark
+Save/load latency, peak RSS and event-loop stall of each persistence backend at scale
+
+Usage:
+    python benchmarks/bench_storage.py [--sizes 10000,100000,1000000] [--backends json,snapshot,journal,sqlite]
+
+Every (backend, size) pair runs in its own subprocess inside a temp directory, so peak
+RSS is per scenario and no data files of the bot are touched. A size of N means N users,
+N orders and N/10 tickets.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import make_users, make_orders, make_tickets  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows - peak RSS is not reported
+    resource = None
+
+BACKENDS = ["json", "snapshot", "journal", "sqlite"]
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+# Journal mode appends orders one by one - cap how many are timed at the larger sizes
+JOURNAL_TIMED_APPENDS = 20_000
+
+
+# ========== MEASUREMENT HELPERS ==========
+def peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StallMonitor:
+    """Ticks the event loop every few ms and records the worst late wake-up"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.worst = 0.0
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.worst = max(self.worst, loop.time() - started - self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+async def timed(coro_factory):
+    """Run an awaitable under a stall monitor, return (milliseconds, worst stall ms)"""
+    with StallMonitor() as monitor:
+        # Let the monitor take its first tick before the work starts
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        await coro_factory()
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(monitor.interval * 2)
+    return elapsed * 1000, monitor.worst * 1000
+
+
+def file_size_mb(*paths: str) -> float:
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path)) / (1024 * 1024)
+
+
+# ========== BACKEND SCENARIOS ==========
+async def bench_json(users, orders, tickets, binary_snapshot: bool = False):
+    """Write-behind JSON saves through the persistence store, loads like on_startup"""
+    import persistence
+    import snapshot_format
+    from order_journal import OrderJournal
+
+    snapshot_format.ENABLED = binary_snapshot
+    store = persistence.store
+    store.start()
+
+    async def save():
+        store.mark_dirty("users.json", users, 1)
+        store.mark_dirty("orders.json", orders, "ORD000000000")
+        store.mark_dirty("tickets.json", tickets)
+        await store.flush()
+
+    save_ms, stall_ms = await timed(save)
+    await store.stop()
+
+    def load():
+        loaded_users = snapshot_format.load_with_snapshot(
+            "users.json", lambda: {int(k): v for k, v in persistence.load_json_recovering("users.json", {}).items()})
+        loaded_orders = OrderJournal("orders.json", "orders.bench.journal").load()
+        loaded_tickets = snapshot_format.load_with_snapshot(
+            "tickets.json", lambda: persistence.load_json_recovering("tickets.json", {}))
+        assert len(loaded_users) == len(users) and len(loaded_orders) == len(orders)
+        return loaded_tickets
+
+    started = time.perf_counter()
+    load()
+    load_ms = (time.perf_counter() - started) * 1000
+    paths = ["users.json", "orders.json", "tickets.json"]
+    if binary_snapshot:
+        paths += [snapshot_format.snapshot_path(path) for path in ("users.json", "orders.json")]
+    return {"save_ms": save_ms, "load_ms": load_ms, "stall_ms": stall_ms, "disk_mb": file_size_mb(*paths)}
+
+
+async def bench_journal(users, orders, tickets):
+    """Orders appended one entry per order, compacted once, then loaded snapshot + log"""
+    from order_journal import OrderJournal
+
+    journal = OrderJournal("orders.json", "orders.journal")
+    journal.compact({})
+    order_items = list(orders.items())
+    timed_items = order_items[:JOURNAL_TIMED_APPENDS]
+
+    async def append_all():
+        for order_id, order in timed_items:
+            journal.append(order_id, order)
+            # Handlers yield to the loop between orders
+            await asyncio.sleep(0)
+
+    append_ms, stall_ms = await timed(append_all)
+    for order_id, order in order_items[JOURNAL_TIMED_APPENDS:]:
+        journal.append(order_id, order)
+
+    log_mb = file_size_mb("orders.journal")
+    started = time.perf_counter()
+    loaded = OrderJournal("orders.json", "orders.journal").load()
+    replay_ms = (time.perf_counter() - started) * 1000
+    assert len(loaded) == len(orders)
+
+    started = time.perf_counter()
+    journal.compact(orders)
+    compact_ms = (time.perf_counter() - started) * 1000
+    await journal.stop(orders)
+
+    started = time.perf_counter()
+    OrderJournal("orders.json", "orders.journal").load()
+    load_ms = (time.perf_counter() - started) * 1000
+    return {
+        "save_ms": append_ms / len(timed_items),
+        "save_note": "per order",
+        "load_ms": load_ms,
+        "stall_ms": stall_ms,
+        "disk_mb": file_size_mb("orders.json") + log_mb,
+        "extra": f"replay {replay_ms:.0f}ms, compact {compact_ms:.0f}ms",
+    }
+
+
+async def bench_sqlite(users, orders, tickets):
+    """Bulk upserts on the SQLite thread, single-row upsert latency, full table loads"""
+    from sqlite_store import SQLiteRepository
+
+    repo = SQLiteRepository("bench.db")
+
+    async def save():
+        await asyncio.gather(*(asyncio.wrap_future(future) for future in (
+            repo.save_users(users), repo.save_orders(orders), repo.save_tickets(tickets))))
+
+    save_ms, stall_ms = await timed(save)
+
+    sample = random.sample(list(users), min(1000, len(users)))
+    started = time.perf_counter()
+    for user_id in sample:
+        await asyncio.wrap_future(repo.save_users({user_id: users[user_id]}))
+    row_ms = (time.perf_counter() - started) * 1000 / len(sample)
+
+    started = time.perf_counter()
+    loaded_users = await repo.load_users()
+    loaded_orders = await repo.load_orders()
+    await repo.load_tickets()
+    load_ms = (time.perf_counter() - started) * 1000
+    assert len(loaded_users) == len(users) and len(loaded_orders) == len(orders)
+    await repo.close()
+    return {"save_ms": save_ms, "load_ms": load_ms, "stall_ms": stall_ms,
+            "disk_mb": file_size_mb("bench.db", "bench.db-wal"), "extra": f"1-row upsert {row_ms:.2f}ms"}
+
+
+SCENARIOS = {
+    "json": lambda u, o, t: bench_json(u, o, t),
+    "snapshot": lambda u, o, t: bench_json(u, o, t, binary_snapshot=True),
+    "journal": bench_journal,
+    "sqlite": bench_sqlite,
+}
+
+
+def run_scenario(backend: str, size: int) -> None:
+    """Child process entry - run one scenario in a temp dir and print its result as JSON"""
+    random.seed(size)
+    users = make_users(size)
+    orders = make_orders(size, size)
+    tickets = make_tickets(max(size // 10, 1), size)
+    with tempfile.TemporaryDirectory(prefix="isp-bench-") as workdir:
+        os.chdir(workdir)
+        result = asyncio.run(SCENARIOS[backend](users, orders, tickets))
+        os.chdir(ROOT)
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(result))
+
+
+# ========== REPORT ==========
+def print_table(results) -> None:
+    header = f"{'backend':<10}{'records':>10}{'save':>14}{'load':>12}{'stall':>12}{'peak RSS':>11}{'disk':>10}  notes"
+    print(header)
+    print("-" * len(header))
+    for backend, size, result in results:
+        if "error" in result:
+            print(f"{backend:<10}{size:>10}  ❌ {result['error']}")
+            continue
+        save = f"{result['save_ms']:.1f}ms" if result.get("save_note") else f"{result['save_ms']:.0f}ms"
+        notes = ", ".join(filter(None, [result.get("save_note") and f"save {result['save_note']}",
+                                        result.get("extra")]))
+        print(f"{backend:<10}{size:>10}{save:>14}{result['load_ms']:>10.0f}ms{result['stall_ms']:>10.1f}ms"
+              f"{result['peak_rss_mb']:>9.0f}MB{result['disk_mb']:>8.1f}MB  {notes}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the bot's storage backends")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--run", nargs=2, metavar=("BACKEND", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_scenario(args.run[0], int(args.run[1]))
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    backends = [backend.strip() for backend in args.backends.split(",")]
+    results = []
+    for size in sizes:
+        for backend in backends:
+            print(f"⏱️ {backend} @ {size} records...", flush=True)
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", backend, str(size)],
+                                   capture_output=True, text=True)
+            try:
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+            except (ValueError, IndexError):
+                error = (child.stderr.strip().splitlines() or ["no output"])[-1]
+                result = {"error": error}
+            results.append((backend, size, result))
+
+    print()
+    print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Synthetic Benchmark Data
+Users, orders and tickets shaped like the records init_user/account creation,
+cb_pay_from_balance and the support flow produce
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Any
+
+PLATFORMS = ["instagram", "youtube", "facebook", "telegram", "twitter", "tiktok"]
+ORDER_STATUSES = ["processing", "completed", "completed", "completed", "cancelled"]
+PAYMENT_METHODS = ["Account Balance", "QR Code Screenshot"]
+TICKET_STATUSES = ["open", "open", "closed"]
+
+_EPOCH = datetime(2025, 1, 1)
+
+
+def make_user(user_id: int) -> Dict[str, Any]:
+    """Completed account - init_user's minimal record plus the account creation profile"""
+    # Strings are built at runtime like json.load does - no shared constants
+    return {
+        "user_id": user_id,
+        "username": f"user{user_id}",
+        "first_name": f"Name{user_id % 5000}",
+        "join_date": (_EPOCH + timedelta(minutes=user_id)).isoformat(),
+        "account_created": True,
+        "full_name": f"Full Name {user_id}",
+        "phone_number": f"+91{9000000000 + user_id}",
+        "email": f"user{user_id}@example.com",
+        "balance": float(user_id % 1000),
+        "total_spent": float(user_id % 700),
+        "orders_count": user_id % 20,
+        "referral_code": f"ISP{user_id:06d}",
+        "referred_by": None,
+        "access_token": f"ISP-{user_id:032d}",
+        "status": "".join("active"),
+        "profile_photo": None,
+    }
+
+
+def make_order(n: int, users: int) -> Dict[str, Any]:
+    """Order record as cb_pay_from_balance stores it"""
+    platform = random.choice(PLATFORMS)
+    return {
+        "order_id": f"ORD{n:09d}",
+        "user_id": 1 + n % users,
+        "package_name": f"{platform.title()} Followers Package {n % 40}",
+        "service_id": str(1000 + n % 40),
+        "platform": "".join(platform),
+        "link": f"https://example.com/p/{n}",
+        "quantity": 100 * (1 + n % 50),
+        "total_price": float(n % 5000) / 10,
+        "status": "".join(random.choice(ORDER_STATUSES)),
+        "created_at": (_EPOCH + timedelta(seconds=n)).isoformat(),
+        "payment_method": "".join(random.choice(PAYMENT_METHODS)),
+        "payment_status": "".join("completed"),
+    }
+
+
+def make_ticket(n: int, users: int) -> Dict[str, Any]:
+    """Support ticket"""
+    return {
+        "ticket_id": f"TKT{n:010d}",
+        "user_id": 1 + n % users,
+        "subject": f"Order issue #{n}",
+        "message": f"My order has not started yet, please check ticket {n}.",
+        "status": "".join(random.choice(TICKET_STATUSES)),
+        "created_at": (_EPOCH + timedelta(seconds=n * 7)).isoformat(),
+        "replies": [],
+    }
+
+
+def make_users(count: int) -> Dict[int, Dict[str, Any]]:
+    return {user_id: make_user(user_id) for user_id in range(1, count + 1)}
+
+
+def make_orders(count: int, users: int) -> Dict[str, Dict[str, Any]]:
+    return {f"ORD{n:09d}": make_order(n, users) for n in range(count)}
+
+
+def make_tickets(count: int, users: int) -> Dict[str, Dict[str, Any]]:
+    return {f"TKT{n:010d}": make_ticket(n, users) for n in range(count)}
@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Broadcast Jobs
+Broadcasts and offer campaigns as checkpointed job records (cursor, sent/failed bitmaps,
+content) in broadcast_jobs.json, with each job's recipient list written once beside it,
+so a restart resumes them where they stopped instead of messaging everyone again;
+admins pause/resume/cancel them
+"""
+
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, Awaitable, Callable, Iterator, List, Optional, Tuple
+
+import broadcaster
+import persistence
+import records
+
+JOBS_FILE = os.getenv("BROADCAST_JOBS_FILE", "broadcast_jobs.json")
+# Cross-worker pause/resume/cancel requests (SHARED_STATE) - polled by the worker running the jobs
+CONTROL_FILE = f"{JOBS_FILE}.control"
+# Checkpoint after this many sends or seconds, whichever comes first
+CHECKPOINT_EVERY_SENDS = int(os.getenv("BROADCAST_CHECKPOINT_SENDS", "200"))
+CHECKPOINT_EVERY_SECONDS = float(os.getenv("BROADCAST_CHECKPOINT_SECONDS", "5"))
+# Finished/cancelled jobs kept for /broadcasts
+KEEP_FINISHED_JOBS = 20
+
+RUNNING, PAUSED, CANCELLED, DONE = "running", "paused", "cancelled", "done"
+STATUS_LABELS = {RUNNING: "🔄 Running", PAUSED: "⏸️ Paused", CANCELLED: "🛑 Cancelled", DONE: "✅ Done"}
+KIND_MESSAGE, KIND_OFFER = "message", "offer"
+
+
+def _encode_bits(bits: bytearray) -> str:
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+
+def _decode_bits(value: Optional[str], size: int) -> bytearray:
+    bits = bytearray(base64.b64decode(value)) if value else bytearray()
+    bits.extend(bytes(max((size + 7) // 8 - len(bits), 0)))
+    return bits
+
+
+class BroadcastJob:
+    """One broadcast: content, recipient snapshot and per-recipient sent/failed bits"""
+
+    def __init__(self, job_id: str, kind: str, content: Dict[str, Any], recipients: Optional[List[int]],
+                 created_by: int, label: str, total: Optional[int] = None):
+        self.job_id = job_id
+        self.kind = kind
+        self.content = content
+        # Read from the recipients file when the job runs - None while it isn't needed
+        self.recipients = recipients
+        self.total = len(recipients) if recipients is not None else total or 0
+        self.created_by = created_by
+        self.label = label
+        self.created_at = datetime.now().isoformat()
+        self.status = RUNNING
+        # Every recipient before the cursor has been sent or failed
+        self.cursor = 0
+        self.sent_bits = _decode_bits(None, self.total)
+        self.failed_bits = _decode_bits(None, self.total)
+        self.sent = 0
+        self.failures: Counter = Counter()
+        # Admin message edited with progress: (chat_id, message_id)
+        self.status_message: Optional[List[int]] = None
+        self.finished_at: Optional[str] = None
+
+    # ========== RECIPIENT BITS ==========
+    def is_done(self, position: int) -> bool:
+        byte, bit = divmod(position, 8)
+        return bool((self.sent_bits[byte] | self.failed_bits[byte]) & (1 << bit))
+
+    def mark(self, position: int, outcome: str) -> None:
+        byte, bit = divmod(position, 8)
+        if outcome == broadcaster.DELIVERED:
+            self.sent_bits[byte] |= 1 << bit
+            self.sent += 1
+        else:
+            self.failed_bits[byte] |= 1 << bit
+            self.failures[outcome] += 1
+        while self.cursor < self.total and self.is_done(self.cursor):
+            self.cursor += 1
+
+    def pending(self) -> Iterator[int]:
+        """Positions still to send, stopping as soon as the job is paused or cancelled"""
+        for position in range(self.cursor, self.total):
+            if self.status != RUNNING:
+                return
+            if not self.is_done(position):
+                yield position
+
+    @property
+    def failed(self) -> int:
+        return sum(self.failures.values())
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, CANCELLED)
+
+    def progress(self) -> broadcaster.BroadcastProgress:
+        """Progress counters seeded with what earlier runs already sent"""
+        progress = broadcaster.BroadcastProgress(self.total, self.label)
+        progress.sent = self.sent
+        progress.failed = self.failed
+        progress.failures = Counter(self.failures)
+        progress.baseline = progress.done
+        return progress
+
+    # ========== SERIALIZATION ==========
+    def to_dict(self) -> Dict[str, Any]:
+        """Checkpoint record - the recipients live in their own file"""
+        return {
+            'job_id': self.job_id, 'kind': self.kind, 'content': self.content, 'label': self.label,
+            'total': self.total, 'created_by': self.created_by, 'created_at': self.created_at,
+            'status': self.status, 'cursor': self.cursor, 'sent': self.sent, 'failures': dict(self.failures),
+            'sent_bits': _encode_bits(self.sent_bits), 'failed_bits': _encode_bits(self.failed_bits),
+            'status_message': self.status_message, 'finished_at': self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BroadcastJob":
+        # Jobs saved before recipients had their own file carry them inline
+        recipients = data.get('recipients')
+        job = cls(data['job_id'], data['kind'], data.get('content') or {},
+                  list(recipients) if recipients is not None else None,
+                  data.get('created_by'), data.get('label') or data['job_id'], data.get('total'))
+        job.created_at = data.get('created_at') or job.created_at
+        job.status = data.get('status', RUNNING)
+        job.cursor = data.get('cursor', 0)
+        job.sent = data.get('sent', 0)
+        job.failures = Counter(data.get('failures') or {})
+        job.sent_bits = _decode_bits(data.get('sent_bits'), job.total)
+        job.failed_bits = _decode_bits(data.get('failed_bits'), job.total)
+        job.status_message = data.get('status_message')
+        job.finished_at = data.get('finished_at')
+        return job
+
+
+class JobStore:
+    """Jobs by ID, checkpointed atomically on the I/O thread; runs each unfinished job as a task"""
+
+    def __init__(self, path: str = JOBS_FILE):
+        self.path = path
+        self.jobs: Dict[str, BroadcastJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._control_mtime = 0.0
+        # Checkpoints queued / written - a slow write never lands over a newer one
+        self._saves = 0
+        self._written = 0
+        self._write_lock = threading.Lock()
+        # Set by init() in on_startup
+        self.bot = None
+        self.mark_undeliverable: Optional[Callable[[int, str], Awaitable[None]]] = None
+        self.build_offer_message: Optional[Callable[[Dict[str, Any]], Tuple[str, Any]]] = None
+        # Shared-state workers other than the primary hand new jobs over instead of running them,
+        # so the primary is the only writer of the jobs file
+        self.forward = False
+
+    def init(self, bot, mark_undeliverable: Callable[[int, str], Awaitable[None]],
+             build_offer_message: Callable[[Dict[str, Any]], Tuple[str, Any]], forward: bool = False) -> None:
+        """Hand over the bot and the main.py helpers jobs need to send and to flag blocked users"""
+        self.bot = bot
+        self.mark_undeliverable = mark_undeliverable
+        self.build_offer_message = build_offer_message
+        self.forward = forward
+
+    # ========== PERSISTENCE ==========
+    def load(self) -> None:
+        try:
+            loaded = persistence.load_json_recovering(self.path, [])
+        except Exception as e:
+            print(f"❌ Error loading {self.path}: {e}")
+            loaded = []
+        self.jobs = {}
+        for data in loaded if isinstance(loaded, list) else []:
+            try:
+                job = BroadcastJob.from_dict(data)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"⚠️ Skipping unreadable broadcast job: {e}")
+                continue
+            if job.finished:
+                job.recipients = None
+            self.jobs[job.job_id] = job
+        unfinished = sum(1 for job in self.jobs.values() if not job.finished)
+        print(f"✅ {self.path} loaded: {len(self.jobs)} broadcast jobs ({unfinished} unfinished)")
+
+    def _serialize(self) -> str:
+        finished = sorted((job for job in self.jobs.values() if job.finished), key=lambda job: job.created_at)
+        for job in finished[:-KEEP_FINISHED_JOBS]:
+            del self.jobs[job.job_id]
+        # Serialized on the event loop so the write never sees a job mid-update
+        return json.dumps([job.to_dict() for job in self.jobs.values()], ensure_ascii=False,
+                          default=records.json_default)
+
+    def save(self) -> None:
+        """Checkpoint every job - cursors, bitmaps and counters only, written on the I/O thread"""
+        if self.forward:
+            return
+        text = self._serialize()
+        self._saves += 1
+        persistence.io_executor.submit(self._write, text, self._saves)
+
+    def _write(self, text: str, version: int) -> None:
+        with self._write_lock:
+            if version < self._written:
+                return
+            try:
+                persistence.atomic_write(self.path, lambda f: f.write(text))
+                self._written = version
+            except Exception as e:
+                print(f"❌ Error saving {self.path}: {e}")
+
+    def recipients_path(self, job_id: str) -> str:
+        return f"{self.path}.{job_id}.recipients"
+
+    def _write_recipients(self, job_id: str, recipients: List[int]) -> None:
+        persistence.atomic_write(self.recipients_path(job_id), lambda f: json.dump(recipients, f))
+
+    def _read_recipients(self, job_id: str) -> List[int]:
+        with open(self.recipients_path(job_id), 'r', encoding='utf-8') as f:
+            return [int(user_id) for user_id in json.load(f)]
+
+    def _remove_recipients(self, job_id: str) -> None:
+        try:
+            os.remove(self.recipients_path(job_id))
+        except OSError:
+            pass
+
+    async def _load_recipients(self, job: BroadcastJob) -> bool:
+        """Read the job's recipients off the loop before it runs"""
+        loop = asyncio.get_running_loop()
+        try:
+            if job.recipients is None:
+                job.recipients = await loop.run_in_executor(persistence.io_executor, self._read_recipients, job.job_id)
+            elif not os.path.exists(self.recipients_path(job.job_id)):
+                # Older job with inline recipients - give it its own file before the next checkpoint drops them
+                await loop.run_in_executor(persistence.io_executor, self._write_recipients, job.job_id, job.recipients)
+        except (OSError, ValueError) as e:
+            print(f"❌ Recipients of broadcast job {job.job_id} unreadable: {e}")
+            return False
+        return True
+
+    def _release(self, job: BroadcastJob) -> None:
+        """A finished job keeps its counters for /broadcasts - the recipient list goes"""
+        job.recipients = None
+        persistence.io_executor.submit(self._remove_recipients, job.job_id)
+
+    # ========== JOBS ==========
+    async def create(self, kind: str, content: Dict[str, Any], recipients: List[int], created_by: int,
+                     label: str, status_message: Optional[List[int]] = None) -> BroadcastJob:
+        # PID suffix - workers creating jobs in the same millisecond still get distinct IDs
+        job_id = f"B{int(time.time() * 1000):x}{os.getpid() % 256:02x}"
+        job = BroadcastJob(job_id, kind, content, [int(user_id) for user_id in recipients], created_by, label)
+        job.status_message = status_message
+        # Written once - checkpoints only carry the cursor, bitmaps and counters
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(persistence.io_executor, self._write_recipients, job_id, job.recipients)
+        if self.forward:
+            # The primary adopts it from the inbox file and runs it
+            record = job.to_dict()
+            await loop.run_in_executor(persistence.io_executor, self._write_forwarded, job_id, record)
+            return job
+        self.jobs[job_id] = job
+        self.save()
+        return job
+
+    def start(self, job: BroadcastJob) -> Optional[asyncio.Task]:
+        """Run job in the background (one task per job) - forwarded jobs are started by the primary"""
+        if self.forward:
+            return None
+        task = self._tasks.get(job.job_id)
+        if task is None or task.done():
+            task = self._tasks[job.job_id] = asyncio.create_task(self.run(job))
+        return task
+
+    async def stop(self) -> None:
+        """Stop the running jobs and write a final checkpoint - called on shutdown"""
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if not self.forward and self.jobs:
+            # Blocking on purpose - the I/O pool may already be shutting down
+            self._saves += 1
+            self._write(self._serialize(), self._saves)
+
+    def resume_all(self) -> int:
+        """Start every job that was running at shutdown - called from on_startup"""
+        self.adopt_forwarded()
+        resumed = [job for job in self.jobs.values() if job.status == RUNNING]
+        for job in resumed:
+            print(f"🔁 Resuming {job.label} ({job.job_id}) at {job.cursor}/{job.total}")
+            self.start(job)
+        return len(resumed)
+
+    async def run(self, job: BroadcastJob) -> broadcaster.BroadcastProgress:
+        """Send the job's remaining recipients, checkpointing as results come in"""
+        if not await self._load_recipients(job):
+            job.status = CANCELLED
+            job.finished_at = datetime.now().isoformat()
+            self.save()
+            return job.progress()
+        send = _sender(job, self.bot, self.build_offer_message)
+        unsaved = 0
+        last_save = time.monotonic()
+
+        async def on_result(position: int, outcome: str) -> None:
+            nonlocal unsaved, last_save
+            job.mark(position, outcome)
+            if outcome in broadcaster.UNREACHABLE_OUTCOMES:
+                await self.mark_undeliverable(job.recipients[position], outcome)
+            unsaved += 1
+            if unsaved >= CHECKPOINT_EVERY_SENDS or time.monotonic() - last_save >= CHECKPOINT_EVERY_SECONDS:
+                self.poll_control()
+                self.save()
+                unsaved, last_save = 0, time.monotonic()
+
+        async def report(progress: broadcaster.BroadcastProgress) -> None:
+            if job.status_message:
+                chat_id, message_id = job.status_message
+                await self.bot.edit_message_text(
+                    f"📢 <b>{job.label}</b> · <code>{job.job_id}</code>\n\n{progress.format()}",
+                    chat_id=chat_id, message_id=message_id)
+
+        progress = job.progress()
+        while True:
+            await broadcaster.broadcast(
+                job.pending(), lambda position: send(job.recipients[position]), label=job.label,
+                on_progress=report, on_result=on_result, progress=progress)
+            # Resumed while the last in-flight sends of a pause drained - carry on
+            if job.status != RUNNING or job.cursor >= job.total:
+                break
+        if job.status == RUNNING:
+            job.status = DONE
+        if job.finished:
+            job.finished_at = datetime.now().isoformat()
+            self._release(job)
+        self.save()
+        await self._notify(job, progress)
+        return progress
+
+    def set_status(self, job_id: str, status: str) -> Optional[BroadcastJob]:
+        """Pause, resume or cancel a job - a paused job's task stops after its in-flight sends"""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished or job.status == status:
+            return job
+        job.status = status
+        if status == CANCELLED:
+            job.finished_at = datetime.now().isoformat()
+            task = self._tasks.get(job_id)
+            if task is None or task.done():
+                # No sends in flight - a running task releases the list itself when it stops
+                self._release(job)
+        self.save()
+        if status == RUNNING:
+            self.start(job)
+        return job
+
+    # ========== CROSS-WORKER CONTROL ==========
+    def _forwarded_path(self, job_id: str) -> str:
+        return f"{self.path}.{job_id}.new"
+
+    def _write_forwarded(self, job_id: str, record: Dict[str, Any]) -> None:
+        persistence.atomic_write(self._forwarded_path(job_id),
+                                 lambda f: json.dump(record, f, ensure_ascii=False, default=records.json_default))
+
+    def adopt_forwarded(self) -> List[BroadcastJob]:
+        """Take over jobs other workers created (SHARED_STATE) - the primary runs and saves them"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        prefix = f"{os.path.basename(self.path)}."
+        adopted = []
+        for name in sorted(os.listdir(directory)):
+            if not (name.startswith(prefix) and name.endswith(".new")):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    job = BroadcastJob.from_dict(json.load(f))
+            except (OSError, KeyError, TypeError, ValueError) as e:
+                print(f"⚠️ Skipping unreadable forwarded broadcast job {name}: {e}")
+                continue
+            if job.job_id not in self.jobs:
+                self.jobs[job.job_id] = job
+                adopted.append(job)
+                print(f"📨 Broadcast job {job.job_id} handed over by another worker")
+            os.remove(path)
+        if adopted:
+            self.save()
+        return adopted
+
+    def request(self, job_id: str, status: str) -> None:
+        """Ask the worker running the jobs to change a job's status (SHARED_STATE)"""
+        try:
+            with open(CONTROL_FILE, 'r', encoding='utf-8') as f:
+                requests = json.load(f)
+        except (OSError, ValueError):
+            requests = {}
+        requests[job_id] = status
+        persistence.atomic_write(CONTROL_FILE, lambda f: json.dump(requests, f))
+
+    def poll_control(self) -> None:
+        """Apply status requests written by other workers since the last poll"""
+        try:
+            mtime = os.path.getmtime(CONTROL_FILE)
+        except OSError:
+            return
+        if mtime == self._control_mtime:
+            return
+        self._control_mtime = mtime
+        try:
+            with open(CONTROL_FILE, 'r', encoding='utf-8') as f:
+                requests = json.load(f)
+            os.remove(CONTROL_FILE)
+        except (OSError, ValueError):
+            return
+        for job_id, status in requests.items():
+            print(f"📨 Broadcast job {job_id}: {status} requested by another worker")
+            self.set_status(job_id, status)
+
+    async def control_loop(self, interval: float = CHECKPOINT_EVERY_SECONDS) -> None:
+        """Poll for requests while idle too, so paused jobs can be resumed from any worker"""
+        while True:
+            await asyncio.sleep(interval)
+            for job in self.adopt_forwarded():
+                self.start(job)
+            self.poll_control()
+
+    # ========== REPORTS ==========
+    async def _notify(self, job: BroadcastJob, progress: broadcaster.BroadcastProgress) -> None:
+        if job.status == PAUSED:
+            title = "⏸️ Broadcast Paused"
+        elif job.status == CANCELLED:
+            title = "🛑 Broadcast Cancelled"
+        else:
+            title = "✅ Broadcast Complete!"
+        text = f"""
+{title}
+
+📢 <b>{job.label}</b> · <code>{job.job_id}</code>
+
+📊 <b>Results:</b>
+• ✅ Successfully sent: {job.sent}
+• ❌ Failed: {job.failed}
+{progress.failure_lines()}• 👥 Recipients: {job.total}
+• ⚡ Speed: {progress.throughput:.1f} msg/s in {broadcaster.format_duration(progress.elapsed)}
+"""
+        if job.status == PAUSED:
+            text += f"\n▶️ Resume with <code>/broadcasts resume {job.job_id}</code>"
+        try:
+            await self.bot.send_message(chat_id=job.created_by, text=text)
+        except Exception as e:
+            print(f"⚠️ Could not report {job.job_id} to admin {job.created_by}: {e}")
+
+    def describe(self, job: BroadcastJob) -> str:
+        done = job.sent + job.failed
+        return (f"{STATUS_LABELS[job.status]} <code>{job.job_id}</code> - {job.label}\n"
+                f"   📊 {done}/{job.total} · ✅ {job.sent} · ❌ {job.failed} · "
+                f"📅 {job.created_at[:16].replace('T', ' ')}")
+
+
+def _sender(job: BroadcastJob, bot, build_offer_message: Callable[[Dict[str, Any]], Tuple[str, Any]]):
+    """send(user_id) coroutine factory for the job's content"""
+    if job.kind == KIND_OFFER:
+        offer_text, order_button = build_offer_message(job.content)
+        return lambda user_id: bot.send_message(chat_id=user_id, text=offer_text, reply_markup=order_button,
+                                                parse_mode="HTML")
+    text = job.content.get('text', '')
+    return lambda user_id: bot.send_message(chat_id=user_id, text=text, parse_mode="HTML")
+
+
+# Shared job store, loaded in on_startup
+jobs = JobStore()
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Broadcast Engine
+One token bucket shared by every broadcast (Telegram allows ~30 messages/second per bot)
+and a small worker pool, with sent/failed counts, throughput and ETA for progress reports.
+Sends honour RetryAfter by pausing the bucket, retry transient errors with jittered
+backoff, and classify blocked / chat-not-found recipients as permanent failures
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+)
+
+# Messages per second across all broadcasts - kept under Telegram's ~30/s so replies still get through
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+# Sends in flight at once - enough to hide request latency at the bucket rate
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+# Seconds between progress callbacks
+PROGRESS_EVERY_SECONDS = float(os.getenv("BROADCAST_PROGRESS_SECONDS", "10"))
+# Tries per recipient for network/server errors, and the first backoff (doubled per try)
+SEND_ATTEMPTS = int(os.getenv("BROADCAST_SEND_ATTEMPTS", "4"))
+RETRY_BASE_SECONDS = 1.0
+# Flood waits per recipient before giving up on it (each one pauses every sender)
+MAX_FLOOD_WAITS = 5
+
+# Send outcomes
+DELIVERED = "delivered"
+# Permanent: bot blocked / user deactivated, chat never started or deleted, other rejected request
+BLOCKED = "blocked"
+CHAT_NOT_FOUND = "chat_not_found"
+FAILED = "failed"
+# Transient errors (or flood waits) on every attempt
+GAVE_UP = "gave_up"
+PERMANENT_OUTCOMES = (BLOCKED, CHAT_NOT_FOUND, FAILED)
+# The user can't be messaged until they come back - later broadcasts skip them
+UNREACHABLE_OUTCOMES = (BLOCKED, CHAT_NOT_FOUND)
+OUTCOME_LABELS = {
+    BLOCKED: "🚫 Blocked",
+    CHAT_NOT_FOUND: "👻 Chat not found",
+    FAILED: "❌ Rejected",
+    GAVE_UP: "🔁 Gave up after retries",
+}
+
+
+class TokenBucket:
+    """rate tokens per second, bursting up to capacity - acquire() waits for a token"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        # No burst by default - a full second's burst on top of the rate would overshoot Telegram's limit
+        self.capacity = capacity if capacity is not None else 1.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        # Nobody sends before this (monotonic) time - set by a flood wait
+        self.paused_until = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + max(now - self._updated, 0.0) * self.rate)
+        self._updated = max(now, self._updated)
+
+    async def acquire(self) -> None:
+        """Take one token, sleeping until it is earned - callers queue up by going into debt"""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+        # A pause may have started while we waited for the token
+        while time.monotonic() < self.paused_until:
+            await asyncio.sleep(self.paused_until - time.monotonic())
+
+    def pause(self, seconds: float) -> None:
+        """Stop every sender for seconds (Telegram's RetryAfter) and restart from an empty bucket"""
+        until = time.monotonic() + seconds
+        if until > self.paused_until:
+            self.paused_until = until
+            self.tokens = min(self.tokens, 0.0)
+            # No tokens are earned while paused
+            self._updated = until
+
+
+# Shared by /broadcast, the admin panel broadcast and offer sends
+bucket = TokenBucket(BROADCAST_RATE)
+
+
+def _jitter(seconds: float) -> float:
+    """Spread retries so paused senders don't all fire in the same instant"""
+    return seconds + random.uniform(0, max(seconds * 0.25, 0.5))
+
+
+async def deliver(send: Callable[[], Awaitable[Any]], recipient: Any = None, label: str = "send") -> str:
+    """Make one outbound call through the shared bucket and return its outcome.
+
+    RetryAfter pauses the bucket for the advised time and retries, network/server errors
+    retry with exponential backoff, and blocked/not-found/bad requests fail at once.
+    """
+    attempts = flood_waits = 0
+    while True:
+        await bucket.acquire()
+        try:
+            result = await send()
+            return FAILED if result is False else DELIVERED
+        except TelegramRetryAfter as e:
+            flood_waits += 1
+            if flood_waits > MAX_FLOOD_WAITS:
+                print(f"❌ {label}: giving up on {recipient} after {MAX_FLOOD_WAITS} flood waits")
+                return GAVE_UP
+            wait = _jitter(e.retry_after)
+            print(f"⏸️ {label}: flood control - pausing all sends for {wait:.1f}s")
+            bucket.pause(wait)
+        except TelegramForbiddenError:
+            return BLOCKED
+        except TelegramBadRequest as e:
+            if "chat not found" in str(e).lower():
+                return CHAT_NOT_FOUND
+            print(f"❌ {label}: {recipient} rejected: {e}")
+            return FAILED
+        except (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError) as e:
+            attempts += 1
+            if attempts >= SEND_ATTEMPTS:
+                print(f"❌ {label}: {recipient} failed {attempts} times: {e}")
+                return GAVE_UP
+            await asyncio.sleep(_jitter(RETRY_BASE_SECONDS * 2 ** (attempts - 1)))
+        except Exception as e:
+            print(f"❌ {label}: send to {recipient} failed: {e}")
+            return FAILED
+
+
+def estimate_seconds(recipients: int) -> float:
+    return recipients / BROADCAST_RATE
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "calculating..."
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
+class BroadcastProgress:
+    """Counters for one broadcast run"""
+
+    def __init__(self, total: int, label: str = "broadcast"):
+        self.total = total
+        self.label = label
+        self.sent = 0
+        self.failed = 0
+        # Failed sends by outcome (BLOCKED, CHAT_NOT_FOUND, FAILED, GAVE_UP)
+        self.failures: Counter = Counter()
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        # Sends counted before this run (a resumed job) - left out of the throughput
+        self.baseline = 0
+
+    def record(self, outcome: str) -> None:
+        if outcome == DELIVERED:
+            self.sent += 1
+        else:
+            self.failed += 1
+            self.failures[outcome] += 1
+
+    @property
+    def permanent_failures(self) -> int:
+        return sum(self.failures[outcome] for outcome in PERMANENT_OUTCOMES)
+
+    def failure_lines(self) -> str:
+        """One line per failure kind, for completion reports"""
+        return "".join(f"• {OUTCOME_LABELS[outcome]}: {count}\n"
+                       for outcome, count in self.failures.items() if count)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Messages per second so far"""
+        return (self.done - self.baseline) / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left at the current throughput (None before the first send)"""
+        if self.done >= self.total:
+            return 0.0
+        if self.done <= self.baseline:
+            return None
+        return (self.total - self.done) / self.throughput
+
+    def format(self) -> str:
+        """Progress lines for admin status messages"""
+        percent = self.done / self.total * 100 if self.total else 100.0
+        return (f"📊 <b>Progress:</b> {self.done}/{self.total} ({percent:.1f}%)\n"
+                f"✅ <b>Sent:</b> {self.sent} | ❌ <b>Failed:</b> {self.failed}\n"
+                f"⚡ <b>Speed:</b> {self.throughput:.1f} msg/s | ⏱️ <b>Elapsed:</b> {format_duration(self.elapsed)}\n"
+                f"⏳ <b>ETA:</b> {format_duration(self.eta)}")
+
+
+async def broadcast(recipients: Iterable[Any], send: Callable[[Any], Awaitable[Any]], total: Optional[int] = None,
+                    label: str = "broadcast",
+                    on_progress: Optional[Callable[[BroadcastProgress], Awaitable[None]]] = None,
+                    workers: int = BROADCAST_WORKERS,
+                    on_result: Optional[Callable[[Any, str], None]] = None,
+                    progress: Optional[BroadcastProgress] = None) -> BroadcastProgress:
+    """deliver() send(recipient) for every recipient through the shared bucket.
+
+    send may return False or raise to count a failure; on_result(recipient, outcome) is
+    called (or awaited, if async) after each send and on_progress is awaited every
+    PROGRESS_EVERY_SECONDS.
+    Pass progress to continue counting into an existing one (resumed jobs).
+    """
+    if total is None and progress is None:
+        recipients = list(recipients)
+        total = len(recipients)
+    if progress is None:
+        progress = BroadcastProgress(total, label)
+    total = progress.total - progress.done
+    pending = iter(recipients)
+
+    async def worker() -> None:
+        # Workers share one iterator - next() never yields, so no recipient is taken twice
+        for recipient in pending:
+            outcome = await deliver(lambda: send(recipient), recipient, label)
+            progress.record(outcome)
+            if on_result is not None:
+                result = on_result(recipient, outcome)
+                if asyncio.iscoroutine(result):
+                    await result
+
+    async def reporter() -> None:
+        while True:
+            await asyncio.sleep(PROGRESS_EVERY_SECONDS)
+            print(f"📢 {label}: {progress.done}/{progress.total} "
+                  f"({progress.throughput:.1f} msg/s, ETA {format_duration(progress.eta)})")
+            if on_progress is not None:
+                try:
+                    await on_progress(progress)
+                except Exception as e:
+                    print(f"⚠️ {label}: progress update failed: {e}")
+
+    print(f"📢 {label}: sending to {total} recipients at {BROADCAST_RATE:g} msg/s with {workers} workers")
+    reporting = asyncio.create_task(reporter())
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(workers, total)))))
+    finally:
+        reporting.cancel()
+        progress.finished_at = time.monotonic()
+    print(f"✅ {label}: {progress.sent} sent, {progress.failed} failed "
+          f"({progress.permanent_failures} permanent) in {format_duration(progress.elapsed)} "
+          f"({progress.throughput:.1f} msg/s)")
+    return progress
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Ratings & Feedback Store
+ratings.json / feedback.json held in memory with a per-order rating index and running
+average, persisted by appending one JSON line per new record
+"""
+
+import asyncio
+import json
+import os
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+import persistence
+import records
+
+# Rewrite the list file and start a new log once this many records have been appended
+COMPACT_EVERY_RECORDS = int(os.getenv("FEEDBACK_COMPACT_RECORDS", "1000"))
+# First line of every log after a compaction - {"_log_generation": n}
+GENERATION_KEY = "_log_generation"
+
+
+class ListStore:
+    """A JSON list file plus a JSON-lines log of the records appended since it was written.
+
+    The list file records which log generation and byte offset it folds, so replay starts
+    after that point whether or not the log was rotated before a crash"""
+
+    def __init__(self, list_path: str, log_path: str):
+        self.list_path = list_path
+        self.log_path = log_path
+        self.records: List[Dict[str, Any]] = []
+        self._log_file = None
+        self.entries_since_compaction = 0
+        # Shared-state workers append to the same log - read theirs, only the primary compacts
+        self.shared = False
+        self.primary = True
+        self._read_offset = 0
+        # Lines we wrote that the next refresh() will read back
+        self._own_lines: Set[str] = set()
+        # Generation written at the top of the current log, and the newest one a list file folded
+        self._log_generation = 0
+        self._folded_generation = 0
+        self._compaction: Optional[asyncio.Future] = None
+        self._reset_index()
+
+    # ========== STARTUP ==========
+    def load(self, shared: bool = False, primary: bool = True) -> None:
+        """Load the list file and replay the log past the part it already folds"""
+        self.shared = shared
+        self.primary = primary
+        self.records = []
+        self._reset_index()
+        try:
+            loaded = persistence.load_json_recovering(self.list_path, [])
+        except Exception as e:
+            print(f"❌ Error loading {self.list_path}: {e}")
+            loaded = []
+        folded_offset = 0
+        if isinstance(loaded, dict):
+            self._folded_generation = int(loaded.get('log_generation', 0))
+            folded_offset = int(loaded.get('log_offset', 0))
+            loaded = loaded.get('records', [])
+        for record in loaded if isinstance(loaded, list) else []:
+            self._add(record)
+        self._log_generation = self._read_generation()
+        # A log from a later generation was rotated after the list was written - none of it is folded
+        self._read_offset = folded_offset if self._log_generation == self._folded_generation else 0
+        replayed = self._read_log()
+        self.entries_since_compaction = replayed
+        print(f"✅ {self.list_path} loaded: {len(self.records)} records ({replayed} from {self.log_path})")
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self.log_path, 'rb') as f:
+                header = json.loads(f.readline() or b"{}")
+        except (OSError, ValueError):
+            return 0
+        return int(header.get(GENERATION_KEY, 0)) if isinstance(header, dict) else 0
+
+    def _read_log(self) -> int:
+        """Apply complete log lines past the read offset, return how many were new"""
+        if not os.path.exists(self.log_path) or os.path.getsize(self.log_path) <= self._read_offset:
+            return 0
+        applied = 0
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._read_offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    # Another worker is mid-append - pick the line up next time
+                    break
+                self._read_offset += len(raw)
+                line = raw.decode('utf-8').strip()
+                if not line:
+                    continue
+                if line in self._own_lines:
+                    self._own_lines.discard(line)
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(f"⚠️ Skipping corrupt entry in {self.log_path}")
+                    continue
+                if isinstance(record, dict) and GENERATION_KEY in record:
+                    continue
+                self._add(record)
+                applied += 1
+        self.entries_since_compaction += applied
+        return applied
+
+    def refresh(self) -> None:
+        """Pick up records other workers appended (shared-state mode only)"""
+        if self.shared:
+            self._read_log()
+            self._maybe_compact()
+
+    # ========== WRITES ==========
+    def append(self, record: Dict[str, Any]) -> None:
+        """Add one record in memory and append it to the log - O(1)"""
+        line = json.dumps(record, ensure_ascii=False, default=records.json_default)
+        if self._log_file is None:
+            self._log_file = open(self.log_path, 'a', encoding='utf-8')
+        self._log_file.write(line + "\n")
+        self._log_file.flush()
+        if persistence.FSYNC_POLICY == "always":
+            os.fsync(self._log_file.fileno())
+        if self.shared:
+            self._own_lines.add(line)
+        self._add(record)
+        self.entries_since_compaction += 1
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        if (self.entries_since_compaction >= COMPACT_EVERY_RECORDS and self.primary
+                and (self._compaction is None or self._compaction.done())):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.compact()
+                return
+            self._compaction = loop.create_task(self.compact_async())
+
+    def _fold_point(self) -> Optional[Tuple[List[Dict[str, Any]], int, int]]:
+        """(records, log offset, records appended since the last compaction) the list file can fold now"""
+        if self.shared:
+            # Our records match the log up to the read offset once our own lines are read back
+            self._read_log()
+            if self._own_lines:
+                return None
+            offset = self._read_offset
+        else:
+            # Every append is flushed, so the file size covers all of self.records
+            offset = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        # Records are never changed after they are appended - a shallow copy is a stable snapshot
+        return list(self.records), offset, self.entries_since_compaction
+
+    def _write_list(self, snapshot: List[Dict[str, Any]], offset: int) -> None:
+        """Write the list file (I/O thread) - it folds the current log up to offset"""
+        persistence.atomic_write(
+            self.list_path,
+            lambda f: json.dump({'log_generation': self._log_generation, 'log_offset': offset, 'records': snapshot},
+                                f, indent=2, ensure_ascii=False, default=records.json_default),
+            generations=persistence.GENERATIONS,
+        )
+
+    def _rotate_log(self, offset: int) -> None:
+        """Start the next log generation holding only the lines appended past offset"""
+        if self.shared:
+            # Other workers hold the log open - it keeps growing, replay skips the folded part
+            self._folded_generation = self._log_generation
+            return
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+        tail = b""
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                f.seek(offset)
+                tail = f.read()
+        generation = max(self._log_generation, self._folded_generation) + 1
+        header = json.dumps({GENERATION_KEY: generation}).encode('utf-8') + b"\n"
+        persistence.atomic_write(self.log_path, lambda f: f.write(header + tail), binary=True)
+        self._folded_generation = self._log_generation
+        self._log_generation = generation
+        self._read_offset = len(header) + len(tail)
+
+    def _finish(self, fold: Tuple[List[Dict[str, Any]], int, int]) -> None:
+        snapshot, offset, folded = fold
+        self._rotate_log(offset)
+        self.entries_since_compaction -= folded
+        print(f"🗜️ {self.log_path} compacted into {self.list_path} ({len(snapshot)} records)")
+
+    def compact(self) -> None:
+        """Rewrite the list file with every record, then rotate the log - blocking, for shutdown"""
+        fold = self._fold_point()
+        if fold is None:
+            return
+        self._write_list(fold[0], fold[1])
+        self._finish(fold)
+
+    async def compact_async(self) -> None:
+        """compact() with the list file written on the I/O thread"""
+        fold = self._fold_point()
+        if fold is None:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(persistence.io_executor, self._write_list, fold[0], fold[1])
+        except Exception as e:
+            print(f"❌ Error compacting {self.log_path}: {e}")
+            return
+        # Appends made while the list was written land past offset and move into the new log
+        self._finish(fold)
+
+    async def close(self) -> None:
+        if self._compaction is not None and not self._compaction.done():
+            await self._compaction
+        if self.entries_since_compaction and self.primary:
+            self.compact()
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    # ========== INDEX HOOKS ==========
+    def _reset_index(self) -> None:
+        pass
+
+    def _add(self, record: Dict[str, Any]) -> None:
+        self.records.append(record)
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self.records)
+
+
+class RatingStore(ListStore):
+    """Ratings with a unique (order_id, user_id) index and a running sum for the average"""
+
+    def _reset_index(self) -> None:
+        self._rated: Set[Tuple[Any, Any]] = set()
+        self.rating_sum = 0
+        self.rating_count = 0
+
+    def _add(self, record: Dict[str, Any]) -> None:
+        key = (record.get('order_id'), record.get('user_id'))
+        if key in self._rated:
+            print(f"⚠️ Duplicate rating for order {key[0]} by user {key[1]} ignored")
+            return
+        self._rated.add(key)
+        super()._add(record)
+        try:
+            self.rating_sum += record.get('rating', 0) or 0
+        except TypeError:
+            pass
+        self.rating_count += 1
+
+    def has_rated(self, order_id: str, user_id: int) -> bool:
+        self.refresh()
+        return (order_id, user_id) in self._rated
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        """Store a rating unless this user already rated the order"""
+        if self.has_rated(record.get('order_id'), record.get('user_id')):
+            return False
+        self.append(record)
+        return True
+
+    def average(self) -> Optional[float]:
+        self.refresh()
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+
+# Shared stores, loaded in on_startup
+ratings = RatingStore("ratings.json", "ratings.journal")
+feedback = ListStore("feedback.json", "feedback.journal")
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - SQLite FSM Storage
+aiogram FSM storage kept in the shared SQLite database, so every webhook worker
+sees the same conversation state (SHARED_STATE=1)
+"""
+
+import json
+from typing import Dict, Any, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm_state (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}'
+);
+"""
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """FSM state/data rows keyed by bot, chat, user and destiny"""
+
+    def __init__(self):
+        # Bound in on_startup once the SQLite repository exists
+        self.repository = None
+
+    def bind(self, repository) -> None:
+        self.repository = repository
+        repository.run_sync(lambda conn: conn.executescript(SCHEMA))
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        parts = [key.bot_id, key.chat_id, key.user_id,
+                 getattr(key, "thread_id", None), getattr(key, "business_connection_id", None), key.destiny]
+        return ":".join("" if part is None else str(part) for part in parts)
+
+    @staticmethod
+    def _set_state(conn, key: str, state: Optional[str]) -> None:
+        with conn:
+            conn.execute("INSERT INTO fsm_state (key, state) VALUES (?, ?) "
+                         "ON CONFLICT(key) DO UPDATE SET state = excluded.state", (key, state))
+
+    @staticmethod
+    def _set_data(conn, key: str, data: str) -> None:
+        with conn:
+            conn.execute("INSERT INTO fsm_state (key, data) VALUES (?, ?) "
+                         "ON CONFLICT(key) DO UPDATE SET data = excluded.data", (key, data))
+
+    @staticmethod
+    def _get(conn, key: str, column: str) -> Optional[str]:
+        row = conn.execute(f"SELECT {column} FROM fsm_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self.repository.run(self._set_state, self._key(key), value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.repository.run(self._get, self._key(key), "state")
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.repository.run(self._set_data, self._key(key), json.dumps(data, ensure_ascii=False, default=str))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        data = await self.repository.run(self._get, self._key(key), "data")
+        return json.loads(data) if data else {}
+
+    async def close(self) -> None:
+        # The connection belongs to the repository, closed in main()
+        pass
@@ -11,7 +11,8 @@ import random
 import string
 import time
 import html
-from datetime import datetime
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 import asyncio
 
@@ -33,6 +34,25 @@ import payment_system
 import services
 import account_creation
 import text_input_handler
+import persistence
+import records
+import user_index
+import user_search
+import user_directory
+import referrals
+import broadcaster
+import broadcast_jobs
+import segments
+import order_index
+import stats_aggregator
+import feedback_store
+import order_journal
+import snapshot_format
+from repository import Repository, MemoryRepository
+from sqlite_store import SQLiteRepository
+from user_cache import LazyUserCache, LazyOrderCache, iter_records, count_records
+from shared_state import SharedState, SessionStateMap
+from fsm_storage import SQLiteFSMStorage
 
 from states import OrderStates, CreateOfferStates, AdminSendOfferStates, OfferOrderStates, AdminCreateUserStates, AdminDirectMessageStates, FeedbackStates
 from fsm_handlers import handle_link_input, handle_quantity_input, handle_coupon_input
@@ -61,16 +81,49 @@ WEBHOOK_SECRET = "india_social_panel_secret_2025"
 WEBHOOK_URL = f"{BASE_WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}" if BASE_WEBHOOK_URL else None
 WEBHOOK_MODE = bool(BASE_WEBHOOK_URL)  # True if webhook URL available, False for polling
 
+# Storage backend: "json" (JSON files) or "sqlite" (indexed tables, see sqlite_store.py)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+
+# Orders are persisted through an append-only journal unless ORDER_JOURNAL=0
+ORDER_JOURNAL_ENABLED = os.getenv("ORDER_JOURNAL", "1") != "0"
+
+# With the SQLite backend, load user records on demand into a bounded LRU cache
+# instead of reading every user at startup (LAZY_USER_CACHE=1)
+LAZY_USER_CACHE = os.getenv("LAZY_USER_CACHE", "0") == "1"
+
+# Several worker processes serving the webhook at once: users, orders, user_state/order_temp
+# and FSM state live in the SQLite database and each update runs under a per-user lock
+SHARED_STATE = os.getenv("SHARED_STATE", "0") == "1"
+if SHARED_STATE and STORAGE_BACKEND != "sqlite":
+    print("⚠️ SHARED_STATE=1 needs STORAGE_BACKEND=sqlite - running with process-local state")
+    SHARED_STATE = False
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))  # 0 = primary, sets commands/webhook
+
 # Server settings
 WEB_SERVER_HOST = "0.0.0.0"
 WEB_SERVER_PORT = int(os.getenv("PORT", 8080))
 
 # Bot initialization with FSM storage
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-storage = MemoryStorage()
+storage = SQLiteFSMStorage() if SHARED_STATE else MemoryStorage()
 dp = Dispatcher(storage=storage)
 START_TIME = time.time()
 
+@dp.update.outer_middleware()
+async def preload_user_middleware(handler, event, data):
+    """Warm the lazy user cache before handlers touch users_data synchronously"""
+    event_user = data.get("event_from_user")
+    if event_user and shared_state:
+        # Other workers may serve this user too - run the update under their lock
+        async with shared_state.session(event_user.id):
+            stamp_last_activity(event_user.id)
+            return await handler(event, data)
+    if event_user:
+        await preload_user(event_user.id)
+        stamp_last_activity(event_user.id)
+    return await handler(event, data)
+
 # Webhook handler setup
 webhook_requests_handler = SimpleRequestHandler(
     dispatcher=dp,
@@ -96,25 +149,41 @@ user_state: Dict[int, Dict[str, Any]] = {}  # For tracking user input states
 order_temp: Dict[int, Dict[str, Any]] = {}  # For temporary order data
 admin_users = {ADMIN_USER_ID}  # Use consistent admin user ID
 
+# Query backend - indexes over the in-memory dicts, or the SQLite tables once users are loaded
+# lazily (LAZY_USER_CACHE / SHARED_STATE); chosen once in on_startup
+repository: Repository = MemoryRepository(users_data, orders_data, user_index.index, order_index.index,
+                                          user_directory.directory, user_search.index, referrals.graph)
+database: Optional[SQLiteRepository] = None  # Storage when STORAGE_BACKEND=sqlite
+offers_cache: Optional[list] = None  # Offers held in memory when the SQLite backend owns them
+shared_state: Optional[SharedState] = None  # Set in on_startup when SHARED_STATE=1
+
 # Handler registration flag - not needed
 # _handlers_registered = False
 
 # ========== PERSISTENT STORAGE FUNCTIONS ==========
-def save_data_to_json(data: Dict, filename: str) -> None:
-    """Save data dictionary to JSON file"""
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False, default=str)
-        print(f"✅ Data saved to {filename}")
-    except Exception as e:
-        print(f"❌ Error saving data to {filename}: {e}")
+def save_data_to_json(data: Dict, filename: str, key: Any = None) -> None:
+    """Queue data dictionary for a write-behind save to JSON file (key = touched record)"""
+    persistence.store.mark_dirty(filename, data, key)
+
+async def save_data_to_json_async(data: Dict, filename: str, key: Any = None) -> None:
+    """Save data to JSON file and wait until it is on disk (written in the I/O thread pool)"""
+    persistence.store.mark_dirty(filename, data, key)
+    await persistence.store.flush()
+
+async def flush_persistent_data() -> None:
+    """Write all queued data to disk immediately (payment paths, shutdown)"""
+    await persistence.store.flush()
 
 def load_data_from_json(filename: str) -> Dict:
     """Load data from JSON file, return empty dict if file doesn't exist"""
+    # Data queued by the write-behind store is newer than the file on disk
+    pending = persistence.store.pending_data(filename)
+    if pending is not None:
+        return pending
     try:
-        if os.path.exists(filename):
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+        # Falls back to the newest intact generation if the file was torn by a crash
+        data = persistence.load_json_recovering(filename, None)
+        if data is not None:
             print(f"✅ Data loaded from {filename}")
             return data
         else:
@@ -126,10 +195,13 @@ def load_data_from_json(filename: str) -> Dict:
 
 def load_list_from_json(filename: str) -> list:
     """Load list data from JSON file, return empty list if file doesn't exist"""
+    # Data queued by the write-behind store is newer than the file on disk
+    pending = persistence.store.pending_data(filename)
+    if isinstance(pending, list):
+        return pending
     try:
-        if os.path.exists(filename):
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+        data = persistence.load_json_recovering(filename, None)
+        if data is not None:
             print(f"✅ List data loaded from {filename}")
             # Ensure it's a list even if file contains something else
             return data if isinstance(data, list) else []
@@ -140,12 +212,37 @@ def load_list_from_json(filename: str) -> list:
         print(f"❌ Error loading list data from {filename}: {e}")
         return []
 
+async def load_data_from_json_async(filename: str) -> Dict:
+    """Awaitable load_data_from_json - json.load runs in the I/O thread pool"""
+    try:
+        data = await persistence.read_json_async(filename, None)
+        if data is None:
+            print(f"📄 File {filename} not found, starting with empty data")
+            return {}
+        return data
+    except Exception as e:
+        print(f"❌ Error loading data from {filename}: {e}")
+        return {}
+
+async def load_list_from_json_async(filename: str) -> list:
+    """Awaitable load_list_from_json - json.load runs in the I/O thread pool"""
+    try:
+        data = await persistence.read_json_async(filename, [])
+        # Ensure it's a list even if file contains something else
+        return data if isinstance(data, list) else []
+    except Exception as e:
+        print(f"❌ Error loading list data from {filename}: {e}")
+        return []
+
 def load_users_data_from_json() -> Dict:
+    """Load users data, from the binary snapshot when it is newer than users.json"""
+    return snapshot_format.load_with_snapshot("users.json", _load_users_json_file)
+
+def _load_users_json_file() -> Dict:
     """Load users data from JSON file with string-to-int key conversion"""
     try:
-        if os.path.exists("users.json"):
-            with open("users.json", 'r', encoding='utf-8') as f:
-                data = json.load(f)
+        data = persistence.load_json_recovering("users.json", None)
+        if data is not None:
             # Convert string keys to integers for memory consistency
             users_data_with_int_keys = {}
             for str_key, value in data.items():
@@ -180,8 +277,8 @@ def init_user(user_id: int, username: Optional[str] = None, first_name: Optional
             "join_date": datetime.now().isoformat(),
             "account_created": False
         }
-        # Save minimal record immediately with key conversion
-        save_users_data()
+        # Queue minimal record for saving
+        save_users_data(user_id)
         print(f"✅ Minimal user record created for {user_id} - full profile will be completed during account creation")
 
     # Initialize user state for input tracking
@@ -191,15 +288,115 @@ def init_user(user_id: int, username: Optional[str] = None, first_name: Optional
             "data": {}
         }
 
-def save_users_data():
-    """Save users_data to JSON with string key conversion"""
-    # Convert integer keys to strings for JSON compatibility
-    users_data_with_str_keys = {str(k): v for k, v in users_data.items()}
-    save_data_to_json(users_data_with_str_keys, "users.json")
-
-def generate_referral_code() -> str:
-    """Generate unique referral code"""
-    return f"ISP{''.join(random.choices(string.ascii_uppercase + string.digits, k=6))}"
+def save_order(order_id: str) -> None:
+    """Persist one order create/status change"""
+    repository.index_order(order_id)
+    if stats_aggregator.aggregator.live:
+        stats_aggregator.aggregator.update_order(order_id, orders_data.get(order_id))
+    if database is not None:
+        database.save_orders({order_id: orders_data.get(order_id)})
+    elif ORDER_JOURNAL_ENABLED:
+        # Append-only: one JSON line per change, folded into orders.json by the compactor
+        order_journal.journal.append(order_id, orders_data.get(order_id))
+    else:
+        save_data_to_json(orders_data, "orders.json", order_id)
+
+def save_users_data(user_id: Optional[int] = None):
+    """Queue users_data for saving (json converts the integer keys to strings)"""
+    save_data_to_json(users_data, "users.json", user_id)
+
+# ========== USER LOOKUP INDEXES ==========
+def _reindex_saved_user(data: Dict, user_id: Any) -> None:
+    """Save listener - keep the repository's phone/email, search, directory and referral indexes in step"""
+    if data is users_data:
+        repository.index_user(user_id)
+
+def _count_saved_user(data: Dict, user_id: Any) -> None:
+    """Save listener - move the user's contribution in the admin statistics"""
+    if data is users_data and stats_aggregator.aggregator.live:
+        stats_aggregator.aggregator.update_user(user_id, users_data.get(user_id))
+
+def reindex_user(user_id: int, claim: bool = False) -> None:
+    """Re-index one user now; claim=True moves a phone/email over from another account"""
+    repository.index_user(user_id, claim=claim)
+
+async def find_user_id_by(phone_number: Optional[str] = None, email: Optional[str] = None) -> Optional[int]:
+    """Account owning a phone number or email (normalized, no scan of users_data)"""
+    if phone_number:
+        return await repository.find_user_id(phone_number=phone_number)
+    return await repository.find_user_id(email=email)
+
+async def ensure_contact_available(message: Message, user_id: int, phone_number: Optional[str] = None,
+                                   email: Optional[str] = None) -> bool:
+    """Reject a phone number or email that already belongs to another account"""
+    if phone_number:
+        owner = await find_user_id_by(phone_number=phone_number)
+        if owner is not None and owner != user_id:
+            await message.answer(
+                "⚠️ <b>Phone Number Already Registered!</b>\n\n"
+                "📱 <b>This number is linked to another account.</b>\n"
+                "💡 <b>Login to that account, or enter a different number.</b>"
+            )
+            return False
+    if email:
+        owner = await find_user_id_by(email=email)
+        if owner is not None and owner != user_id:
+            await message.answer(
+                "⚠️ <b>Email Already Registered!</b>\n\n"
+                "📧 <b>This email is linked to another account.</b>\n"
+                "💡 <b>Please enter a different email address.</b>"
+            )
+            return False
+    return True
+
+async def preload_user(user_id: int) -> None:
+    """Fetch a user into the lazy cache off the event loop (no-op for plain dicts)"""
+    preload = getattr(users_data, "preload", None)
+    if preload:
+        await preload(user_id)
+
+# last_activity is rewritten at most this often per user (feeds the "active" user list sort and segments)
+LAST_ACTIVITY_STAMP_MINUTES = float(os.getenv("LAST_ACTIVITY_STAMP_MINUTES", "10"))
+
+def stamp_last_activity(user_id: int) -> None:
+    """Record that a registered user just sent an update - throttled so busy users don't save every message"""
+    user_data = users_data.get(user_id)
+    if not user_data:
+        return
+    now = datetime.now()
+    if (user_data.get('last_activity') or '') >= (now - timedelta(minutes=LAST_ACTIVITY_STAMP_MINUTES)).isoformat():
+        return
+    user_data['last_activity'] = now.isoformat()
+    save_users_data(user_id)
+
+@asynccontextmanager
+async def customer_session(customer_id: Optional[int], *order_ids: str):
+    """Hold a customer's shared-state lock while an admin handler changes their record or orders"""
+    if customer_id is None:
+        # Legacy buttons carry no customer ID - lock the order's owner instead
+        customer_id = next((orders_data[order_id].get('user_id') for order_id in order_ids
+                            if order_id in orders_data), None)
+    if not shared_state or customer_id is None:
+        yield
+        return
+    async with shared_state.session(int(customer_id), order_ids):
+        yield
+
+async def generate_referral_code() -> str:
+    """Generate unique referral code - checked against the referral graph or the indexed referral_code column"""
+    while True:
+        code = referrals.random_code()
+        if await repository.find_user_id(referral_code=code) is None:
+            return code
+
+async def find_referrer(code: str) -> Optional[int]:
+    """Owner of a referral code - the referral graph, or the indexed referral_code column"""
+    if not referrals.normalize_code(code):
+        return None
+    return await repository.find_user_id(referral_code=code)
+
+async def referral_stats(user_id: int) -> Dict[str, Any]:
+    return await repository.referral_stats(user_id)
 
 def generate_api_key() -> str:
     """Generate API key for user"""
@@ -788,10 +985,22 @@ async def cmd_admin(message: Message):
    📢 Send message to all registered users
    💡 Example: /broadcast Hello everyone!
 
+🔹 <b>/segment &lt;filter&gt;</b>
+   🎯 Preview an audience - /broadcast [filter] message sends to it
+   💡 Example: /segment total_spent&gt;500 and platform:instagram and joined&lt;30d
+
+🔹 <b>/broadcasts [pause|resume|cancel &lt;JOB_ID&gt;]</b>
+   📋 Running and recent broadcast jobs - resumed after restarts
+   💡 Example: /broadcasts pause B18f3a2c4d10
+
 🔹 <b>/viewuser &lt;USER_ID&gt;</b>
    👤 View specific user profile details
    💡 Example: /viewuser 123456789
 
+🔹 <b>/finduser &lt;prefix&gt;</b>
+   🔍 Find users by name, username or ID prefix
+   💡 Example: /finduser rahul
+
 🔹 <b>/sendtouser &lt;USER_ID&gt; &lt;message&gt;</b>
    💬 Send direct message to specific user
    💡 Example: /sendtouser 123456789 Your order is ready
@@ -812,6 +1021,14 @@ async def cmd_admin(message: Message):
    📊 View comprehensive bot statistics
    💡 Example: /static
 
+🔹 <b>/report [days]</b>
+   📈 Orders, completion and revenue by day, platform and service
+   💡 Example: /report 30
+
+🔹 <b>/rebuildstats</b>
+   🔄 Recount statistics from scratch and report drift
+   💡 Example: /rebuildstats
+
 🔹 <b>/adminmenu</b>
    🎛️ Open admin panel interface
    💡 Example: /adminmenu
@@ -823,6 +1040,24 @@ async def cmd_admin(message: Message):
 
     await message.answer(text)
 
+async def admin_user_statistics(day) -> Dict[str, Any]:
+    """User totals for the admin screens - O(1) from the aggregator when it is live"""
+    if stats_aggregator.aggregator.live:
+        return stats_aggregator.aggregator.user_statistics(day)
+    return await repository.user_statistics(day)
+
+async def admin_order_statistics(day) -> Dict[str, Any]:
+    """Order totals for the admin screens - O(1) from the aggregator when it is live"""
+    if stats_aggregator.aggregator.live:
+        return stats_aggregator.aggregator.order_statistics(day)
+    return await repository.order_statistics(day)
+
+async def admin_order_rollup(start, end) -> Dict[str, Any]:
+    """Per-day/platform/service order buckets - summed from the aggregator's daily rollups when live"""
+    if stats_aggregator.aggregator.live:
+        return stats_aggregator.aggregator.order_rollup(start, end)
+    return await repository.order_rollup(start, end)
+
 @dp.message(Command("static"))
 async def cmd_static(message: Message):
     """Handle /static command - show comprehensive bot statistics (admin only)"""
@@ -847,60 +1082,25 @@ async def cmd_static(message: Message):
     # Calculate statistics
     current_time = datetime.now()
     
-    # User Statistics
-    total_users = len(users_data)
-    active_users = len([u for u in users_data.values() if u.get('orders_count', 0) > 0])
-    new_users_today = 0
-    total_balance = sum(user.get('balance', 0.0) for user in users_data.values())
-    total_spent = sum(user.get('total_spent', 0.0) for user in users_data.values())
-    
-    # Calculate new users today
-    try:
-        for user_data in users_data.values():
-            join_date = user_data.get('join_date', '')
-            if join_date:
-                join_dt = datetime.fromisoformat(join_date.replace('Z', '+00:00'))
-                if join_dt.date() == current_time.date():
-                    new_users_today += 1
-    except:
-        pass
+    # User Statistics (running counters, or indexed queries when other workers share the data)
+    user_stats = await admin_user_statistics(current_time.date())
+    total_users = user_stats['total']
+    active_users = user_stats['active']
+    new_users_today = user_stats['new_today']
+    total_balance = user_stats['total_balance']
+    total_spent = user_stats['total_spent']
 
     # Order Statistics
-    total_orders = len(orders_data)
-    completed_orders = len([o for o in orders_data.values() if o.get('status') == 'completed'])
+    order_stats = await admin_order_statistics(current_time.date())
+    total_orders = order_stats['total']
+    completed_orders = order_stats['completed']
     pending_orders = total_orders - completed_orders
-    
-    # Calculate orders today
-    orders_today = 0
-    revenue_today = 0.0
-    try:
-        for order in orders_data.values():
-            created_at = order.get('created_at', '')
-            if created_at:
-                try:
-                    order_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                    if order_dt.date() == current_time.date():
-                        orders_today += 1
-                        if order.get('status') == 'completed':
-                            revenue_today += order.get('total_price', 0.0)
-                except:
-                    pass
-    except:
-        pass
+    orders_today = order_stats['today_count']
+    revenue_today = order_stats['today_revenue']
 
     # Platform Statistics
-    platform_stats = {}
-    platform_revenue = {}
-    
-    for order in orders_data.values():
-        platform = order.get('platform', 'unknown').lower()
-        if platform not in platform_stats:
-            platform_stats[platform] = 0
-            platform_revenue[platform] = 0.0
-        
-        platform_stats[platform] += 1
-        if order.get('status') == 'completed':
-            platform_revenue[platform] += order.get('total_price', 0.0)
+    platform_stats = {platform: count for platform, (count, _) in order_stats['platforms'].items()}
+    platform_revenue = {platform: revenue for platform, (_, revenue) in order_stats['platforms'].items()}
     
     # Sort platforms by order count
     top_platforms = sorted(platform_stats.items(), key=lambda x: x[1], reverse=True)[:5]
@@ -930,23 +1130,11 @@ async def cmd_static(message: Message):
 💿 <b>Disk:</b> Sufficient space available
 """
 
-    # Load additional data files for comprehensive stats
-    try:
-        ratings_data = load_list_from_json("ratings.json")
-        feedback_data = load_list_from_json("feedback.json")
-        total_ratings = len(ratings_data)
-        total_feedback = len(feedback_data)
-        
-        # Calculate average rating
-        if ratings_data:
-            avg_rating = sum(r.get('rating', 0) for r in ratings_data) / len(ratings_data)
-            avg_rating_display = f"{avg_rating:.1f}/5.0 ⭐"
-        else:
-            avg_rating_display = "No ratings yet"
-    except:
-        total_ratings = 0
-        total_feedback = 0
-        avg_rating_display = "No ratings yet"
+    # Ratings/feedback counts and the running average rating
+    total_ratings = len(feedback_store.ratings)
+    total_feedback = len(feedback_store.feedback)
+    avg_rating = feedback_store.ratings.average()
+    avg_rating_display = f"{avg_rating:.1f}/5.0 ⭐" if avg_rating is not None else "No ratings yet"
 
     # Create comprehensive statistics message
     text = f"""
@@ -1039,6 +1227,112 @@ async def cmd_static(message: Message):
     await message.answer(text, parse_mode="HTML")
     print(f"📊 ADMIN STATS: Admin {user.id} viewed bot statistics")
 
+REPORT_RANGES = (7, 30, 90)
+
+def _format_rollup_line(label: str, bucket) -> str:
+    orders, completed, quantity, revenue = bucket
+    ratio = completed / orders * 100 if orders else 0.0
+    return f"{label}: {int(orders):,} orders, ✅ {ratio:.0f}%, 🔢 {int(quantity):,}, ₹{revenue:,.2f}"
+
+@dp.message(Command("report"))
+async def cmd_report(message: Message):
+    """Handle /report [days] command - order/revenue rollups for the last 7, 30 or 90 days (admin only)"""
+    user = message.from_user
+    if not user:
+        return
+
+    if is_message_old(message):
+        mark_user_for_notification(user.id)
+        return
+
+    if not is_admin(user.id):
+        await message.answer("⚠️ Access denied. This command is for administrators only.")
+        return
+
+    args = (message.text or "").split()[1:]
+    try:
+        days = int(args[0]) if args else REPORT_RANGES[0]
+        if not 1 <= days <= 366:
+            raise ValueError
+    except ValueError:
+        await message.answer("❌ Usage: /report [days] - e.g. /report 7, /report 30, /report 90 (1-366 days)")
+        return
+
+    end = datetime.now().date()
+    start = end - timedelta(days=days - 1)
+    rollup = await admin_order_rollup(start, end)
+
+    text = f"""
+📈 <b>Order Report - Last {days} Day{'s' if days != 1 else ''}</b>
+📅 {start.strftime("%d %b %Y")} → {end.strftime("%d %b %Y")}
+
+📊 <b>Total</b>
+{_format_rollup_line("• All orders", rollup['total'])}
+
+📱 <b>By Platform</b>
+"""
+    platforms = sorted(rollup['platforms'].items(), key=lambda item: item[1][3], reverse=True)
+    text += "\n".join(_format_rollup_line(f"• {html.escape(platform.title())}", bucket)
+                      for platform, bucket in platforms) or "• No orders"
+
+    services_top = sorted(rollup['services'].items(), key=lambda item: item[1][3], reverse=True)[:10]
+    text += "\n\n🔧 <b>Top Services (by revenue)</b>\n"
+    text += "\n".join(_format_rollup_line(f"• {html.escape(platform.title())} #{html.escape(service_id)}", bucket)
+                      for (platform, service_id), bucket in services_top) or "• No orders"
+
+    # Newest 14 days day-by-day - longer ranges are summed above
+    text += "\n\n📆 <b>Daily</b>\n"
+    recent_days = [end - timedelta(days=i) for i in range(min(days, 14))]
+    text += "\n".join(_format_rollup_line(f"• {day.strftime('%d %b')}", rollup['days'].get(day, (0, 0, 0, 0.0)))
+                      for day in recent_days)
+
+    quick_ranges = " · ".join(f"/report {n}" for n in REPORT_RANGES if n != days)
+    text += f"\n\n💡 <b>Other ranges:</b> {quick_ranges}"
+    await message.answer(text)
+    print(f"📈 ADMIN REPORT: Admin {user.id} viewed the {days}-day report")
+
+@dp.message(Command("rebuildstats"))
+async def cmd_rebuildstats(message: Message):
+    """Handle /rebuildstats command - recount the admin statistics and report any drift (admin only)"""
+    user = message.from_user
+    if not user:
+        return
+
+    if is_message_old(message):
+        mark_user_for_notification(user.id)
+        return
+
+    if not is_admin(user.id):
+        await message.answer("⚠️ Access denied. This command is for administrators only.")
+        return
+
+    if SHARED_STATE:
+        await message.answer("ℹ️ Shared-state workers read statistics straight from the database - nothing to rebuild.")
+        return
+
+    started = time.perf_counter()
+    fresh = stats_aggregator.StatsAggregator()
+    fresh.rebuild(users_data, orders_data)
+    elapsed = time.perf_counter() - started
+    today = datetime.now().date()
+    drift = stats_aggregator.aggregator.differences(fresh, today) if stats_aggregator.aggregator.live else []
+    stats_aggregator.aggregator = fresh
+
+    if drift:
+        drift_text = "\n".join(f"• <code>{html.escape(line)}</code>" for line in drift[:20])
+        result = f"⚠️ <b>{len(drift)} counter(s) had drifted and were corrected:</b>\n{drift_text}"
+    else:
+        result = "✅ <b>All counters matched a full recount.</b>"
+
+    await message.answer(f"""
+🔄 <b>Statistics Rebuilt</b>
+
+📊 Recounted {len(users_data):,} users and {len(orders_data):,} orders in {elapsed:.2f}s
+
+{result}
+""")
+    print(f"📊 ADMIN STATS: Admin {user.id} rebuilt statistics ({len(drift)} drifted counters)")
+
 @dp.message(Command("adminmenu"))
 async def cmd_adminmenu(message: Message):
     """Handle /adminmenu command - same as Admin Panel button"""
@@ -1074,13 +1368,17 @@ Unauthorized access attempts are logged and monitored.
         from services import get_admin_main_menu
 
         # Show proper admin panel with all buttons
-        text = """
+        storage_files = [database.db_path] if database is not None else ["users.json", "orders.json"]
+        text = f"""
 👑 <b>India Social Panel - Admin Control Center</b>
 
 🎯 <b>Welcome Admin!</b> Choose your action below:
 
 🚀 <b>Full administrative access granted</b>
 📊 <b>All systems operational</b>
+
+💾 <b>Storage:</b>
+{persistence.storage_status_text(storage_files)}
 """
 
         admin_menu = get_admin_main_menu()
@@ -1144,9 +1442,94 @@ async def cmd_signout(message: Message):
 
     await message.answer(text, reply_markup=keyboard)
 
+# ========== USER LIST ==========
+USER_LIST_PAGE_SIZE = 20
+# Callback data: ul:<sort j/a>:<filter a/c/p>:<status or ->:<o/n>:<cursor user ID>
+USER_LIST_CALLBACK = "ul:"
+USER_LIST_SORTS = {"j": "joined", "a": "active"}
+USER_LIST_FILTERS = {"a": None, "c": True, "p": False}
+
+def _user_list_callback(sort: str, account_filter: str, status: Optional[str],
+                        direction: str = "o", cursor: Any = "") -> str:
+    return f"{USER_LIST_CALLBACK}{sort}:{account_filter}:{(status or '-')[:16]}:{direction}:{cursor}"
+
+async def _user_list_page(sort: str, created: Optional[bool], status: Optional[str],
+                          older_than: Optional[int] = None, newer_than: Optional[int] = None,
+                          limit: int = USER_LIST_PAGE_SIZE) -> Dict[str, Any]:
+    """One /userlist page - the sorted directory, or an indexed query in lazy/shared mode"""
+    return await repository.user_list_page(USER_LIST_SORTS[sort], created, status, older_than, newer_than, limit)
+
+def _format_list_date(value: Any) -> str:
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).strftime('%d %b %Y')
+    except (TypeError, ValueError):
+        return 'Unknown'
+
+async def render_user_list(sort: str = "j", account_filter: str = "a", status: Optional[str] = None,
+                           older_than: Optional[int] = None, newer_than: Optional[int] = None):
+    """Text and keyboard for one /userlist page, newest first"""
+    created = USER_LIST_FILTERS[account_filter]
+    page = await _user_list_page(sort, created, status, older_than, newer_than)
+    total_users = (await _user_list_page(sort, None, None, limit=0))['total']
+    account_created_users = (await _user_list_page(sort, True, None, limit=0))['total']
+
+    filter_labels = {"a": "All", "c": "✅ Created", "p": "⏳ Pending"}
+    text = f"""
+👥 <b>All Bot Users List</b>
+📊 <b>Statistics:</b> {total_users} Total Users | {account_created_users} Accounts Created
+
+📋 <b>{filter_labels[account_filter]}{f" · status {html.escape(status)}" if status else ""}:</b> {page['total']} users, {"newest joined" if sort == "j" else "most recently active"} first
+
+"""
+    lines = []
+    for user_id, user_data in page['users']:
+        telegram_username = str(user_data.get('username') or '').strip()
+        first_name = str(user_data.get('first_name') or '').strip()
+        full_name = str(user_data.get('full_name') or '').strip()
+        account_status = "✅ Created" if user_data.get('account_created', False) else "⏳ Pending"
+
+        if telegram_username:
+            username_display = f"@{html.escape(telegram_username.lstrip('@'))}"
+        elif full_name:
+            username_display = f"{html.escape(full_name)} (Account)"
+        elif first_name:
+            username_display = f"{html.escape(first_name)} (Telegram)"
+        else:
+            username_display = "(No name set)"
+
+        if sort == "a":
+            when = f"🕒 Active: {_format_list_date(user_data.get('last_activity'))}"
+        else:
+            when = f"📅 Joined: {_format_list_date(user_data.get('join_date'))}"
+        lines.append(f"<code>{user_id}</code> | {username_display}\n    {when} | {account_status}")
+    text += "\n\n".join(lines) if lines else "📝 No users found."
+    text += "\n\n💡 <b>Legend:</b> ✅ Account Created | ⏳ Account Pending"
+
+    keyboard_rows = []
+    users = page['users']
+    nav_row = []
+    if page['has_newer'] and users:
+        nav_row.append(InlineKeyboardButton(text="⬅️ Newer", callback_data=_user_list_callback(
+            sort, account_filter, status, "n", users[0][0])))
+    if page['has_older'] and users:
+        nav_row.append(InlineKeyboardButton(text="Older ➡️", callback_data=_user_list_callback(
+            sort, account_filter, status, "o", users[-1][0])))
+    if nav_row:
+        keyboard_rows.append(nav_row)
+    keyboard_rows.append([
+        InlineKeyboardButton(text=f"{'🔘' if key == account_filter else '⚪'} {label}",
+                             callback_data=_user_list_callback(sort, key, status))
+        for key, label in filter_labels.items()
+    ])
+    other_sort = "a" if sort == "j" else "j"
+    keyboard_rows.append([InlineKeyboardButton(
+        text="🕒 Sort by last activity" if other_sort == "a" else "📅 Sort by join date",
+        callback_data=_user_list_callback(other_sort, account_filter, status))])
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard_rows)
+
 @dp.message(Command("userlist"))
 async def cmd_userlist(message: Message):
-    """Handle /userlist command - show all users who started the bot"""
+    """Handle /userlist [active] [created|pending] [status] command - paginated list of bot users"""
     print(f"📨 Received /userlist command from user {message.from_user.id if message.from_user else 'Unknown'}")
     
     user = message.from_user
@@ -1165,76 +1548,40 @@ async def cmd_userlist(message: Message):
         await message.answer("⚠️ Access denied. This command is for administrators only.")
         return
 
-    # Get all users from users_data
-    if not users_data:
-        await message.answer("📝 No users found in database.")
-        return
-
-    total_users = len(users_data)
-    account_created_users = sum(1 for user_data in users_data.values() if user_data.get('account_created', False))
-    
-    # Create user list with proper formatting
-    user_list_text = []
-    for idx, (user_id_str, user_data) in enumerate(users_data.items(), 1):
-        # Get user details with debug info
-        telegram_username = user_data.get('username', '').strip()
-        first_name = user_data.get('first_name', '').strip()
-        full_name = user_data.get('full_name', '').strip()
-        account_status = "✅ Created" if user_data.get('account_created', False) else "⏳ Pending"
-        join_date = user_data.get('join_date', 'Unknown')
-        
-        
-        # Format username properly - fix the logic
-        if telegram_username and telegram_username != "":
-            username_display = f"@{telegram_username}"
-        elif full_name and full_name != "":
-            username_display = f"{full_name} (Account)"
-        elif first_name and first_name != "":
-            username_display = f"{first_name} (Telegram)"
+    sort, account_filter, status = "j", "a", None
+    for word in (message.text or "").lower().split()[1:]:
+        if word == "active":
+            sort = "a"
+        elif word in ("created", "pending"):
+            account_filter = word[0]
         else:
-            username_display = "(No name set)"
-        
-        # Format join date
-        try:
-            if join_date != 'Unknown':
-                from datetime import datetime
-                join_dt = datetime.fromisoformat(join_date.replace('Z', '+00:00'))
-                formatted_date = join_dt.strftime('%d %b %Y')
-            else:
-                formatted_date = 'Unknown'
-        except:
-            formatted_date = 'Unknown'
-        
-        user_list_text.append(
-            f"<b>{idx}.</b> <code>{user_id_str}</code> | {username_display}\n"
-            f"    📅 Joined: {formatted_date} | {account_status}"
-        )
-    
-    # Split into chunks if too many users (Telegram message limit)
-    chunk_size = 50  # Show 50 users per message
-    total_chunks = (total_users + chunk_size - 1) // chunk_size
-    
-    for chunk_num in range(total_chunks):
-        start_idx = chunk_num * chunk_size
-        end_idx = min(start_idx + chunk_size, total_users)
-        chunk_users = user_list_text[start_idx:end_idx]
-        
-        header = f"""
-👥 <b>All Bot Users List</b>
-📊 <b>Statistics:</b> {total_users} Total Users | {account_created_users} Accounts Created
+            status = word[:16]
 
-📋 <b>Users {start_idx + 1}-{end_idx} of {total_users}:</b>
+    text, keyboard = await render_user_list(sort, account_filter, status)
+    await message.answer(text, reply_markup=keyboard)
 
-"""
-        
-        chunk_text = header + "\n\n".join(chunk_users)
-        
-        if total_chunks > 1:
-            chunk_text += f"\n\n📄 <b>Page {chunk_num + 1} of {total_chunks}</b>"
-        
-        chunk_text += "\n\n💡 <b>Legend:</b> ✅ Account Created | ⏳ Account Pending"
-        
-        await message.answer(chunk_text)
+@dp.callback_query(F.data.startswith(USER_LIST_CALLBACK))
+async def cb_userlist_page(callback: CallbackQuery):
+    """Flip /userlist pages and switch its sort and filters"""
+    if not callback.from_user or not callback.data:
+        return
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⚠️ Access denied!", show_alert=True)
+        return
+
+    parts = callback.data[len(USER_LIST_CALLBACK):].split(":")
+    if (len(parts) != 5 or parts[0] not in USER_LIST_SORTS or parts[1] not in USER_LIST_FILTERS
+            or parts[3] not in ("o", "n") or (parts[4] and not parts[4].isdigit())):
+        await callback.answer("❌ Invalid user list page!", show_alert=True)
+        return
+    sort, account_filter, status, direction, cursor = parts
+    cursor_id = int(cursor) if cursor else None
+    text, keyboard = await render_user_list(
+        sort, account_filter, None if status == "-" else status,
+        older_than=cursor_id if direction == "o" else None,
+        newer_than=cursor_id if direction == "n" else None)
+    await safe_edit_message(callback, text, keyboard)
+    await callback.answer()
 
 # ========== EXISTING ADMIN COMMANDS ==========
 
@@ -1260,63 +1607,263 @@ async def cmd_broadcast(message: Message):
 📝 <b>Example:</b> /broadcast Hello all users! New features available.
 
 ⚠️ <b>This will send to ALL registered users!</b>
+🚫 Users who blocked the bot are skipped - start with <code>--all</code> to include them.
+🎯 Only a segment: <code>/broadcast [total_spent&gt;500 and joined&lt;30d] message</code> (preview with /segment)
 """)
         return
 
     broadcast_message = command_parts[1]
+    include_undeliverable = broadcast_message.startswith("--all ")
+    if include_undeliverable:
+        broadcast_message = broadcast_message[len("--all "):].strip()
+    segment_text, broadcast_message = segments.split_segment(broadcast_message)
+    if not broadcast_message:
+        await message.answer("❌ Please provide a message to broadcast!")
+        return
 
-    # Get all registered users DIRECTLY from users_data
-    target_users = list(users_data.keys())
-    print(f"📢 BROADCAST: Admin {user.id} sending to {len(target_users)} users")
+    # Registered users (or the segment), minus those who blocked the bot (unless --all)
+    if segment_text is not None:
+        try:
+            target_users, skipped, _elapsed = await segment_recipients(segment_text, include_undeliverable)
+        except segments.SegmentError as e:
+            await message.answer(f"❌ <b>Invalid segment:</b> {html.escape(str(e))}\n\n{segments.SEGMENT_HELP}")
+            return
+    else:
+        target_users, skipped = await broadcast_recipients(include_undeliverable)
+    print(f"📢 BROADCAST: Admin {user.id} sending to {len(target_users)} users ({skipped} undeliverable skipped)"
+          + (f" in segment [{segment_text}]" if segment_text is not None else ""))
 
     if not target_users:
-        await message.answer("❌ No registered users found!")
+        await message.answer("❌ No matching users found!" if segment_text is not None else "❌ No registered users found!")
         return
 
     # Send confirmation to admin
-    await message.answer(f"""
+    audience = (f"🎯 <b>Segment:</b> <code>{html.escape(segment_text)}</code>\n" if segment_text is not None else ""
+                ) + f"🚫 <b>Skipped (undeliverable):</b> {skipped}\n"
+    status_message = await message.answer(f"""
 📢 <b>Broadcasting Message...</b>
 
 📊 <b>Target Users:</b> {len(target_users)}
-📝 <b>Message:</b> {broadcast_message}
+{audience}📝 <b>Message:</b> {broadcast_message}
+⏰ <b>Estimated Time:</b> ~{broadcaster.format_duration(broadcaster.estimate_seconds(len(target_users)))}
 
-🔄 <b>Sending now...</b>
+🔄 <b>Sending now...</b> Progress updates here, the report follows when it finishes.
 """)
 
-    # Send broadcast messages DIRECTLY
-    sent_count = 0
-    failed_count = 0
+    # Checkpointed job - a restart resumes it instead of messaging everyone again
+    job = await broadcast_jobs.jobs.create(
+        broadcast_jobs.KIND_MESSAGE, {'text': broadcast_message}, target_users, user.id,
+        f"Broadcast by {user.id}" + (f" to [{segment_text}]" if segment_text is not None else ""),
+        [status_message.chat.id, status_message.message_id])
+    broadcast_jobs.jobs.start(job)
+
+# ========== UNDELIVERABLE USERS ==========
+# Re-probe flagged users this often, once their flag is at least REPROBE_AFTER_DAYS old
+UNDELIVERABLE_REPROBE_HOURS = float(os.getenv("UNDELIVERABLE_REPROBE_HOURS", "24"))
+UNDELIVERABLE_REPROBE_AFTER_DAYS = float(os.getenv("UNDELIVERABLE_REPROBE_AFTER_DAYS", "7"))
+# Probes per run - each one spends a broadcast token
+UNDELIVERABLE_REPROBE_LIMIT = int(os.getenv("UNDELIVERABLE_REPROBE_LIMIT", "500"))
+
+async def broadcast_recipients(include_undeliverable: bool = False, active_only: bool = False) -> tuple:
+    """(user IDs a broadcast goes to, undeliverable users skipped) - flagged users are skipped by default"""
+    recipients, skipped = [], 0
+    async for user_id, user_data in iter_records(users_data):
+        if active_only and user_data.get('status') != 'active':
+            continue
+        if user_data.get('undeliverable') and not include_undeliverable:
+            skipped += 1
+            continue
+        recipients.append(int(user_id))
+    return recipients, skipped
+
+async def mark_undeliverable(user_id: int, reason: str) -> None:
+    """Flag a user a send was refused for (blocked / deactivated / chat not found)"""
+    await preload_user(user_id)
+    user_data = users_data.get(user_id)
+    if user_data is None:
+        return
+    flag = user_data.get('undeliverable')
+    now = datetime.now().isoformat()
+    if flag:
+        # Still unreachable - keep the original date, note the check
+        flag = dict(flag, reason=reason, probed_at=now)
+    else:
+        flag = {'reason': reason, 'since': now, 'probed_at': now}
+    user_data['undeliverable'] = flag
+    save_users_data(user_id)
+
+def clear_undeliverable(user_id: int) -> bool:
+    """The user is reachable again (came back through /start or answered a probe)"""
+    user_data = users_data.get(user_id)
+    if not user_data or not user_data.get('undeliverable'):
+        return False
+    del user_data['undeliverable']
+    save_users_data(user_id)
+    print(f"📬 User {user_id} is reachable again")
+    return True
+
+async def reprobe_undeliverable() -> None:
+    """Background task - check long-flagged users with a typing action and un-flag those who unblocked"""
+    while True:
+        await asyncio.sleep(UNDELIVERABLE_REPROBE_HOURS * 3600)
+        cutoff = (datetime.now() - timedelta(days=UNDELIVERABLE_REPROBE_AFTER_DAYS)).isoformat()
+        due = await repository.undeliverable_user_ids(cutoff, UNDELIVERABLE_REPROBE_LIMIT)
+        returned = 0
+        for user_id in due:
+            outcome = await broadcaster.deliver(lambda: bot.send_chat_action(chat_id=user_id, action="typing"),
+                                                user_id, "Re-probe")
+            if outcome == broadcaster.DELIVERED:
+                await preload_user(user_id)
+                returned += clear_undeliverable(user_id)
+            elif outcome in broadcaster.UNREACHABLE_OUTCOMES:
+                await mark_undeliverable(user_id, outcome)
+        if due:
+            print(f"📬 Re-probed {len(due)} undeliverable users - {returned} reachable again")
+
+# ========== AUDIENCE SEGMENTS ==========
+SEGMENT_SAMPLE_SIZE = 5
+
+async def segment_platform_users(platform: str) -> set:
+    """Users with an order on platform - the order index, or an indexed query in lazy/shared mode"""
+    return await repository.platform_user_ids(platform)
+
+async def segment_recipients(text: str, include_undeliverable: bool = False, active_only: bool = False) -> tuple:
+    """(user IDs matching a segment, undeliverable matches skipped, seconds the selection took)
+    - raises segments.SegmentError"""
+    segment = segments.compile_segment(" ".join(text.split()))
+    started = time.perf_counter()
+    skipped = 0
+
+    def exclude(user_data: Dict[str, Any]) -> bool:
+        nonlocal skipped
+        if active_only and user_data.get('status') != 'active':
+            return True
+        if user_data.get('undeliverable') and not include_undeliverable:
+            skipped += 1
+            return True
+        return False
 
-    for user_id in target_users:
-        try:
-            await bot.send_message(
-                chat_id=user_id,
-                text=broadcast_message,
-                parse_mode="HTML"
-            )
-            sent_count += 1
-            print(f"✅ Broadcast sent to user {user_id}")
+    user_ids = await segment.select(repository, segment_platform_users, exclude)
+    return user_ids, skipped, time.perf_counter() - started
 
-            # Rate limiting
-            import asyncio
-            await asyncio.sleep(0.5)  # 0.5 second delay
+@dp.message(Command("segment"))
+async def cmd_segment(message: Message):
+    """Handle /segment <filter> - audience size and a sample, before broadcasting to it"""
+    user = message.from_user
+    if not user or not is_admin(user.id):
+        await message.answer("⚠️ This command is for admins only!")
+        return
 
-        except Exception as e:
-            failed_count += 1
-            print(f"❌ Failed to send to user {user_id}: {e}")
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2:
+        await message.answer(f"🎯 <b>Usage:</b> <code>/segment total_spent&gt;500 and platform:instagram and joined&lt;30d</code>\n\n{segments.SEGMENT_HELP}")
+        return
+    try:
+        user_ids, skipped, elapsed = await segment_recipients(parts[1])
+    except segments.SegmentError as e:
+        await message.answer(f"❌ <b>Invalid segment:</b> {html.escape(str(e))}\n\n{segments.SEGMENT_HELP}")
+        return
 
-    # Send final report to admin
+    sample = ""
+    for user_id in user_ids[:SEGMENT_SAMPLE_SIZE]:
+        await preload_user(user_id)
+        user_data = users_data.get(user_id) or {}
+        name = user_data.get('full_name') or user_data.get('first_name') or 'Unknown'
+        sample += f"• <code>{user_id}</code> - {html.escape(str(name))}\n"
     await message.answer(f"""
-✅ <b>Broadcast Complete!</b>
+🎯 <b>Segment Preview</b>
 
-📊 <b>Results:</b>
-• ✅ Successfully sent: {sent_count}
-• ❌ Failed: {failed_count}
-• 👥 Total attempted: {len(target_users)}
+🔎 <b>Filter:</b> <code>{html.escape(parts[1])}</code>
+👥 <b>Matching users:</b> {len(user_ids)}
+🚫 <b>Skipped (undeliverable):</b> {skipped}
+⚡ <b>Selected in:</b> {elapsed * 1000:.1f} ms
+⏰ <b>Broadcast time:</b> ~{broadcaster.format_duration(broadcaster.estimate_seconds(len(user_ids)))}
 
-🎯 <b>Broadcast finished!</b>
+{sample or "📝 No users match."}
+💡 Send with: <code>/broadcast [{html.escape(parts[1])}] your message</code>
 """)
 
+# ========== BROADCAST JOBS ==========
+BROADCAST_JOB_CALLBACK = "bj:"
+BROADCAST_JOB_ACTIONS = {"p": broadcast_jobs.PAUSED, "r": broadcast_jobs.RUNNING, "c": broadcast_jobs.CANCELLED}
+
+def control_broadcast_job(job_id: str, status: str) -> Optional[str]:
+    """Pause/resume/cancel a job here, or ask the primary worker to - returns an error message"""
+    if SHARED_STATE and WORKER_INDEX > 0:
+        # Jobs run on the primary worker - refresh our copy to validate, then hand the request over
+        broadcast_jobs.jobs.load()
+    job = broadcast_jobs.jobs.jobs.get(job_id)
+    if job is None:
+        return f"❌ Broadcast job {job_id} not found"
+    if job.finished:
+        return f"⚠️ Broadcast job {job_id} is already {job.status}"
+    if SHARED_STATE and WORKER_INDEX > 0:
+        broadcast_jobs.jobs.request(job_id, status)
+    else:
+        broadcast_jobs.jobs.set_status(job_id, status)
+    return None
+
+def render_broadcast_jobs():
+    """Text and pause/resume/cancel buttons for /broadcasts"""
+    if SHARED_STATE and WORKER_INDEX > 0:
+        broadcast_jobs.jobs.load()
+    jobs = sorted(broadcast_jobs.jobs.jobs.values(), key=lambda job: job.created_at, reverse=True)
+    text = "📋 <b>Broadcast Jobs</b>\n\n"
+    text += "\n\n".join(broadcast_jobs.jobs.describe(job) for job in jobs) if jobs else "📝 No broadcast jobs yet."
+    rows = []
+    for job in jobs:
+        if job.status == broadcast_jobs.RUNNING:
+            rows.append([InlineKeyboardButton(text=f"⏸️ Pause {job.job_id}", callback_data=f"{BROADCAST_JOB_CALLBACK}p:{job.job_id}"),
+                         InlineKeyboardButton(text="🛑 Cancel", callback_data=f"{BROADCAST_JOB_CALLBACK}c:{job.job_id}")])
+        elif job.status == broadcast_jobs.PAUSED:
+            rows.append([InlineKeyboardButton(text=f"▶️ Resume {job.job_id}", callback_data=f"{BROADCAST_JOB_CALLBACK}r:{job.job_id}"),
+                         InlineKeyboardButton(text="🛑 Cancel", callback_data=f"{BROADCAST_JOB_CALLBACK}c:{job.job_id}")])
+    return text, InlineKeyboardMarkup(inline_keyboard=rows)
+
+@dp.message(Command("broadcasts"))
+async def cmd_broadcasts(message: Message):
+    """Handle /broadcasts [pause|resume|cancel JOB_ID] - list and control broadcast jobs"""
+    user = message.from_user
+    if not user or not is_admin(user.id):
+        await message.answer("⚠️ This command is for admins only!")
+        return
+
+    parts = (message.text or "").split()
+    if len(parts) >= 3:
+        status = {"pause": broadcast_jobs.PAUSED, "resume": broadcast_jobs.RUNNING,
+                  "cancel": broadcast_jobs.CANCELLED}.get(parts[1].lower())
+        if status is None:
+            await message.answer("❌ <b>Usage:</b> <code>/broadcasts [pause|resume|cancel JOB_ID]</code>")
+            return
+        error = control_broadcast_job(parts[2], status)
+        if error:
+            await message.answer(error)
+            return
+
+    text, keyboard = render_broadcast_jobs()
+    await message.answer(text, reply_markup=keyboard)
+
+@dp.callback_query(F.data.startswith(BROADCAST_JOB_CALLBACK))
+async def cb_broadcast_job(callback: CallbackQuery):
+    """Pause/resume/cancel buttons under /broadcasts"""
+    if not callback.from_user or not callback.data:
+        return
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⚠️ Access denied!", show_alert=True)
+        return
+
+    action, _, job_id = callback.data[len(BROADCAST_JOB_CALLBACK):].partition(":")
+    if action not in BROADCAST_JOB_ACTIONS or not job_id:
+        await callback.answer("❌ Invalid broadcast job action!", show_alert=True)
+        return
+    error = control_broadcast_job(job_id, BROADCAST_JOB_ACTIONS[action])
+    if error:
+        await callback.answer(error, show_alert=True)
+        return
+    text, keyboard = render_broadcast_jobs()
+    await safe_edit_message(callback, text, keyboard)
+    await callback.answer(f"✅ {broadcast_jobs.STATUS_LABELS[BROADCAST_JOB_ACTIONS[action]]}")
+
 @dp.message(Command("restoreuser"))
 async def cmd_restoreuser(message: Message):
     """Admin command to restore one or multiple users back into memory after bot restart"""
@@ -1464,6 +2011,16 @@ async def cmd_sendtouser(message: Message):
 
 def load_offers_from_json() -> list:
     """Load offers from offers.json file, return empty list if file doesn't exist"""
+    if SHARED_STATE:
+        # Another worker may have changed them - always read the table
+        return database.load_offers_sync()
+    if offers_cache is not None:
+        # SQLite backend - offers are cached in memory and written through
+        return list(offers_cache)
+    # Offers queued by the write-behind store are newer than the file on disk
+    pending = persistence.store.pending_data("offers.json")
+    if pending is not None:
+        return list(pending)
     try:
         if os.path.exists("offers.json"):
             with open("offers.json", 'r', encoding='utf-8') as f:
@@ -1479,12 +2036,31 @@ def load_offers_from_json() -> list:
 
 def save_offers_to_json(offers: list) -> None:
     """Save offers list to offers.json file"""
+    if offers_cache is not None:
+        offers_cache[:] = offers
+        database.save_offers(offers)
+        return
+    save_data_to_json(offers, "offers.json")
+
+async def load_offers_from_json_async() -> list:
+    """Awaitable load_offers_from_json - json.load runs in the I/O thread pool"""
+    if SHARED_STATE:
+        return await database.load_offers()
+    if offers_cache is not None:
+        return list(offers_cache)
     try:
-        with open("offers.json", 'w', encoding='utf-8') as f:
-            json.dump(offers, f, indent=2, ensure_ascii=False, default=str)
-        print(f"✅ Offers saved to offers.json")
+        offers = await persistence.read_json_async("offers.json", [])
+        return list(offers) if isinstance(offers, list) else []
     except Exception as e:
-        print(f"❌ Error saving offers to offers.json: {e}")
+        print(f"❌ Error loading offers from offers.json: {e}")
+        return []
+
+async def save_offers_to_json_async(offers: list) -> None:
+    """Awaitable save_offers_to_json - returns once offers.json is written"""
+    if offers_cache is not None:
+        save_offers_to_json(offers)
+        return
+    await save_data_to_json_async(offers, "offers.json")
 
 def generate_offer_id() -> str:
     """Generate unique offer ID"""
@@ -1553,7 +2129,7 @@ async def cmd_delete_offer(message: Message):
     offer_id = command_parts[1].strip()
 
     # Load current offers from offers.json
-    offers = load_offers_from_json()
+    offers = await load_offers_from_json_async()
     
     if not offers:
         await message.answer("❌ No offers found in the system!")
@@ -1589,7 +2165,7 @@ async def cmd_delete_offer(message: Message):
         return
 
     # Save the updated offers list back to offers.json
-    save_offers_to_json(updated_offers)
+    await save_offers_to_json_async(updated_offers)
 
     # Send confirmation message to admin
     if removed_offer:
@@ -1819,11 +2395,11 @@ async def complete_offer_creation(message: Message, state: FSMContext):
     }
 
     # Load existing offers and add new one
-    offers = load_offers_from_json()
+    offers = await load_offers_from_json_async()
     offers.append(offer)
 
     # Save updated offers list
-    save_offers_to_json(offers)
+    await save_offers_to_json_async(offers)
 
     # Clear FSM state
     await state.clear()
@@ -1850,10 +2426,9 @@ async def complete_offer_creation(message: Message, state: FSMContext):
 
 # ========== SEND OFFER SYSTEM ==========
 
-async def send_offer_to_user(user_id: int, offer: dict, bot: Bot) -> bool:
-    """Send offer message with Order Now button to a specific user"""
-    try:
-        offer_text = f"""
+def build_offer_message(offer: dict):
+    """Offer text and Order Now keyboard"""
+    offer_text = f"""
 🎉 <b>Special Offer for You!</b>
 
 {offer['offer_message']}
@@ -1862,32 +2437,34 @@ async def send_offer_to_user(user_id: int, offer: dict, bot: Bot) -> bool:
 💰 <b>Rate:</b> {offer['rate']}
 """
 
-        if offer.get('has_fixed_quantity') and offer.get('fixed_quantity'):
-            offer_text += f"🔢 <b>Quantity:</b> {offer['fixed_quantity']}\n"
+    if offer.get('has_fixed_quantity') and offer.get('fixed_quantity'):
+        offer_text += f"🔢 <b>Quantity:</b> {offer['fixed_quantity']}\n"
 
-        offer_text += """
+    offer_text += """
 ⚡ <b>Limited Time Offer!</b>
 🛒 <b>Click below to order now!</b>
 """
 
-        # Create Order Now button with offer_id in callback_data
-        order_button = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(
-                text="🛒 Order Now", 
-                callback_data=f"order_offer_{offer['offer_id']}"
-            )]
-        ])
+    # Create Order Now button with offer_id in callback_data
+    order_button = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text="🛒 Order Now", 
+            callback_data=f"order_offer_{offer['offer_id']}"
+        )]
+    ])
+    return offer_text, order_button
 
-        await bot.send_message(
-            chat_id=user_id,
-            text=offer_text,
-            reply_markup=order_button,
-            parse_mode="HTML"
-        )
-        return True
-    except Exception as e:
-        print(f"❌ Failed to send offer to user {user_id}: {e}")
-        return False
+async def send_offer_to_user(user_id: int, offer: dict, bot: Bot) -> bool:
+    """Send offer message with Order Now button to a specific user"""
+    offer_text, order_button = build_offer_message(offer)
+    outcome = await broadcaster.deliver(
+        lambda: bot.send_message(chat_id=user_id, text=offer_text, reply_markup=order_button, parse_mode="HTML"),
+        user_id, f"Offer {offer['offer_id']}")
+    if outcome in broadcaster.UNREACHABLE_OUTCOMES:
+        await mark_undeliverable(user_id, outcome)
+    if outcome != broadcaster.DELIVERED:
+        print(f"❌ Failed to send offer to user {user_id}: {outcome}")
+    return outcome == broadcaster.DELIVERED
 
 @dp.message(Command("send_offer"))
 async def cmd_send_offer(message: Message, state: FSMContext):
@@ -1901,7 +2478,7 @@ async def cmd_send_offer(message: Message, state: FSMContext):
     await state.set_state(AdminSendOfferStates.getting_offer_id)
 
     # Load and display available offers
-    offers = load_offers_from_json()
+    offers = await load_offers_from_json_async()
 
     if not offers:
         await message.answer("❌ No offers found! Please create offers first using /create_offer")
@@ -1941,7 +2518,7 @@ async def handle_offer_id_input(message: Message, state: FSMContext):
     offer_id = message.text.strip()
 
     # Load offers and validate offer_id
-    offers = load_offers_from_json()
+    offers = await load_offers_from_json_async()
     selected_offer = None
 
     for offer in offers:
@@ -1978,6 +2555,7 @@ async def handle_offer_id_input(message: Message, state: FSMContext):
 
 🌍 <b>All Users:</b> Send to all registered users
 👤 <b>Specific User:</b> Send to a particular user
+🎯 <b>Segment:</b> Send to users matching a filter
 
 📤 <b>Choose your target audience:</b>
 """
@@ -1987,6 +2565,9 @@ async def handle_offer_id_input(message: Message, state: FSMContext):
         [
             InlineKeyboardButton(text="🌍 All Users", callback_data="send_to_all_users"),
             InlineKeyboardButton(text="👤 Specific User", callback_data="send_to_specific_user")
+        ],
+        [
+            InlineKeyboardButton(text="🎯 Segment", callback_data="send_to_segment_prompt")
         ]
     ])
 
@@ -2012,8 +2593,9 @@ async def handle_target_choice(callback: CallbackQuery, state: FSMContext):
         # Send to all users
         await callback.answer("📤 Sending to all users...")
 
-        # Use global users_data (already loaded with proper key conversion)
-        if not users_data:
+        # Send offer to all reachable users as a checkpointed broadcast job through the shared rate limit
+        recipients, skipped = await broadcast_recipients()
+        if not recipients:
             if callback.message and hasattr(callback.message, 'edit_text'):
                 await callback.message.edit_text(
                     "❌ <b>No users found!</b>\n\n"
@@ -2021,28 +2603,72 @@ async def handle_target_choice(callback: CallbackQuery, state: FSMContext):
                 )
             await state.clear()
             return
+        total_users = len(recipients)
+        status_message = None
+        if callback.message and hasattr(callback.message, 'edit_text'):
+            await callback.message.edit_text(
+                f"📤 <b>Sending Offer:</b> {selected_offer['package_name']}\n\n"
+                f"👥 <b>Total Users:</b> {total_users}\n"
+                f"🚫 <b>Skipped (undeliverable):</b> {skipped}\n"
+                f"⏰ <b>Estimated Time:</b> ~{broadcaster.format_duration(broadcaster.estimate_seconds(total_users))}\n\n"
+                f"🔄 Progress updates here, the report follows when it finishes."
+            )
+            status_message = [callback.message.chat.id, callback.message.message_id]
+        job = await broadcast_jobs.jobs.create(
+            broadcast_jobs.KIND_OFFER, selected_offer, recipients,
+            callback.from_user.id, f"Offer {selected_offer['package_name']}", status_message)
+        broadcast_jobs.jobs.start(job)
+        await state.clear()
+        print(f"📤 SEND_OFFER: Admin started job {job.job_id} for offer {selected_offer['offer_id']} to all {total_users} users")
 
-        # Send offer to all users
-        success_count = 0
-        total_users = len(users_data)
+    elif callback.data == "send_to_segment_prompt":
+        # Ask for the segment filter
+        await state.set_state(AdminSendOfferStates.getting_segment)
 
-        for user_id in users_data:
-            if await send_offer_to_user(int(user_id), selected_offer, bot):
-                success_count += 1
+        if callback.message and hasattr(callback.message, 'edit_text'):
+            await callback.message.edit_text(
+                f"🎯 <b>Send to a Segment - Step 3/3</b>\n\n"
+                f"🎯 <b>Selected Offer:</b> {selected_offer['package_name']}\n\n"
+                f"💡 <b>Send the audience filter</b>, e.g.\n"
+                f"<code>total_spent&gt;500 and platform:instagram and joined&lt;30d</code>\n\n"
+                f"{segments.SEGMENT_HELP}"
+            )
+        await callback.answer()
+
+    elif callback.data == "send_to_segment":
+        # Confirmed segment preview - select again so the audience is current
+        segment_text = data.get('segment')
+        if not segment_text:
+            await callback.answer("❌ Segment lost! Please choose it again.", show_alert=True)
+            return
+        try:
+            recipients, skipped, _elapsed = await segment_recipients(segment_text)
+        except segments.SegmentError as e:
+            await callback.answer(f"❌ Invalid segment: {e}"[:200], show_alert=True)
+            return
+        if not recipients:
+            await callback.answer("❌ No users match this segment any more!", show_alert=True)
+            return
+        await callback.answer("📤 Sending to segment...")
 
-        # Report results and clear state
+        status_message = None
         if callback.message and hasattr(callback.message, 'edit_text'):
             await callback.message.edit_text(
-                f"✅ <b>Offer Sent Successfully!</b>\n\n"
-                f"📊 <b>Delivery Report:</b>\n"
-                f"👥 <b>Total Users:</b> {total_users}\n"
-                f"✅ <b>Successfully Sent:</b> {success_count}\n"
-                f"❌ <b>Failed:</b> {total_users - success_count}\n\n"
-                f"🎯 <b>Offer:</b> {selected_offer['package_name']}\n"
-                f"🎉 <b>Campaign completed!</b>"
+                f"📤 <b>Sending Offer:</b> {selected_offer['package_name']}\n\n"
+                f"🎯 <b>Segment:</b> <code>{html.escape(segment_text)}</code>\n"
+                f"👥 <b>Total Users:</b> {len(recipients)}\n"
+                f"🚫 <b>Skipped (undeliverable):</b> {skipped}\n"
+                f"⏰ <b>Estimated Time:</b> ~{broadcaster.format_duration(broadcaster.estimate_seconds(len(recipients)))}\n\n"
+                f"🔄 Progress updates here, the report follows when it finishes."
             )
+            status_message = [callback.message.chat.id, callback.message.message_id]
+        job = await broadcast_jobs.jobs.create(
+            broadcast_jobs.KIND_OFFER, selected_offer, recipients,
+            callback.from_user.id, f"Offer {selected_offer['package_name']} to [{segment_text}]", status_message)
+        broadcast_jobs.jobs.start(job)
         await state.clear()
-        print(f"📤 SEND_OFFER: Admin sent offer {selected_offer['offer_id']} to all {total_users} users")
+        print(f"📤 SEND_OFFER: Admin started job {job.job_id} for offer {selected_offer['offer_id']} "
+              f"to {len(recipients)} users in segment [{segment_text}]")
 
     elif callback.data == "send_to_specific_user":
         # Ask for specific user ID
@@ -2063,6 +2689,44 @@ async def handle_target_choice(callback: CallbackQuery, state: FSMContext):
     else:
         await callback.answer("❌ Invalid option!")
 
+@dp.message(AdminSendOfferStates.getting_segment)
+async def handle_offer_segment(message: Message, state: FSMContext):
+    """Preview the audience of a segment filter before sending the offer to it"""
+    if not message.text:
+        await message.answer("⚠️ Please send a segment filter.")
+        return
+
+    data = await state.get_data()
+    selected_offer = data.get('selected_offer')
+    if not selected_offer:
+        await message.answer("❌ Offer data lost! Please start again with /send_offer")
+        await state.clear()
+        return
+
+    segment_text = " ".join(message.text.split())
+    try:
+        recipients, skipped, elapsed = await segment_recipients(segment_text)
+    except segments.SegmentError as e:
+        await message.answer(f"❌ <b>Invalid segment:</b> {html.escape(str(e))}\n\n📤 <b>Send a corrected filter:</b>")
+        return
+
+    # Back to target selection - the confirm button is handled there
+    await state.update_data(segment=segment_text)
+    await state.set_state(AdminSendOfferStates.choosing_target)
+
+    buttons = [[InlineKeyboardButton(text=f"✅ Send to {len(recipients)} users", callback_data="send_to_segment")]] if recipients else []
+    buttons.append([InlineKeyboardButton(text="🎯 Change Segment", callback_data="send_to_segment_prompt"),
+                    InlineKeyboardButton(text="🌍 All Users", callback_data="send_to_all_users")])
+    await message.answer(
+        f"🎯 <b>Segment Preview</b>\n\n"
+        f"📦 <b>Offer:</b> {selected_offer['package_name']}\n"
+        f"🔎 <b>Filter:</b> <code>{html.escape(segment_text)}</code>\n"
+        f"👥 <b>Matching users:</b> {len(recipients)}\n"
+        f"🚫 <b>Skipped (undeliverable):</b> {skipped}\n"
+        f"⚡ <b>Selected in:</b> {elapsed * 1000:.1f} ms\n"
+        f"⏰ <b>Estimated Time:</b> ~{broadcaster.format_duration(broadcaster.estimate_seconds(len(recipients)))}",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+
 @dp.message(AdminSendOfferStates.getting_specific_user_id)
 async def handle_specific_user_id(message: Message, state: FSMContext):
     """Handle specific user ID input in getting_specific_user_id state"""
@@ -2159,7 +2823,7 @@ async def handle_order_offer(callback: CallbackQuery, state: FSMContext):
     print(f"🔥 ORDER OFFER BUTTON: Extracted offer ID: {offer_id}")
 
     # Load offers and find the selected offer
-    offers = load_offers_from_json()
+    offers = await load_offers_from_json_async()
     selected_offer = None
 
     for offer in offers:
@@ -2259,6 +2923,17 @@ async def cmd_start(message: Message):
         return  # Ignore old messages
 
     init_user(user.id, user.username or "", user.first_name or "")
+    # Back after blocking the bot - include them in broadcasts again
+    clear_undeliverable(user.id)
+
+    # Referral deep link: /start ISPXXXXXX - remembered until the account is created
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) > 1 and not is_account_created(user.id) and not users_data[user.id].get('referred_by'):
+        referrer_id = await find_referrer(parts[1])
+        if referrer_id is not None and referrer_id != user.id:
+            users_data[user.id]['referred_by'] = referrer_id
+            save_users_data(user.id)
+            print(f"🤝 User {user.id} referred by {referrer_id}")
 
     # Auto-complete account for admin users to avoid conflicts
     if is_admin(user.id) and not is_account_created(user.id):
@@ -2268,7 +2943,7 @@ async def cmd_start(message: Message):
         users_data[user.id]['phone_number'] = "+91XXXXXXXXXX"
         print(f"🔧 Auto-completed admin account for user {user.id}")
         # Save admin account data to persistent storage
-        save_users_data()
+        save_users_data(user.id)
 
     # Check if account is created
     if is_account_created(user.id):
@@ -2927,7 +3602,12 @@ async def cmd_referral(message: Message):
         return
 
     user_id = user.id
-    referral_code = users_data.get(user_id, {}).get('referral_code', 'Not Generated')
+    referral_code = users_data.get(user_id, {}).get('referral_code')
+    if not referral_code:
+        # Accounts created before codes were handed out (e.g. auto-completed admins)
+        referral_code = users_data[user_id]['referral_code'] = await generate_referral_code()
+        save_users_data(user_id)
+    stats = await referral_stats(user_id)
 
     text = f"""
 🤝 <b>Referral Program</b>
@@ -2935,6 +3615,7 @@ async def cmd_referral(message: Message):
 💰 <b>Earn rewards by referring friends!</b>
 
 🔗 <b>Your Referral Code:</b> <code>{referral_code}</code>
+👥 <b>Friends Referred:</b> {stats['referrals']} ({stats['accounts']} with accounts)
 
 🎁 <b>Referral Benefits:</b>
 • 15% commission on friend's first order
@@ -2962,6 +3643,43 @@ async def cmd_referral(message: Message):
 
     await message.answer(text, reply_markup=referral_keyboard)
 
+@dp.callback_query(F.data == "referral_stats")
+async def cb_referral_stats(callback: CallbackQuery):
+    """Referral counters and most recent referees from the referral graph"""
+    if not callback.from_user:
+        return
+    user_id = callback.from_user.id
+    if not is_account_created(user_id):
+        await callback.answer("⚠️ Please create your account first!", show_alert=True)
+        return
+
+    stats = await referral_stats(user_id)
+    text = f"""
+📊 <b>Your Referral Stats</b>
+
+🔗 <b>Referral Code:</b> <code>{users_data.get(user_id, {}).get('referral_code') or 'Not Generated'}</code>
+
+👥 <b>Friends Referred:</b> {stats['referrals']}
+✅ <b>Accounts Created:</b> {stats['accounts']}
+💰 <b>Referred Spending:</b> ₹{stats['revenue']:,.2f}
+"""
+    if stats['recent']:
+        text += "\n🆕 <b>Recent Referrals:</b>\n"
+        for referee_id in stats['recent']:
+            await preload_user(referee_id)
+            referee = users_data.get(referee_id) or {}
+            name = html.escape(str(referee.get('full_name') or referee.get('first_name') or 'Friend'))
+            status = "✅" if referee.get('account_created') else "⏳"
+            text += f"• {status} {name} - joined {_format_list_date(referee.get('join_date'))}\n"
+    else:
+        text += "\n💡 <b>Share your code - friends join with</b> <code>/start YOUR_CODE</code>"
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🏠 Main Menu", callback_data="back_main")]
+    ])
+    await safe_edit_message(callback, text, keyboard)
+    await callback.answer()
+
 @dp.message(Command("api"))
 async def cmd_api(message: Message):
     """Handle /api command"""
@@ -3036,8 +3754,8 @@ async def cmd_status(message: Message):
 🔄 <b>Last Update:</b> {datetime.now().strftime("%d %b %Y, %I:%M %p")}
 
 💻 <b>System Information:</b>
-• 📱 <b>Active Users:</b> {len(users_data)}
-• 📦 <b>Total Orders:</b> {len(orders_data)}
+• 📱 <b>Active Users:</b> {await count_records(users_data)}
+• 📦 <b>Total Orders:</b> {await count_records(orders_data)}
 • ⚡ <b>Response Time:</b> < 100ms
 • 🔒 <b>Security:</b> SSL Encrypted
 
@@ -3232,7 +3950,7 @@ async def cmd_analytics(message: Message):
 
     user_id = user.id
     user_data = users_data.get(user_id, {})
-    user_orders = [order for order in orders_data.values() if order.get('user_id') == user_id]
+    user_orders = await repository.orders_for_user(user_id)
 
     text = f"""
 📊 <b>Account Analytics & Statistics</b>
@@ -3311,6 +4029,102 @@ async def cmd_feedback(message: Message):
 
     await message.answer(text, reply_markup=feedback_keyboard)
 
+# ========== USER SEARCH ==========
+FIND_USER_PAGE_SIZE = 10
+# Callback data: fu:<page>:<prefix> - the prefix is cut to keep it within 64 bytes
+FIND_USER_CALLBACK = "fu:"
+
+async def find_users(prefix: str) -> list:
+    """Ranked (user_id, matched term, field) for an admin search prefix"""
+    return await repository.search_users(prefix)
+
+def _find_user_callback(page: int, prefix: str) -> str:
+    data = f"{FIND_USER_CALLBACK}{page}:{prefix}"
+    while len(data.encode()) > 64:
+        data = data[:-1]
+    return data
+
+async def render_user_search(prefix: str, page: int):
+    """Text and keyboard for one page of /finduser results"""
+    results = await find_users(prefix)
+    pages = max((len(results) + FIND_USER_PAGE_SIZE - 1) // FIND_USER_PAGE_SIZE, 1)
+    page = min(max(page, 0), pages - 1)
+    shown = results[page * FIND_USER_PAGE_SIZE:(page + 1) * FIND_USER_PAGE_SIZE]
+
+    text = f"""
+🔍 <b>User Search:</b> <code>{html.escape(prefix)}</code>
+
+📊 <b>{len(results):,} match{'es' if len(results) != 1 else ''}</b> - page {page + 1}/{pages}
+"""
+    for number, (user_id, term, field) in enumerate(shown, page * FIND_USER_PAGE_SIZE + 1):
+        await preload_user(user_id)
+        found = users_data.get(user_id) or {}
+        name = html.escape(str(found.get('full_name') or found.get('first_name') or 'Unknown'))
+        username = html.escape(str(found.get('username') or '')).lstrip('@')
+        text += f"""
+{number}. <b>{name}</b>{f" (@{username})" if username else ""}
+   🆔 <code>{user_id}</code> · 🎯 {user_search.FIELD_LABELS[field]}: {html.escape(term)}
+   👉 <code>/viewuser {user_id}</code>
+"""
+    if not results:
+        text += "\n❌ No users found - try a shorter prefix"
+
+    nav_row = []
+    if page > 0:
+        nav_row.append(InlineKeyboardButton(text="⬅️ Previous", callback_data=_find_user_callback(page - 1, prefix)))
+    if page < pages - 1:
+        nav_row.append(InlineKeyboardButton(text="Next ➡️", callback_data=_find_user_callback(page + 1, prefix)))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[nav_row] if nav_row else [])
+    return text, keyboard
+
+@dp.message(Command("finduser"))
+async def cmd_finduser(message: Message):
+    """Handle /finduser <prefix> command - ranked, paginated user search (admin only)"""
+    user = message.from_user
+    if not user:
+        return
+
+    if is_message_old(message):
+        mark_user_for_notification(user.id)
+        return
+
+    if not is_admin(user.id):
+        await message.answer("⚠️ Access denied. This command is for administrators only.")
+        return
+
+    parts = (message.text or "").split(maxsplit=1)
+    prefix = user_search.normalize_term(parts[1]) if len(parts) > 1 else ""
+    if not prefix:
+        await message.answer("""
+❌ <b>Usage:</b> <code>/finduser &lt;prefix&gt;</code>
+
+💡 <b>Examples:</b>
+• <code>/finduser rahul</code> - name or name word
+• <code>/finduser @rahul</code> - username
+• <code>/finduser 74370</code> - user ID prefix
+""")
+        return
+
+    text, keyboard = await render_user_search(prefix, 0)
+    await message.answer(text, reply_markup=keyboard)
+
+@dp.callback_query(F.data.startswith(FIND_USER_CALLBACK))
+async def cb_finduser_page(callback: CallbackQuery):
+    """Flip /finduser result pages"""
+    if not callback.from_user or not callback.data:
+        return
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⚠️ Access denied!", show_alert=True)
+        return
+
+    page, _, prefix = callback.data[len(FIND_USER_CALLBACK):].partition(":")
+    if not page.isdigit() or not prefix:
+        await callback.answer("❌ Invalid search page!", show_alert=True)
+        return
+    text, keyboard = await render_user_search(prefix, int(page))
+    await safe_edit_message(callback, text, keyboard)
+    await callback.answer()
+
 @dp.message(Command("viewuser"))
 async def cmd_viewuser(message: Message):
     """Handle /viewuser <USER_ID> command for admin user profile viewing"""
@@ -3372,6 +4186,7 @@ async def cmd_viewuser(message: Message):
 • <code>/viewuser 1234567890</code>
 
 ⚠️ <b>Send only numbers, no extra text</b>
+🔍 <b>Don't know the ID?</b> Search with <code>/finduser &lt;name, @username or ID prefix&gt;</code>
 """
         await message.answer(error_text, parse_mode="HTML")
         return
@@ -3504,6 +4319,7 @@ async def handle_screenshot_fsm(message: Message, state: FSMContext):
         # Store the final order
         # orders_data and send_admin_notification are already available in this module
         orders_data[order_id] = order_record
+        save_order(order_id)
 
         # Send notification to admin group
         photo_file_id = None
@@ -3640,6 +4456,7 @@ def require_account(handler):
             return
 
         user_id = callback.from_user.id
+        await preload_user(user_id)
 
         # If account not created, show message
         if not is_account_created(user_id):
@@ -3856,7 +4673,7 @@ async def cb_limited_time_offers(callback: CallbackQuery):
         return
 
     # Load active offers from offers.json (same as what admin sends)
-    offers = load_offers_from_json()
+    offers = await load_offers_from_json_async()
     active_offers = [offer for offer in offers if offer.get('is_active', True)]
 
     if not active_offers:
@@ -4926,9 +5743,10 @@ async def cb_pay_from_balance(callback: CallbackQuery, state: FSMContext):
     # Store order in permanent storage
     orders_data[order_id] = order_record
 
-    # Save updated data to persistent storage
-    save_data_to_json(users_data, "users.json")
-    save_data_to_json(orders_data, "orders.json")
+    # Save updated data to persistent storage - payment path, write through now
+    save_data_to_json(users_data, "users.json", user_id)
+    save_order(order_id)
+    await flush_persistent_data()
 
     print(f"✅ Order {order_id} completed and stored")
 
@@ -5553,9 +6371,10 @@ async def cb_confirm_order(callback: CallbackQuery):
     users_data[user_id]['total_spent'] += price
     users_data[user_id]['orders_count'] += 1
 
-    # Save updated data to persistent storage
-    save_data_to_json(users_data, "users.json")
-    save_data_to_json(orders_data, "orders.json")
+    # Save updated data to persistent storage - payment path, write through now
+    save_data_to_json(users_data, "users.json", user_id)
+    save_order(order_id)
+    await flush_persistent_data()
 
     # Clear temp order
     del order_temp[user_id]
@@ -6473,10 +7292,7 @@ async def cb_admin_user_profile(callback: CallbackQuery):
     api_key = user.get('api_key', 'Not Generated')
 
     # Get recent order history count
-    recent_orders = 0
-    for order in orders_data.values():
-        if order.get('user_id') == target_user_id:
-            recent_orders += 1
+    recent_orders = len(await repository.orders_for_user(target_user_id))
 
     profile_text = f"""
 👤 <b>Complete User Profile</b>
@@ -6750,25 +7566,19 @@ async def cb_admin_complete_order(callback: CallbackQuery):
     }
 
     # CRITICAL: Update ALL data sources for consistency
-    orders_data[order_id] = completion_record
-    save_data_to_json(orders_data, "orders.json")
-
-    # CRITICAL: Force reload fresh data from file to sync memory
-    print(f"🔄 DEBUG: Force reloading orders_data from file for consistency...")
-    fresh_orders_data = load_data_from_json("orders.json")
-    orders_data.clear()
-    orders_data.update(fresh_orders_data)
-    print(f"✅ DEBUG: orders_data reloaded - Now has {len(orders_data)} orders")
-
-    # Also update order_temp if it exists
-    if customer_id in order_temp and order_temp[customer_id].get('order_id') == order_id:
-        print(f"🔧 DEBUG: Also updating order_temp for consistency...")
-        order_temp[customer_id]['status'] = 'completed'
-        order_temp[customer_id]['completed_at'] = datetime.now().isoformat()
-        order_temp[customer_id]['completed_by_admin'] = user_id
-        print(f"✅ DEBUG: order_temp updated - Status: {order_temp[customer_id]['status']}")
-    else:
-        print(f"🔍 DEBUG: order_temp not found for customer {customer_id} or different order_id")
+    async with customer_session(customer_id, order_id):
+        orders_data[order_id] = completion_record
+        save_order(order_id)
+
+        # Also update order_temp if it exists
+        if customer_id in order_temp and order_temp[customer_id].get('order_id') == order_id:
+            print(f"🔧 DEBUG: Also updating order_temp for consistency...")
+            order_temp[customer_id]['status'] = 'completed'
+            order_temp[customer_id]['completed_at'] = datetime.now().isoformat()
+            order_temp[customer_id]['completed_by_admin'] = user_id
+            print(f"✅ DEBUG: order_temp updated - Status: {order_temp[customer_id]['status']}")
+        else:
+            print(f"🔍 DEBUG: order_temp not found for customer {customer_id} or different order_id")
 
     print(f"✅ DEBUG: Stateless completion - parsed all details from message text!")
     print(f"📊 DEBUG: Final status in orders_data[{order_id}]: {orders_data.get(order_id, {}).get('status', 'NOT_FOUND')}")
@@ -6885,8 +7695,7 @@ async def cb_rate_order(callback: CallbackQuery):
         return
 
     # Check if already rated
-    ratings_data = load_list_from_json("ratings.json")
-    if any(rating.get('order_id') == order_id and rating.get('user_id') == user_id for rating in ratings_data):
+    if feedback_store.ratings.has_rated(order_id, user_id):
         await callback.answer("⭐ You have already rated this order!", show_alert=True)
         return
 
@@ -6956,11 +7765,8 @@ async def cb_submit_rating(callback: CallbackQuery):
         await callback.answer("❌ Invalid rating value!", show_alert=True)
         return
 
-    # Load and save rating
-    ratings_data = load_list_from_json("ratings.json")
-    
     # Check for duplicate rating
-    if any(r.get('order_id') == order_id and r.get('user_id') == user_id for r in ratings_data):
+    if feedback_store.ratings.has_rated(order_id, user_id):
         await callback.answer("⭐ You have already rated this order!", show_alert=True)
         return
 
@@ -6975,8 +7781,10 @@ async def cb_submit_rating(callback: CallbackQuery):
         'service_name': orders_data.get(order_id, {}).get('package_name', 'unknown')
     }
     
-    ratings_data.append(rating_record)
-    save_data_to_json(ratings_data, "ratings.json")
+    # One appended line - the (order_id, user_id) index rejects a double tap
+    if not feedback_store.ratings.add(rating_record):
+        await callback.answer("⭐ You have already rated this order!", show_alert=True)
+        return
 
     # Get rating display
     star_display = "⭐" * rating
@@ -7126,9 +7934,6 @@ async def handle_feedback_text(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    # Load feedback data
-    feedback_data = load_list_from_json("feedback.json")
-    
     # Create feedback record
     feedback_record = {
         'feedback_id': f"FB-{int(time.time())}-{user_id}",
@@ -7141,8 +7946,7 @@ async def handle_feedback_text(message: Message, state: FSMContext):
         'user_name': users_data.get(user_id, {}).get('full_name', 'Unknown User')
     }
     
-    feedback_data.append(feedback_record)
-    save_data_to_json(feedback_data, "feedback.json")
+    feedback_store.feedback.append(feedback_record)
 
     # Clear FSM state
     await state.clear()
@@ -7275,18 +8079,19 @@ async def cb_admin_cancel_order(callback: CallbackQuery):
     print(f"✅ DEBUG: Cancel Order Step 1 - Parsed details: {customer_name}, {package_name}, ₹{total_price}")
 
     # Store parsed details in orders_data for step 2 to access
-    orders_data[order_id] = {
-        'order_id': order_id,
-        'user_id': customer_id,
-        'status': 'pending',
-        'package_name': package_name,
-        'total_price': total_price,
-        'customer_name': customer_name,  # Add customer name too
-        'parsed_from_message': True  # Flag to indicate this was parsed
-    }
+    async with customer_session(customer_id, order_id):
+        orders_data[order_id] = {
+            'order_id': order_id,
+            'user_id': customer_id,
+            'status': 'pending',
+            'package_name': package_name,
+            'total_price': total_price,
+            'customer_name': customer_name,  # Add customer name too
+            'parsed_from_message': True  # Flag to indicate this was parsed
+        }
 
-    # Save updated order data
-    save_data_to_json(orders_data, "orders.json")
+        # Save updated order data
+        save_order(order_id)
 
     # Show cancellation reason options with smart button format
     cancel_text = f"""
@@ -7388,54 +8193,55 @@ async def cb_admin_cancel_reason(callback: CallbackQuery):
     # Get order details from step 1 parsing (stored in orders_data)
     print(f"🔍 DEBUG: Cancel Order Step 2 - Getting parsed details from storage...")
 
-    if order_id in orders_data and orders_data[order_id].get('parsed_from_message'):
-        # Use parsed details from step 1
-        order = orders_data[order_id]
-        customer_name = order.get('customer_name', 'Customer')
-        package_name = order.get('package_name', 'Unknown Package')
-        total_price = order.get('total_price', 0.0)
-        print(f"✅ DEBUG: Cancel Order Step 2 - Using parsed details: {customer_name}, {package_name}, ₹{total_price}")
-    else:
-        # Fallback: try to find in existing orders
-        print(f"⚠️ DEBUG: Cancel Order Step 2 - Parsed details not found, using fallback")
-        if order_id in orders_data:
+    async with customer_session(customer_id, order_id):
+        if order_id in orders_data and orders_data[order_id].get('parsed_from_message'):
+            # Use parsed details from step 1
             order = orders_data[order_id]
-            customer_name = "Customer"
+            customer_name = order.get('customer_name', 'Customer')
             package_name = order.get('package_name', 'Unknown Package')
             total_price = order.get('total_price', 0.0)
+            print(f"✅ DEBUG: Cancel Order Step 2 - Using parsed details: {customer_name}, {package_name}, ₹{total_price}")
         else:
-            # Create minimal record
-            customer_name = "Customer"
-            package_name = "Unknown Package"
-            total_price = 0.0
-            orders_data[order_id] = {
-                'order_id': order_id,
-                'user_id': customer_id,
-                'status': 'pending',
-                'package_name': package_name,
-                'total_price': total_price
-            }
-
-    # Reason mapping
-    reason_messages = {
-        "invalid_link": "❌ Link provided is invalid or inaccessible",
-        "payment_issue": "💳 Payment verification failed or insufficient",
-        "service_unavailable": "📦 Requested service is temporarily unavailable",
-        "duplicate": "❌ Duplicate order detected",
-        "policy_violation": "🚫 Order violates our service policy",
-        "custom": "💬 Custom reason (contact support for details)"
-    }
+            # Fallback: try to find in existing orders
+            print(f"⚠️ DEBUG: Cancel Order Step 2 - Parsed details not found, using fallback")
+            if order_id in orders_data:
+                order = orders_data[order_id]
+                customer_name = "Customer"
+                package_name = order.get('package_name', 'Unknown Package')
+                total_price = order.get('total_price', 0.0)
+            else:
+                # Create minimal record
+                customer_name = "Customer"
+                package_name = "Unknown Package"
+                total_price = 0.0
+                orders_data[order_id] = {
+                    'order_id': order_id,
+                    'user_id': customer_id,
+                    'status': 'pending',
+                    'package_name': package_name,
+                    'total_price': total_price
+                }
+
+        # Reason mapping
+        reason_messages = {
+            "invalid_link": "❌ Link provided is invalid or inaccessible",
+            "payment_issue": "💳 Payment verification failed or insufficient",
+            "service_unavailable": "📦 Requested service is temporarily unavailable",
+            "duplicate": "❌ Duplicate order detected",
+            "policy_violation": "🚫 Order violates our service policy",
+            "custom": "💬 Custom reason (contact support for details)"
+        }
 
-    reason_message = reason_messages.get(reason_type, "Order cancelled by admin")
+        reason_message = reason_messages.get(reason_type, "Order cancelled by admin")
 
-    # Update order status
-    orders_data[order_id]['status'] = 'cancelled'
-    orders_data[order_id]['cancelled_at'] = datetime.now().isoformat()
-    orders_data[order_id]['cancelled_by_admin'] = user_id
-    orders_data[order_id]['cancellation_reason'] = reason_message
+        # Update order status
+        orders_data[order_id]['status'] = 'cancelled'
+        orders_data[order_id]['cancelled_at'] = datetime.now().isoformat()
+        orders_data[order_id]['cancelled_by_admin'] = user_id
+        orders_data[order_id]['cancellation_reason'] = reason_message
 
-    # Save updated order data to persistent storage
-    save_data_to_json(orders_data, "orders.json")
+        # Save updated order data to persistent storage
+        save_order(order_id)
 
     # Send cancellation message to customer
     customer_message = f"""
@@ -7594,9 +8400,11 @@ async def cb_admin_processing(callback: CallbackQuery):
     package_name = order['package_name']
 
     # Update order status
-    orders_data[order_id]['status'] = 'processing'
-    orders_data[order_id]['processing_started_at'] = datetime.now().isoformat()
-    orders_data[order_id]['processing_by_admin'] = user_id
+    async with customer_session(customer_id, order_id):
+        orders_data[order_id]['status'] = 'processing'
+        orders_data[order_id]['processing_started_at'] = datetime.now().isoformat()
+        orders_data[order_id]['processing_by_admin'] = user_id
+        save_order(order_id)
 
     # Send processing message to customer
     customer_message = f"""
@@ -7839,7 +8647,7 @@ async def on_admin_token_input(message: Message, state: FSMContext):
         })
         
         # Save to users.json file
-        save_users_data()
+        save_users_data(target_user_id)
         
         # Clear FSM state
         await state.clear()
@@ -8009,7 +8817,7 @@ async def handle_photo_input(message: Message):
         user_state[user_id]["current_step"] = None
 
         # Save updated user data to persistent storage
-        save_data_to_json(users_data, "users.json")
+        save_data_to_json(users_data, "users.json", user_id)
 
         text = """
 ✅ <b>Profile Photo Updated Successfully!</b>
@@ -8114,23 +8922,85 @@ async def on_startup():
     print("🚀 India Social Panel Bot starting...")
 
     # Load persistent data from JSON files
-    global users_data, orders_data, tickets_data
+    global users_data, orders_data, tickets_data, repository, database, offers_cache
+    global user_state, order_temp, shared_state
     print("📂 Loading persistent data...")
 
-    # Load users data with proper key conversion
-    users_data.update(load_users_data_from_json())
+    if STORAGE_BACKEND == "sqlite":
+        # Indexed SQLite tables - import JSON first with: python sqlite_store.py migrate
+        database = SQLiteRepository()
+        if LAZY_USER_CACHE or SHARED_STATE:
+            # Users are fetched per request (see preload_user) - nothing to bulk load
+            users_data = LazyUserCache(database, persistence.store)
+            print(f"🧠 Lazy user cache enabled ({users_data.max_size} resident users max)")
+        else:
+            users_data.update(await database.load_users())
+        if SHARED_STATE:
+            orders_data = LazyOrderCache(database, persistence.store)
+            user_state = SessionStateMap(database, "user_state")
+            order_temp = SessionStateMap(database, "order_temp")
+            storage.bind(database)
+            shared_state = SharedState(database, persistence.store, users_data, orders_data,
+                                       [user_state, order_temp])
+            print(f"🔗 Shared state enabled - worker {WORKER_INDEX + 1}/{WEB_WORKERS}")
+        else:
+            orders_data.update(await database.load_orders())
+        tickets_data.update(await database.load_tickets())
+        offers_cache = await database.load_offers()
+        database.attach(persistence.store, users_data)
+        print(f"🗄️ Using SQLite storage backend: {database.db_path}")
+    else:
+        # Load users data with proper key conversion
+        users_data.update(load_users_data_from_json())
+
+        # Load orders data - snapshot plus any journal entries written since the last compaction
+        loaded_orders = order_journal.journal.load()
+        if loaded_orders:
+            orders_data.update(loaded_orders)
+        if not ORDER_JOURNAL_ENABLED and order_journal.journal.entries_since_compaction:
+            # Journal left over from journal mode - fold it into orders.json once
+            order_journal.journal.compact(orders_data)
+
+        # Load tickets data
+        loaded_tickets = snapshot_format.load_with_snapshot("tickets.json", lambda: load_data_from_json("tickets.json"))
+        if loaded_tickets:
+            tickets_data.update(loaded_tickets)
+
+    if records.ENABLED:
+        # Swap per-record dicts for slotted records - new records stay dicts until next start
+        if isinstance(users_data, dict):
+            records.compact_records(users_data, records.UserRecord)
+        if isinstance(orders_data, dict):
+            records.compact_records(orders_data, records.OrderRecord)
+        print("🧱 Compact user/order records enabled")
+
+    if isinstance(users_data, dict):
+        # Everything is in memory - queries are answered from indexes kept in step with saves
+        repository.rebuild()
+    else:
+        # Lazy/shared mode - users live in the database, so do the queries
+        repository = database
+    persistence.store.add_listener("users.json", _reindex_saved_user)
+    if not SHARED_STATE:
+        # Every user/order change passes through this process - keep running admin counters
+        stats_aggregator.aggregator.rebuild(users_data, orders_data)
+        persistence.store.add_listener("users.json", _count_saved_user)
 
-    # Load orders data
-    loaded_orders = load_data_from_json("orders.json")
-    if loaded_orders:
-        orders_data.update(loaded_orders)
+    print(f"📊 Loaded {len(users_data)} users, {len(orders_data)} orders, {len(tickets_data)} tickets")
+    if snapshot_format.load_timings:
+        print(snapshot_format.format_load_report())
 
-    # Load tickets data
-    loaded_tickets = load_data_from_json("tickets.json")
-    if loaded_tickets:
-        tickets_data.update(loaded_tickets)
+    # Ratings/feedback - list files plus append logs, shared by every worker in shared-state mode
+    feedback_store.ratings.load(shared=SHARED_STATE, primary=WORKER_INDEX == 0)
+    feedback_store.feedback.load(shared=SHARED_STATE, primary=WORKER_INDEX == 0)
+    broadcast_jobs.jobs.load()
+    broadcast_jobs.jobs.init(bot, mark_undeliverable, build_offer_message,
+                             forward=SHARED_STATE and WORKER_INDEX > 0)
 
-    print(f"📊 Loaded {len(users_data)} users, {len(orders_data)} orders, {len(tickets_data)} tickets")
+    # Start background flusher for write-behind saves
+    persistence.store.start()
+    if ORDER_JOURNAL_ENABLED and database is None:
+        order_journal.journal.start_compactor(orders_data)
 
     # Initialize all handlers now that dp is available
     print("🔄 Initializing account handlers...")
@@ -8153,6 +9023,20 @@ async def on_startup():
     print("🔄 Initializing service system...")
     services.register_service_handlers(dp, require_account)
 
+    if WORKER_INDEX > 0:
+        # Commands and webhook are registered once, by the primary worker
+        print(f"✅ Worker {WORKER_INDEX} ready")
+        return
+
+    # Broadcasts interrupted by the last shutdown carry on from their checkpoints
+    resumed = broadcast_jobs.jobs.resume_all()
+    if resumed:
+        print(f"🔁 Resumed {resumed} broadcast job(s)")
+    if SHARED_STATE:
+        # Other workers hand new jobs and pause/resume/cancel requests over through files
+        asyncio.create_task(broadcast_jobs.jobs.control_loop())
+    asyncio.create_task(reprobe_undeliverable())
+
     # Set bot commands - Enhanced professional menu with detailed descriptions
     commands = [
         BotCommand(command="start", description="🚀 Launch Dashboard & Access All Features"),
@@ -8223,6 +9107,21 @@ async def health_check(request):
 
 async def main():
     """Main function to start the bot with webhook"""
+    try:
+        await run_bot()
+    finally:
+        # Checkpoint broadcast jobs where they stopped, then write out any saves still queued
+        await broadcast_jobs.jobs.stop()
+        await persistence.store.stop()
+        if ORDER_JOURNAL_ENABLED and database is None:
+            await order_journal.journal.stop(orders_data)
+        await feedback_store.ratings.close()
+        await feedback_store.feedback.close()
+        if database is not None:
+            await database.close()
+
+async def run_bot():
+    """Start the bot in webhook or polling mode"""
     await on_startup()
 
     if WEBHOOK_MODE:
@@ -8247,7 +9146,8 @@ async def main():
         # Use AppRunner for async context
         runner = web.AppRunner(app)
         await runner.setup()
-        site = web.TCPSite(runner, host=WEB_SERVER_HOST, port=WEB_SERVER_PORT)
+        # Workers share the port - the kernel spreads connections across them
+        site = web.TCPSite(runner, host=WEB_SERVER_HOST, port=WEB_SERVER_PORT, reuse_port=WEB_WORKERS > 1)
         await site.start()
         print(f"✅ Webhook server started on {WEB_SERVER_HOST}:{WEB_SERVER_PORT}")
 
@@ -8259,8 +9159,38 @@ async def main():
         asyncio.run(dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types()))
 
 
+def _run_worker(index: int) -> None:
+    """Entry point of an extra webhook worker process (WEB_WORKERS > 1)"""
+    global WORKER_INDEX
+    WORKER_INDEX = index
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+def start_workers() -> list:
+    """Start WEB_WORKERS - 1 extra processes; this process stays the primary worker"""
+    if WEB_WORKERS <= 1:
+        return []
+    if not (SHARED_STATE and WEBHOOK_MODE):
+        print("⚠️ WEB_WORKERS > 1 needs SHARED_STATE=1 and webhook mode - running a single worker")
+        return []
+    import multiprocessing
+    workers = []
+    for index in range(1, WEB_WORKERS):
+        # Set for spawn-started children, which read it on import
+        os.environ["WORKER_INDEX"] = str(index)
+        worker = multiprocessing.Process(target=_run_worker, args=(index,), name=f"isp-worker-{index}")
+        worker.start()
+        workers.append(worker)
+    os.environ["WORKER_INDEX"] = "0"
+    print(f"👥 Started {len(workers)} extra webhook workers")
+    return workers
+
+
 if __name__ == "__main__":
     """Entry point - exactly like working bot"""
+    workers = start_workers()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -8268,4 +9198,14 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"❌ Critical error: {e}")
         import traceback
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+    finally:
+        import signal
+        for worker in workers:
+            # SIGINT lets the worker's main() flush pending writes before exiting
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGINT)
+        for worker in workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                worker.terminate()
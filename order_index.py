@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Order Indexes
+Per-user order ID lists over orders_data, kept in created_at order, so per-user queries
+cost O(orders of that user) instead of a scan of every order
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from itertools import count
+from typing import Dict, Any, List, Optional, Tuple
+
+
+def _owner_id(order: Dict[str, Any]) -> Optional[int]:
+    """user_id, or customer_id on legacy records, as an int"""
+    owner = order.get('user_id') or order.get('customer_id')
+    try:
+        return int(owner) if owner is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _sort_key(order_id: str, order: Dict[str, Any]) -> Tuple[str, str]:
+    created_at = order.get('created_at')
+    return (created_at if isinstance(created_at, str) else "", order_id)
+
+
+def _platform(order: Dict[str, Any]) -> str:
+    return str(order.get('platform') or 'unknown').lower()
+
+
+class OrderIndex:
+    """user_id -> [(created_at, order_id), ...] oldest first, updated on every order save"""
+
+    def __init__(self):
+        self.by_user: Dict[int, List[Tuple[str, str]]] = {}
+        # order_id -> (owner, sort key, platform) currently indexed for that order
+        self._entries: Dict[str, Tuple[int, Tuple[str, str], str]] = {}
+        # platform -> user_id -> orders on that platform (audience segments)
+        self.platform_users: Dict[str, Counter] = {}
+        # user_id -> change version, drawn from one counter so a version is never reused
+        self.versions: Dict[int, int] = {}
+        self._clock = count(1)
+        self._generation = 0
+
+    def rebuild(self, orders: Dict[str, Dict[str, Any]]) -> None:
+        """Index every order - called once after orders_data is loaded"""
+        self.by_user.clear()
+        self._entries.clear()
+        self.platform_users.clear()
+        self.versions.clear()
+        # Anything rendered before the rebuild is stale
+        self._generation = next(self._clock)
+        for order_id, order in orders.items():
+            owner = _owner_id(order)
+            if owner is None:
+                continue
+            entry = _sort_key(order_id, order)
+            platform = _platform(order)
+            self.by_user.setdefault(owner, []).append(entry)
+            self._entries[order_id] = (owner, entry, platform)
+            self.platform_users.setdefault(platform, Counter())[owner] += 1
+        for entries in self.by_user.values():
+            entries.sort()
+        print(f"🔎 Order index built: {len(self._entries)} orders across {len(self.by_user)} users")
+
+    def update(self, order_id: str, order: Optional[Dict[str, Any]]) -> None:
+        """Re-index one order after an insert or status change (None = deleted)"""
+        owner = _owner_id(order) if order else None
+        entry = _sort_key(order_id, order) if order else None
+        platform = _platform(order) if order else None
+        indexed = self._entries.get(order_id)
+        for user_id in {owner, indexed[0] if indexed else None} - {None}:
+            self.versions[user_id] = next(self._clock)
+        if indexed == (owner, entry, platform):
+            # Status changes keep owner, created_at and platform - nothing moves
+            return
+        self.remove(order_id)
+        if owner is None:
+            return
+        insort(self.by_user.setdefault(owner, []), entry)
+        self._entries[order_id] = (owner, entry, platform)
+        self.platform_users.setdefault(platform, Counter())[owner] += 1
+
+    def remove(self, order_id: str) -> None:
+        indexed = self._entries.pop(order_id, None)
+        if indexed is None:
+            return
+        owner, entry, platform = indexed
+        entries = self.by_user.get(owner, [])
+        if entry in entries:
+            entries.remove(entry)
+        if not entries:
+            self.by_user.pop(owner, None)
+        users = self.platform_users.get(platform)
+        if users is not None:
+            users[owner] -= 1
+            if users[owner] <= 0:
+                del users[owner]
+            if not users:
+                del self.platform_users[platform]
+
+    def order_ids(self, user_id: int) -> List[str]:
+        """One user's order IDs, newest first"""
+        return [order_id for _created_at, order_id in reversed(self.by_user.get(user_id, []))]
+
+    def page(self, user_id: int, older_than: Optional[str] = None, newer_than: Optional[str] = None,
+             limit: int = 10) -> Dict[str, Any]:
+        """One page of a user's order IDs, newest first, next to a cursor order ID (none = newest page)"""
+        entries = self.by_user.get(user_id, [])
+        cursor = self._entries.get(older_than or newer_than or "")
+        if cursor is None or cursor[0] != user_id:
+            # Unknown or foreign cursor - start from the newest orders
+            start, end = max(len(entries) - limit, 0), len(entries)
+        elif older_than:
+            end = bisect_left(entries, cursor[1])
+            start = max(end - limit, 0)
+        else:
+            start = bisect_right(entries, cursor[1])
+            end = min(start + limit, len(entries))
+        return {
+            'order_ids': [order_id for _created_at, order_id in reversed(entries[start:end])],
+            'total': len(entries),
+            'offset': len(entries) - end,
+            'has_newer': end < len(entries),
+            'has_older': start > 0,
+        }
+
+    def version(self, user_id: int) -> int:
+        """Changes whenever one of the user's orders is inserted, updated or deleted"""
+        return self.versions.get(user_id, self._generation)
+
+    def count(self, user_id: int) -> int:
+        return len(self.by_user.get(user_id, ()))
+
+    def platform_user_ids(self, platform: str) -> set:
+        """Users with at least one order on platform"""
+        return set(self.platform_users.get(platform.lower(), ()))
+
+
+# Shared index over main.orders_data
+index = OrderIndex()
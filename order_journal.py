@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Order Journal
+Append-only log of order changes, folded into orders.json by a background compactor
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Any, Optional
+
+import persistence
+import records
+import snapshot_format
+
+# Compact once this many entries have piled up in the log...
+COMPACT_EVERY_ENTRIES = int(os.getenv("ORDER_JOURNAL_COMPACT_ENTRIES", "500"))
+# ...and check at this interval (seconds)
+COMPACT_INTERVAL = float(os.getenv("ORDER_JOURNAL_COMPACT_INTERVAL", "300"))
+
+
+class OrderJournal:
+    """Orders snapshot plus an append-only JSON-lines log of changes since it"""
+
+    def __init__(self, snapshot_path: str = "orders.json", log_path: str = "orders.journal"):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self._log_file = None
+        self._task: Optional[asyncio.Task] = None
+        self.entries_since_compaction = 0
+        self.last_compaction_at: Optional[float] = None
+
+    # ========== WRITES ==========
+    def append(self, order_id: str, record: Optional[Dict[str, Any]]) -> None:
+        """Append one order create/update (or delete when record is None) - O(1)"""
+        entry = {"ts": time.time(), "order_id": order_id}
+        if record is None:
+            entry["op"] = "delete"
+        else:
+            entry["op"] = "put"
+            entry["order"] = record
+
+        if self._log_file is None:
+            self._log_file = self._open_log()
+        self._log_file.write(json.dumps(entry, ensure_ascii=False, default=records.json_default) + "\n")
+        self._log_file.flush()
+        if persistence.FSYNC_POLICY == "always":
+            os.fsync(self._log_file.fileno())
+        self.entries_since_compaction += 1
+
+    def _open_log(self):
+        """Open the log for appending, terminating a torn last line first"""
+        log_file = open(self.log_path, 'a+', encoding='utf-8')
+        if log_file.tell() > 0:
+            log_file.seek(log_file.tell() - 1)
+            if log_file.read(1) != "\n":
+                log_file.write("\n")
+        return log_file
+
+    def compact(self, orders: Dict[str, Dict[str, Any]]) -> None:
+        """Fold the log into a fresh snapshot of orders, then truncate the log - blocking, for startup"""
+        started = time.perf_counter()
+        persistence.write_json_file(orders, self.snapshot_path)
+        # Snapshot now covers every logged change - start a new log
+        self._drop_folded(self._log_size())
+        self._compacted(len(orders), self.entries_since_compaction, started)
+
+    async def compact_async(self, orders: Dict[str, Dict[str, Any]]) -> None:
+        """compact() with orders snapshotted on the loop and written on the I/O thread"""
+        started = time.perf_counter()
+        # Measured together with the snapshot - appends made during the write land past offset
+        offset, folded, count = self._log_size(), self.entries_since_compaction, len(orders)
+        await persistence.write_json_async(orders, self.snapshot_path)
+        self._drop_folded(offset)
+        self._compacted(count, folded, started)
+
+    def _log_size(self) -> int:
+        if self._log_file is not None:
+            self._log_file.flush()
+        return os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+
+    def _drop_folded(self, offset: int) -> None:
+        """Drop the log lines before offset - a crash before this only replays puts/deletes the snapshot has"""
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+        tail = b""
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                f.seek(offset)
+                tail = f.read()
+        if tail:
+            persistence.atomic_write(self.log_path, lambda f: f.write(tail), binary=True)
+        else:
+            open(self.log_path, 'w').close()
+
+    def _compacted(self, orders: int, folded: int, started: float) -> None:
+        self.entries_since_compaction -= folded
+        self.last_compaction_at = time.time()
+        print(f"🗜️ Order journal compacted into {self.snapshot_path} "
+              f"({orders} orders, {(time.perf_counter() - started) * 1000:.1f}ms)")
+
+    # ========== STARTUP ==========
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Load the snapshot and replay the log tail on top of it"""
+        orders = snapshot_format.load_with_snapshot(self.snapshot_path, self._load_json_snapshot)
+
+        replayed = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn final line from a crash mid-append
+                        print("⚠️ Skipping corrupt order journal entry")
+                        continue
+                    order_id = entry.get("order_id")
+                    if entry.get("op") == "delete":
+                        orders.pop(order_id, None)
+                    elif order_id is not None:
+                        orders[order_id] = entry.get("order", {})
+                    replayed += 1
+
+        self.entries_since_compaction = replayed
+        print(f"✅ Orders loaded from {self.snapshot_path} + {replayed} journal entries")
+        return orders
+
+    def _load_json_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            return persistence.load_json_recovering(self.snapshot_path, None) or {}
+        except Exception as e:
+            print(f"❌ Error loading order snapshot {self.snapshot_path}: {e}")
+            return {}
+
+    # ========== BACKGROUND COMPACTOR ==========
+    def start_compactor(self, orders: Dict[str, Dict[str, Any]]) -> None:
+        """Start periodic compaction of the log into the snapshot"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(orders))
+
+    async def _run(self, orders: Dict[str, Dict[str, Any]]) -> None:
+        while True:
+            await asyncio.sleep(COMPACT_INTERVAL)
+            if self.entries_since_compaction >= COMPACT_EVERY_ENTRIES:
+                try:
+                    await self.compact_async(orders)
+                except Exception as e:
+                    print(f"❌ Order journal compaction failed: {e}")
+
+    async def stop(self, orders: Dict[str, Dict[str, Any]]) -> None:
+        """Stop the compactor and leave a compacted snapshot behind"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.entries_since_compaction:
+            await self.compact_async(orders)
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+
+# Shared journal for orders.json
+journal = OrderJournal()
@@ -534,7 +534,7 @@ def register_payment_handlers(main_dp, main_users_data, main_user_state, main_fo
 
             # Skip screenshot step - directly complete the order
             # Import required functions and data from main module
-            from main import orders_data, send_admin_notification, generate_order_id
+            from main import orders_data, send_admin_notification, generate_order_id, save_order, flush_persistent_data
             
             # Generate order ID
             order_id = generate_order_id()
@@ -557,6 +557,8 @@ def register_payment_handlers(main_dp, main_users_data, main_user_state, main_fo
 
             # Store the final order in orders_data
             orders_data[order_id] = order_record
+            save_order(order_id)
+            await flush_persistent_data()
 
             # Send notification to admin group (without screenshot)
             await send_admin_notification(order_record, photo_file_id=None)
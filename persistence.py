@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Write-Behind Persistence
+Coalesces JSON saves and flushes them from a background task, with
+serialization and file I/O running in a thread pool off the event loop
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, Set
+
+import records
+import snapshot_format
+
+# Seconds to wait after the first dirty mark before writing, so bursts of
+# balance/profile updates end up as a single file write
+FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "2.0"))
+
+# When writes are forced to disk: "always" (file + directory entry), "data" (file only) or "off"
+FSYNC_POLICY = os.getenv("PERSIST_FSYNC", "always").lower()
+
+# Older versions of each JSON file kept as <file>.1 (newest) ... <file>.N for crash recovery
+GENERATIONS = int(os.getenv("PERSIST_GENERATIONS", "3"))
+
+# Threads that run json.dump/json.load so handlers never block on disk
+io_executor = ThreadPoolExecutor(max_workers=int(os.getenv("PERSIST_IO_THREADS", "2")),
+                                 thread_name_prefix="json-io")
+
+# One lock per file - writers of the same file never interleave
+_file_locks: Dict[str, threading.Lock] = {}
+_file_locks_guard = threading.Lock()
+
+
+def _file_lock(filename: str) -> threading.Lock:
+    with _file_locks_guard:
+        return _file_locks.setdefault(os.path.abspath(filename), threading.Lock())
+
+
+def snapshot(data: Any) -> Any:
+    """Copy nested dicts/lists so a worker thread can serialize while the loop mutates the original"""
+    if isinstance(data, (dict, records.UserRecord, records.OrderRecord)):
+        return {key: snapshot(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [snapshot(value) for value in data]
+    return data
+
+
+# ========== CRASH-SAFE FILE WRITES ==========
+def generation_path(filename: str, generation: int) -> str:
+    """users.json for generation 0, users.json.1 for the previous version, and so on"""
+    return filename if generation == 0 else f"{filename}.{generation}"
+
+
+def _fsync_directory(path: str) -> None:
+    """Persist the directory entry so a completed rename survives a power loss"""
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # Not supported on this platform (e.g. Windows)
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def _rotate_generations(filename: str, generations: int) -> None:
+    """Shift filename -> .1 -> .2 ... dropping the oldest"""
+    for generation in range(generations, 1, -1):
+        older = generation_path(filename, generation - 1)
+        if os.path.exists(older):
+            os.replace(older, generation_path(filename, generation))
+    if os.path.exists(filename):
+        os.replace(filename, generation_path(filename, 1))
+
+
+def atomic_write(path: str, write: Callable[[Any], None], binary: bool = False,
+                 generations: int = 0) -> None:
+    """Write through a temp file and rename it over path, so readers never see a torn file
+
+    The temp file is fsynced before the rename per FSYNC_POLICY; when generations > 0 the
+    replaced version is kept as path.1 and older ones shift up to path.<generations>.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb' if binary else 'w', encoding=None if binary else 'utf-8') as f:
+        write(f)
+        f.flush()
+        if FSYNC_POLICY != "off":
+            os.fsync(f.fileno())
+    if generations > 0:
+        _rotate_generations(path, generations)
+    os.replace(tmp_path, path)
+    if FSYNC_POLICY == "always":
+        _fsync_directory(path)
+
+
+def load_json_recovering(filename: str, default: Any) -> Any:
+    """Load filename, falling back to the newest older generation that still parses"""
+    for generation in range(GENERATIONS + 1):
+        path = generation_path(filename, generation)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (ValueError, OSError) as e:
+            print(f"⚠️ {path} is unreadable ({e}) - trying an older generation")
+            continue
+        if generation:
+            print(f"♻️ Recovered {filename} from {path}")
+        return data
+    return default
+
+
+def write_json_file(data: Any, filename: str) -> None:
+    """Serialize data to a JSON file atomically, keeping older generations (blocking)"""
+    with _file_lock(filename):
+        atomic_write(
+            filename,
+            lambda f: json.dump(data, f, indent=2, ensure_ascii=False, default=records.json_default),
+            generations=GENERATIONS,
+        )
+        # Binary snapshot written after the JSON so it is never older than it
+        snapshot_format.maybe_write_snapshot(data, filename)
+
+
+def read_json_file(filename: str, default: Any) -> Any:
+    """Load a JSON file (or its newest valid generation), default when none exists (blocking)"""
+    with _file_lock(filename):
+        return load_json_recovering(filename, default)
+
+
+async def write_json_async(data: Any, filename: str) -> None:
+    """Snapshot data on the loop, then serialize and write it in the I/O pool"""
+    frozen = snapshot(data)
+    await asyncio.get_running_loop().run_in_executor(io_executor, write_json_file, frozen, filename)
+
+
+async def read_json_async(filename: str, default: Any) -> Any:
+    """Read a JSON file in the I/O pool, preferring data still queued for writing"""
+    while True:
+        pending = store.pending_data(filename)
+        if pending is not None:
+            return pending
+        version = store.version(filename)
+        data = await asyncio.get_running_loop().run_in_executor(io_executor, read_json_file, filename, default)
+        # A save landed while we were reading - the file (or queue) is newer, read again
+        if store.version(filename) == version:
+            return data
+
+
+class WriteBehindStore:
+    """Tracks dirty files and records and writes them out in coalesced batches"""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        # filename -> live data object to serialize at flush time
+        self._pending: Dict[str, Any] = {}
+        # filename -> record keys touched since the last flush
+        self._dirty_keys: Dict[str, Set[Any]] = {}
+        # filename -> sink(data, dirty_keys) replacing the JSON file write (e.g. SQLite)
+        self._sinks: Dict[str, Callable[[Any, Set[Any]], None]] = {}
+        # filename -> listeners(data, key) told about every keyed save (e.g. lookup indexes)
+        self._listeners: Dict[str, List[Callable[[Any, Any], None]]] = {}
+        # filename -> data currently being written by a flush
+        self._inflight: Dict[str, Any] = {}
+        # filename -> number of saves so far (lets async readers detect a racing save)
+        self._versions: Dict[str, int] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters for the admin panel / logs
+        self.flush_count = 0
+        self.coalesced_count = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_duration = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def mark_dirty(self, filename: str, data: Any, key: Any = None) -> None:
+        """Schedule data for writing to filename; key marks the touched record"""
+        if filename in self._pending:
+            self.coalesced_count += 1
+        self._pending[filename] = data
+        self._versions[filename] = self._versions.get(filename, 0) + 1
+        if key is not None:
+            self._dirty_keys.setdefault(filename, set()).add(key)
+            for listener in self._listeners.get(filename, ()):
+                try:
+                    listener(data, key)
+                except Exception as e:
+                    print(f"❌ Save listener for {filename} failed: {e}")
+
+        if not self.running:
+            # No background flusher (startup, scripts) - write through
+            self.flush_sync()
+            return
+
+        if self._wakeup:
+            self._wakeup.set()
+
+    def register_sink(self, filename: str, sink: Callable[[Any, Set[Any]], None]) -> None:
+        """Route flushes of filename to sink(data, dirty_keys) instead of the JSON file"""
+        self._sinks[filename] = sink
+
+    def add_listener(self, filename: str, listener: Callable[[Any, Any], None]) -> None:
+        """Call listener(data, key) whenever a record of filename is saved with its key"""
+        self._listeners.setdefault(filename, []).append(listener)
+
+    def pending_data(self, filename: str) -> Any:
+        """Return data queued (or being written) for filename but not yet on disk, or None"""
+        if filename in self._pending:
+            return self._pending[filename]
+        return self._inflight.get(filename)
+
+    def version(self, filename: str) -> int:
+        """Number of saves queued for filename so far"""
+        return self._versions.get(filename, 0)
+
+    def dirty_keys(self, filename: str) -> Set[Any]:
+        """Return the record keys marked dirty for filename since the last flush"""
+        return set(self._dirty_keys.get(filename, ()))
+
+    def start(self) -> None:
+        """Start the background flusher on the running event loop"""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        print(f"💾 Write-behind persistence started (window: {self.flush_interval}s)")
+        if self._pending:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Coalescing window - every save in this period is folded into one write
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Write-behind flush failed: {e}")
+
+    def _take_pending(self):
+        pending = self._pending
+        dirty_keys = self._dirty_keys
+        self._pending = {}
+        self._dirty_keys = {}
+        return pending, dirty_keys
+
+    def _requeue(self, filename: str, data: Any, keys: Set[Any]) -> None:
+        """Keep a failed write pending, with its dirty keys, so the next flush retries it"""
+        self._pending.setdefault(filename, data)
+        if keys:
+            self._dirty_keys.setdefault(filename, set()).update(keys)
+
+    def _finish_flush(self, started: float) -> None:
+        self.flush_count += 1
+        self.last_flush_at = time.time()
+        self.last_flush_duration = time.perf_counter() - started
+
+    def flush_sync(self) -> None:
+        """Write every pending file now on the calling thread (no loop / shutdown)"""
+        if not self._pending:
+            return
+
+        pending, dirty_keys = self._take_pending()
+        started = time.perf_counter()
+        for filename, data in pending.items():
+            try:
+                sink = self._sinks.get(filename)
+                if sink:
+                    sink(data, dirty_keys.get(filename, set()))
+                else:
+                    write_json_file(data, filename)
+                    print(f"✅ Data saved to {filename}")
+            except Exception as e:
+                print(f"❌ Error saving data to {filename}: {e}")
+                self._requeue(filename, data, dirty_keys.get(filename, set()))
+        self._finish_flush(started)
+
+    async def flush(self) -> None:
+        """Write every pending file now - used on shutdown and payment paths"""
+        if not self._pending:
+            return
+
+        pending, dirty_keys = self._take_pending()
+        started = time.perf_counter()
+        self._inflight.update(pending)
+        writes = []
+        for filename, data in pending.items():
+            sink = self._sinks.get(filename)
+            if sink:
+                try:
+                    sink(data, dirty_keys.get(filename, set()))
+                except Exception as e:
+                    print(f"❌ Error saving data to {filename}: {e}")
+                    self._requeue(filename, data, dirty_keys.get(filename, set()))
+            else:
+                writes.append((filename, data, write_json_async(data, filename)))
+
+        # Files are written concurrently; each one is serialized by its own lock
+        try:
+            results = await asyncio.gather(*(write for _, _, write in writes), return_exceptions=True)
+        except asyncio.CancelledError:
+            # Shutdown mid-flush - requeue so stop() writes these synchronously
+            for filename, data in pending.items():
+                self._requeue(filename, data, dirty_keys.get(filename, set()))
+            raise
+        finally:
+            for filename, data in pending.items():
+                if self._inflight.get(filename) is data:
+                    del self._inflight[filename]
+        for (filename, data, _), result in zip(writes, results):
+            if isinstance(result, Exception):
+                print(f"❌ Error saving data to {filename}: {result}")
+                self._requeue(filename, data, dirty_keys.get(filename, set()))
+            else:
+                print(f"✅ Data saved to {filename}")
+        self._finish_flush(started)
+
+    async def stop(self) -> None:
+        """Stop the background flusher and write out anything still pending"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush_sync()
+
+
+def _format_age(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    return f"{seconds / 3600:.1f}h"
+
+
+def storage_status_text(filenames: List[str]) -> str:
+    """Last flush latency and the age of each file on disk, for the admin panel"""
+    if store.last_flush_at is None:
+        flush_line = "• Last Flush: <b>none yet</b>"
+    else:
+        flush_line = (f"• Last Flush: <b>{store.last_flush_duration * 1000:.1f}ms</b> "
+                      f"({_format_age(time.time() - store.last_flush_at)} ago, {store.flush_count} total)")
+    lines = [flush_line]
+    now = time.time()
+    for filename in filenames:
+        if os.path.exists(filename):
+            age = _format_age(now - os.path.getmtime(filename))
+            lines.append(f"• {filename} Snapshot Age: <b>{age}</b>")
+        else:
+            lines.append(f"• {filename} Snapshot Age: <b>not written</b>")
+    return "\n".join(lines)
+
+
+# Shared store used by every module that persists data
+store = WriteBehindStore()
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Compact Records
+Slotted user/order records with a dict-compatible interface, used in place of the
+per-record dicts in users_data / orders_data when COMPACT_RECORDS=1
+"""
+
+import os
+import sys
+from collections.abc import MutableMapping
+from enum import Enum
+from typing import Dict, Any, Iterator, Optional
+
+# Convert loaded users/orders into slotted records at startup (COMPACT_RECORDS=1)
+ENABLED = os.getenv("COMPACT_RECORDS", "0") == "1"
+
+_MISSING = object()
+
+
+# ========== INTERNED VALUES ==========
+class _Choice(str, Enum):
+    """String enum that still compares, formats and serializes as its plain value"""
+
+    __str__ = str.__str__
+    __format__ = str.__format__
+
+
+class OrderStatus(_Choice):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+    PARTIAL = "partial"
+    REFUNDED = "refunded"
+
+
+class UserStatus(_Choice):
+    ACTIVE = "active"
+    INACTIVE = "inactive"
+    BLOCKED = "blocked"
+    BANNED = "banned"
+
+
+class PaymentMethod(_Choice):
+    ACCOUNT_BALANCE = "Account Balance"
+    QR_SCREENSHOT = "QR Code Screenshot"
+    UPI = "UPI"
+
+
+class PaymentStatus(_Choice):
+    PENDING = "pending"
+    PENDING_VERIFICATION = "pending_verification"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+def intern_choice(value: Any, choices: type) -> Any:
+    """Shared enum member for known values, an interned string for anything else"""
+    if not isinstance(value, str) or isinstance(value, Enum):
+        return value
+    try:
+        return choices(value)
+    except ValueError:
+        return sys.intern(value)
+
+
+def _intern_str(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+# ========== RECORD BASE ==========
+class _Record(MutableMapping):
+    """Fixed fields in __slots__, anything else in a lazily created overflow dict"""
+
+    __slots__ = ("_extra",)
+    FIELDS: tuple = ()
+    # field -> normalizer applied on assignment (enum/intern)
+    NORMALIZERS: Dict[str, Any] = {}
+    _FIELD_SET: frozenset = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None, **kwargs):
+        self._extra = None
+        for field in self.FIELDS:
+            object.__setattr__(self, field, _MISSING)
+        if data:
+            self.update(data)
+        if kwargs:
+            self.update(kwargs)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_Record":
+        return data if isinstance(data, cls) else cls(data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def copy(self) -> "_Record":
+        return type(self)(self)
+
+    def __reduce__(self):
+        return (type(self), (self.to_dict(),))
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        elif self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self._FIELD_SET:
+            normalize = self.NORMALIZERS.get(key)
+            object.__setattr__(self, key, normalize(value) if normalize else value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[sys.intern(key) if type(key) is str else key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in self._FIELD_SET and getattr(self, key) is not _MISSING:
+            object.__setattr__(self, key, _MISSING)
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for field in self.FIELDS:
+            if getattr(self, field) is not _MISSING:
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        count = sum(1 for field in self.FIELDS if getattr(self, field) is not _MISSING)
+        return count + (len(self._extra) if self._extra else 0)
+
+    def __contains__(self, key: Any) -> bool:
+        if key in self._FIELD_SET:
+            return getattr(self, key) is not _MISSING
+        return bool(self._extra) and key in self._extra
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # Hot path in handlers - avoid the KeyError round trip of Mapping.get
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        if self._extra:
+            return self._extra.get(key, default)
+        return default
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (dict, _Record)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+# ========== RECORD TYPES ==========
+class UserRecord(_Record):
+    """One entry of users_data"""
+
+    FIELDS = (
+        "user_id", "username", "first_name", "last_name", "language_code", "is_premium",
+        "join_date", "account_created", "full_name", "phone_number", "email", "balance",
+        "total_spent", "orders_count", "referral_code", "referred_by", "access_token",
+        "api_key", "status", "profile_photo",
+    )
+    __slots__ = FIELDS
+    NORMALIZERS = {
+        "status": lambda value: intern_choice(value, UserStatus),
+        "language_code": _intern_str,
+    }
+
+
+class OrderRecord(_Record):
+    """One entry of orders_data"""
+
+    FIELDS = (
+        "order_id", "user_id", "customer_id", "package_name", "service_id", "platform",
+        "link", "quantity", "total_price", "status", "created_at", "payment_method",
+        "payment_status",
+    )
+    __slots__ = FIELDS
+    NORMALIZERS = {
+        "status": lambda value: intern_choice(value, OrderStatus),
+        "payment_method": lambda value: intern_choice(value, PaymentMethod),
+        "payment_status": lambda value: intern_choice(value, PaymentStatus),
+        "platform": _intern_str,
+        "package_name": _intern_str,
+        "service_id": _intern_str,
+    }
+
+
+# ========== CONVERSION ==========
+def compact_records(mapping: Dict[Any, Any], record_type: type) -> int:
+    """Replace the plain dict values of mapping with record_type instances in place"""
+    converted = 0
+    for key, value in list(mapping.items()):
+        if isinstance(value, dict):
+            mapping[key] = record_type(value)
+            converted += 1
+    return converted
+
+
+def json_default(value: Any) -> Any:
+    """json/msgpack default hook - records serialize as plain dicts"""
+    if isinstance(value, _Record):
+        return value.to_dict()
+    return str(value)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Referral Graph
+Referral code -> user index, referrer -> referees lists and per-referrer counters
+(referrals, created accounts, referred spend), kept in step with users_data saves
+"""
+
+import random
+import string
+from typing import Dict, Any, List, Optional, Tuple
+
+CODE_PREFIX = "ISP"
+CODE_LENGTH = 6
+# (referral code, referred_by, account_created, total_spent)
+Contribution = Tuple[Optional[str], Optional[int], bool, float]
+
+
+def normalize_code(code: Any) -> Optional[str]:
+    if not code or not isinstance(code, str):
+        return None
+    code = code.strip().upper()
+    return code if code.startswith(CODE_PREFIX) else None
+
+
+def random_code() -> str:
+    """Random ISPXXXXXX code - check it against the repository before handing it out"""
+    return f"{CODE_PREFIX}{''.join(random.choices(string.ascii_uppercase + string.digits, k=CODE_LENGTH))}"
+
+
+def _user_id(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _contribution(user: Dict[str, Any]) -> Contribution:
+    try:
+        spent = float(user.get('total_spent', 0.0) or 0.0)
+    except (TypeError, ValueError):
+        spent = 0.0
+    return (normalize_code(user.get('referral_code')), _user_id(user.get('referred_by')),
+            bool(user.get('account_created', False)), spent)
+
+
+class ReferralGraph:
+    """code -> user_id, referrer -> [referee, ...] in sign-up order, and running per-referrer counters"""
+
+    def __init__(self):
+        self.by_code: Dict[str, int] = {}
+        self.referees: Dict[int, List[int]] = {}
+        # referrer -> [referrals, referees with an account, referees' total spend]
+        self.counters: Dict[int, List[float]] = {}
+        self._users: Dict[int, Contribution] = {}
+        self.conflicts = 0
+
+    def rebuild(self, users) -> None:
+        """Index every user - called once after users_data is loaded"""
+        self.by_code.clear()
+        self.referees.clear()
+        self.counters.clear()
+        self._users.clear()
+        self.conflicts = 0
+        for user_id, user in users.items():
+            self.update(user_id, user)
+        print(f"🤝 Referral graph built: {len(self.by_code)} codes, "
+              f"{sum(len(referees) for referees in self.referees.values())} referrals"
+              + (f" ({self.conflicts} duplicate codes skipped)" if self.conflicts else ""))
+
+    def _apply(self, user_id: int, contribution: Contribution, sign: int) -> None:
+        code, referrer, created, spent = contribution
+        if code is not None:
+            if sign > 0:
+                owner = self.by_code.get(code)
+                if owner is not None and owner != user_id:
+                    # First account keeps the code - new codes are checked with taken()
+                    self.conflicts += 1
+                    print(f"⚠️ Referral code {code} already belongs to user {owner} - not indexed for user {user_id}")
+                else:
+                    self.by_code[code] = user_id
+            elif self.by_code.get(code) == user_id:
+                del self.by_code[code]
+        if referrer is None or referrer == user_id:
+            return
+        referees = self.referees.setdefault(referrer, [])
+        counters = self.counters.setdefault(referrer, [0, 0, 0.0])
+        if sign > 0:
+            referees.append(user_id)
+        elif user_id in referees:
+            referees.remove(user_id)
+        counters[0] += sign
+        counters[1] += sign * created
+        counters[2] += sign * spent
+        if not referees:
+            del self.referees[referrer]
+            del self.counters[referrer]
+
+    def update(self, user_id: Any, user: Optional[Dict[str, Any]]) -> None:
+        """Re-index one user after a save (None = deleted)"""
+        user_id = _user_id(user_id)
+        if user_id is None:
+            return
+        new = _contribution(user) if user else None
+        old = self._users.pop(user_id, None)
+        if old is not None and new is not None and old[:2] == new[:2]:
+            # Same code and referrer - only the counters move, the referee keeps its place
+            counters = self.counters.get(new[1]) if new[1] is not None and new[1] != user_id else None
+            if counters is not None:
+                counters[1] += new[2] - old[2]
+                counters[2] += new[3] - old[3]
+            self._users[user_id] = new
+            return
+        if old is not None:
+            self._apply(user_id, old, -1)
+        if new is not None:
+            self._apply(user_id, new, +1)
+            self._users[user_id] = new
+
+    # ========== READS ==========
+    def find_by_code(self, code: Any) -> Optional[int]:
+        code = normalize_code(code)
+        return self.by_code.get(code) if code else None
+
+    def stats(self, user_id: int, recent: int = 5) -> Dict[str, Any]:
+        """Counters plus the most recent referees, newest first"""
+        referrals, accounts, revenue = self.counters.get(user_id, (0, 0, 0.0))
+        return {
+            'referrals': referrals,
+            'accounts': accounts,
+            'revenue': revenue,
+            'recent': self.referees.get(user_id, [])[::-1][:recent],
+        }
+
+
+# Shared graph over main.users_data
+graph = ReferralGraph()
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Storage Repository Interface
+Query interface shared by the JSON (in-memory) and SQLite storage backends
+"""
+
+from datetime import date, datetime
+from typing import Dict, Any, Callable, List, Optional, Set
+
+from order_index import OrderIndex
+from referrals import ReferralGraph
+from user_directory import UserDirectory
+from user_index import UserIndex
+from user_search import UserSearchIndex
+from user_cache import iter_records
+
+
+def order_owner(order: Dict[str, Any]) -> Any:
+    """Return the user an order belongs to (legacy records only carry customer_id)"""
+    return order.get('user_id') or order.get('customer_id')
+
+
+def parse_iso_date(value: Any) -> Optional[date]:
+    """Parse the date part of an ISO timestamp, None when missing or malformed"""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).date()
+    except ValueError:
+        return None
+
+
+class Repository:
+    """Read-side queries the handlers run against whichever backend is active"""
+
+    name = "base"
+
+    async def orders_for_user(self, user_id: int) -> List[Dict[str, Any]]:
+        """All orders of one user, newest first"""
+        raise NotImplementedError
+
+    async def order_history_page(self, user_id: int, older_than: Optional[str] = None,
+                                 newer_than: Optional[str] = None, limit: int = 10) -> Dict[str, Any]:
+        """One page of a user's orders, newest first, just older/newer than a cursor order ID.
+        Returns orders, total, offset (orders newer than the page), has_newer and has_older"""
+        raise NotImplementedError
+
+    async def order_statistics(self, day: date) -> Dict[str, Any]:
+        """Order totals, status counts, the day's orders/revenue and per-platform breakdown"""
+        raise NotImplementedError
+
+    async def user_statistics(self, day: date) -> Dict[str, Any]:
+        """User totals, active users, new users on day, balance and spend sums, per-status counts
+        and users with any recorded activity"""
+        raise NotImplementedError
+
+    async def order_rollup(self, start: date, end: date) -> Dict[str, Any]:
+        """[orders, completed, quantity, revenue] totals, per day, per platform and per
+        (platform, service_id) for orders created start..end inclusive"""
+        raise NotImplementedError
+
+    async def find_user_id(self, phone_number: Optional[str] = None, api_key: Optional[str] = None,
+                           email: Optional[str] = None, referral_code: Optional[str] = None) -> Optional[int]:
+        """Look up a user by (normalized) phone number, API key, (normalized) email or referral code"""
+        raise NotImplementedError
+
+    async def referral_stats(self, user_id: int, recent: int = 5) -> Dict[str, Any]:
+        """Users referred by user_id: referrals, accounts created, their total spend, recent referee IDs"""
+        raise NotImplementedError
+
+    async def user_list_page(self, sort: str = "joined", created: Optional[bool] = None,
+                             status: Optional[str] = None, older_than: Optional[int] = None,
+                             newer_than: Optional[int] = None, limit: int = 20) -> Dict[str, Any]:
+        """One page of users newest first by join date ("joined") or last activity ("active"),
+        filtered by account_created/status. Returns users as (user_id, user), total, has_newer, has_older"""
+        raise NotImplementedError
+
+    async def platform_user_ids(self, platform: str) -> set:
+        """IDs of users with at least one order on platform"""
+        raise NotImplementedError
+
+    async def select_user_ids(self, keep: Callable[[Any, Dict[str, Any]], bool]) -> List[int]:
+        """IDs of users keep(user_id, user) accepts, in user order - SQL backends call keep on
+        their database thread, so it must only read its arguments"""
+        raise NotImplementedError
+
+    async def undeliverable_user_ids(self, probed_before: str, limit: int) -> List[int]:
+        """Up to limit users flagged undeliverable whose last probe is older than probed_before
+        (ISO timestamp), longest unprobed first"""
+        raise NotImplementedError
+
+    async def search_users(self, prefix: str, limit: int = 200) -> List[tuple]:
+        """Up to limit (user_id, matched term, field) whose ID, username or name (word) starts
+        with prefix, best matches first"""
+        raise NotImplementedError
+
+    # ========== INDEX MAINTENANCE ==========
+    def rebuild(self) -> None:
+        """Build in-memory indexes after the data is loaded (nothing to do for SQL backends)"""
+
+    def index_user(self, user_id: Any, claim: bool = False) -> None:
+        """Re-index one user after a save; claim=True moves a phone/email over from another account"""
+
+    def index_order(self, order_id: str) -> None:
+        """Re-index one order after an insert, status change or delete"""
+
+    async def close(self) -> None:
+        """Release backend resources"""
+
+
+class MemoryRepository(Repository):
+    """Users and orders held in memory - queries are answered from indexes kept in step with saves"""
+
+    name = "memory"
+
+    def __init__(self, users: Dict[int, Dict[str, Any]], orders: Dict[str, Dict[str, Any]],
+                 index: UserIndex, order_index: OrderIndex, directory: UserDirectory,
+                 search: UserSearchIndex, graph: ReferralGraph):
+        self.users = users
+        self.orders = orders
+        self.index = index
+        self.order_index = order_index
+        self.directory = directory
+        self.search = search
+        self.graph = graph
+        # Users flagged undeliverable - a handful next to users_data, so re-probes never scan it
+        self.undeliverable: Set[Any] = set()
+
+    def rebuild(self) -> None:
+        self.index.rebuild(self.users)
+        self.search.rebuild(self.users)
+        self.directory.rebuild(self.users)
+        self.graph.rebuild(self.users)
+        self.order_index.rebuild(self.orders)
+        self.undeliverable = {user_id for user_id, user in self.users.items() if user.get('undeliverable')}
+
+    def index_user(self, user_id: Any, claim: bool = False) -> None:
+        user = self.users.get(user_id)
+        self.index.update(user_id, user, claim=claim)
+        self.search.update(user_id, user)
+        self.directory.update(user_id, user)
+        self.graph.update(user_id, user)
+        if user and user.get('undeliverable'):
+            self.undeliverable.add(user_id)
+        else:
+            self.undeliverable.discard(user_id)
+
+    def index_order(self, order_id: str) -> None:
+        self.order_index.update(order_id, self.orders.get(order_id))
+
+    async def orders_for_user(self, user_id: int) -> List[Dict[str, Any]]:
+        # Already newest first - skip IDs whose order is gone from orders_data
+        return [order for order in map(self.orders.get, self.order_index.order_ids(user_id)) if order]
+
+    async def order_history_page(self, user_id: int, older_than: Optional[str] = None,
+                                 newer_than: Optional[str] = None, limit: int = 10) -> Dict[str, Any]:
+        page = self.order_index.page(user_id, older_than, newer_than, limit)
+        page['orders'] = [order for order in map(self.orders.get, page.pop('order_ids')) if order]
+        return page
+
+    async def order_statistics(self, day: date) -> Dict[str, Any]:
+        stats = {
+            'total': len(self.orders),
+            'completed': 0,
+            'today_count': 0,
+            'today_revenue': 0.0,
+            'platforms': {},
+        }
+        for order in self.orders.values():
+            completed = order.get('status') == 'completed'
+            price = order.get('total_price', 0.0) or 0.0
+            if completed:
+                stats['completed'] += 1
+            if parse_iso_date(order.get('created_at')) == day:
+                stats['today_count'] += 1
+                if completed:
+                    stats['today_revenue'] += price
+
+            platform = (order.get('platform') or 'unknown').lower()
+            count, revenue = stats['platforms'].get(platform, (0, 0.0))
+            stats['platforms'][platform] = (count + 1, revenue + (price if completed else 0.0))
+        return stats
+
+    async def order_rollup(self, start: date, end: date) -> Dict[str, Any]:
+        from stats_aggregator import StatsAggregator
+        rollup = StatsAggregator()
+        for order_id, order in self.orders.items():
+            if start <= (parse_iso_date(order.get('created_at')) or date.min) <= end:
+                rollup.update_order(order_id, order)
+        return rollup.order_rollup(start, end)
+
+    async def user_statistics(self, day: date) -> Dict[str, Any]:
+        stats = {
+            'total': len(self.users),
+            'active': 0,
+            'new_today': 0,
+            'total_balance': 0.0,
+            'total_spent': 0.0,
+            'statuses': {},
+            'with_activity': 0,
+        }
+        for user in self.users.values():
+            if user.get('orders_count', 0) > 0:
+                stats['active'] += 1
+            if parse_iso_date(user.get('join_date')) == day:
+                stats['new_today'] += 1
+            stats['total_balance'] += user.get('balance', 0.0) or 0.0
+            stats['total_spent'] += user.get('total_spent', 0.0) or 0.0
+            status = str(user['status']) if user.get('status') else None
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+            if 'last_activity' in user:
+                stats['with_activity'] += 1
+        return stats
+
+    async def find_user_id(self, phone_number: Optional[str] = None, api_key: Optional[str] = None,
+                           email: Optional[str] = None, referral_code: Optional[str] = None) -> Optional[int]:
+        if phone_number:
+            user_id = self.index.find_by_phone(phone_number)
+            if user_id is not None:
+                return user_id
+        if email:
+            user_id = self.index.find_by_email(email)
+            if user_id is not None:
+                return user_id
+        if referral_code:
+            user_id = self.graph.find_by_code(referral_code)
+            if user_id is not None:
+                return user_id
+        if api_key:
+            # Only the API screen looks keys up - not worth an index
+            for user_id, user in self.users.items():
+                if user.get('api_key') == api_key:
+                    return user_id
+        return None
+
+    async def referral_stats(self, user_id: int, recent: int = 5) -> Dict[str, Any]:
+        return self.graph.stats(user_id, recent)
+
+    async def search_users(self, prefix: str, limit: int = 200) -> List[tuple]:
+        return self.search.search(prefix)[:limit]
+
+    async def user_list_page(self, sort: str = "joined", created: Optional[bool] = None,
+                             status: Optional[str] = None, older_than: Optional[int] = None,
+                             newer_than: Optional[int] = None, limit: int = 20) -> Dict[str, Any]:
+        page = self.directory.page(sort, created, status, older_than, newer_than, limit)
+        page['users'] = [(user_id, self.users[user_id]) for user_id in page.pop('user_ids') if user_id in self.users]
+        return page
+
+    async def platform_user_ids(self, platform: str) -> set:
+        return self.order_index.platform_user_ids(platform)
+
+    async def select_user_ids(self, keep: Callable[[Any, Dict[str, Any]], bool]) -> List[int]:
+        return [int(user_id) async for user_id, user in iter_records(self.users) if keep(user_id, user)]
+
+    async def undeliverable_user_ids(self, probed_before: str, limit: int) -> List[int]:
+        due = []
+        for user_id in self.undeliverable:
+            flag = (self.users.get(user_id) or {}).get('undeliverable')
+            if flag and (flag.get('probed_at') or '') < probed_before:
+                due.append((flag.get('probed_at') or '', user_id))
+        return [int(user_id) for _, user_id in sorted(due)[:limit]]
@@ -1,10 +1,10 @@
 # Social Media Services Management
 # Handles all service-related operations for the Telegram bot
 
+import html
 import time
 import os
 import traceback
-import asyncio
 from datetime import datetime
 from aiogram.types import (
     InlineKeyboardMarkup, 
@@ -15,6 +15,10 @@ from aiogram.types import (
 from aiogram import F
 from aiogram.fsm.context import FSMContext
 
+import broadcast_jobs
+import broadcaster
+import segments
+
 
 # ========== ADMIN CONFIGURATION ==========
 ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID", "7437014244"))  # Main admin user ID from environment
@@ -1647,7 +1651,7 @@ def register_service_handlers(dp, require_account):
             return
 
         log_activity(callback.from_user.id, "Viewed Bot Status")
-        status_info = get_bot_status_info()
+        status_info = await get_bot_status_info()
         await safe_edit_message(callback, status_info["text"], status_info["keyboard"])
         await callback.answer()
 
@@ -1659,7 +1663,7 @@ def register_service_handlers(dp, require_account):
             return
 
         log_activity(callback.from_user.id, "Accessed User Management")
-        user_info = get_user_management_info()
+        user_info = await get_user_management_info()
         await safe_edit_message(callback, user_info["text"], user_info["keyboard"])
         await callback.answer()
 
@@ -1683,7 +1687,7 @@ def register_service_handlers(dp, require_account):
             return
 
         log_activity(callback.from_user.id, "Accessed Broadcast Center")
-        broadcast_info = get_broadcast_interface()
+        broadcast_info = await get_broadcast_interface()
         await safe_edit_message(callback, broadcast_info["text"], broadcast_info["keyboard"])
         await callback.answer()
 
@@ -1763,7 +1767,7 @@ def register_service_handlers(dp, require_account):
             print(f"🔧 Force-completed admin account for broadcast user {user_id}")
             # Save admin account data to persistent storage
             from main import save_data_to_json
-            save_data_to_json(users_data, "users.json")
+            save_data_to_json(users_data, "users.json", user_id)
 
         # Set user state for message input
         user_state[user_id] = {
@@ -1785,6 +1789,7 @@ def register_service_handlers(dp, require_account):
 • Max 4096 characters
 
 ⚠️ <b>This will send to ALL registered users!</b>
+🎯 Start with <code>[filter]</code> to send to a segment only, e.g. <code>[total_spent&gt;500 and joined&lt;30d] Hello!</code>
 
 💬 Type your message now, or click Cancel to abort.
 """
@@ -1892,8 +1897,8 @@ We will be launching exciting new services soon.
         if action == "export_users":
             await callback.answer("📋 User export feature coming soon!")
         elif action == "user_details":
-            from main import load_data_from_json
-            users_data = load_data_from_json("users.json")
+            # In-memory data is authoritative - the file may lag behind write-behind saves
+            from main import users_data
 
             user_list_text = "👥 **Complete User List**\n\n"
             if not users_data:
@@ -1926,7 +1931,7 @@ We will be launching exciting new services soon.
 # ========== ADMIN BROADCAST MESSAGE HANDLER ==========
 async def handle_admin_broadcast_message(message: Message, user_id: int):
     """Handle admin broadcast message input"""
-    from main import users_data, user_state
+    from main import user_state, broadcast_recipients, segment_recipients
 
     if not is_admin(user_id):
         return
@@ -1941,22 +1946,34 @@ async def handle_admin_broadcast_message(message: Message, user_id: int):
     # Clear user state
     user_state[user_id] = {"current_step": None, "data": {}}
 
-    # Get target users
-    if target == "all":
-        target_users = list(users_data.keys())
+    # "[filter] message" sends to an audience segment only
+    segment_text, broadcast_text = segments.split_segment(broadcast_text or "")
+    if not broadcast_text:
+        await message.answer("❌ Please type a message to broadcast!")
+        return
+
+    # Get target users - users who blocked the bot are skipped
+    if segment_text is not None:
+        try:
+            target_users, skipped, _elapsed = await segment_recipients(segment_text, active_only=target != "all")
+        except segments.SegmentError as e:
+            await message.answer(f"❌ <b>Invalid segment:</b> {html.escape(str(e))}\n\n{segments.SEGMENT_HELP}")
+            return
     else:
-        target_users = [uid for uid, udata in users_data.items() if udata.get('status') == 'active']
+        target_users, skipped = await broadcast_recipients(active_only=target != "all")
 
     # Send confirmation
+    segment_line = f"🎯 <b>Segment:</b> <code>{html.escape(segment_text)}</code>\n" if segment_text is not None else ""
     confirm_text = f"""
 📢 <b>Broadcast Confirmation</b>
 
 📝 <b>Message Preview:</b>
 {broadcast_text}
 
-👥 <b>Target:</b> {len(target_users)} users
-📊 <b>Delivery:</b> 1 message per second (Telegram limit)
-⏰ <b>Estimated Time:</b> ~{len(target_users)} seconds
+{segment_line}👥 <b>Target:</b> {len(target_users)} users
+🚫 <b>Skipped (undeliverable):</b> {skipped}
+📊 <b>Delivery:</b> {broadcaster.BROADCAST_RATE:g} messages per second (Telegram limit)
+⏰ <b>Estimated Time:</b> ~{broadcaster.format_duration(broadcaster.estimate_seconds(len(target_users)))}
 
 ⚠️ <b>Ready to send?</b>
 """
@@ -1973,7 +1990,8 @@ async def handle_admin_broadcast_message(message: Message, user_id: int):
         "current_step": "admin_confirm_broadcast",
         "data": {
             "message": broadcast_text,
-            "target_users": target_users
+            "target_users": target_users,
+            "skipped": skipped
         }
     }
 
@@ -2015,45 +2033,17 @@ async def handle_admin_broadcast_confirm(callback: CallbackQuery):
 
     await safe_edit_message(callback, status_text, keyboard)
 
-    # Send broadcast messages
-    sent_count = 0
-    failed_count = 0
-
-    for target_user_id in target_users:
-        try:
-            # Import bot from main.py
-            from main import bot
-            await bot.send_message(
-                chat_id=target_user_id,
-                text=broadcast_message,
-                parse_mode="HTML"
-            )
-            sent_count += 1
-
-            # Respect Telegram rate limits
-            await asyncio.sleep(1)
+    # Checkpointed broadcast job - progress is edited into the status message and the
+    # completion report follows as a new message
+    status_message = None
+    if callback.message and hasattr(callback.message, 'message_id'):
+        status_message = [callback.message.chat.id, callback.message.message_id]
+    job = await broadcast_jobs.jobs.create(
+        broadcast_jobs.KIND_MESSAGE, {'text': broadcast_message}, target_users, user_id,
+        f"Admin broadcast by {user_id}", status_message)
+    broadcast_jobs.jobs.start(job)
 
-        except Exception as e:
-            failed_count += 1
-            log_error(f"Broadcast failed for user {target_user_id}: {str(e)}")
-
-    # Send completion report
-    completion_text = f"""
-✅ <b>Broadcast Completed!</b>
-
-📊 <b>Delivery Report:</b>
-• Successfully sent: {sent_count}
-• Failed deliveries: {failed_count}
-• Total attempts: {len(target_users)}
-• Success rate: {(sent_count/len(target_users)*100):.1f}%
-
-⏰ <b>Completed:</b> {datetime.now().strftime('%H:%M:%S')}
-📝 <b>Message:</b> {broadcast_message[:100]}{'...' if len(broadcast_message) > 100 else ''}
-"""
-
-    log_activity(user_id, f"Broadcast sent to {sent_count} users")
-
-    await safe_edit_message(callback, completion_text, keyboard)
+    log_activity(user_id, f"Broadcast job {job.job_id} started for {len(target_users)} users")
 
 
 # Export functions for main.py
@@ -2087,28 +2077,21 @@ def get_admin_main_menu() -> InlineKeyboardMarkup:
         ]
     ])
 
-def get_bot_status_info() -> dict:
+async def get_bot_status_info() -> dict:
     """Get comprehensive bot status information"""
-    from main import users_data, orders_data, tickets_data, user_state
+    from main import tickets_data, admin_user_statistics, admin_order_statistics
 
     uptime = format_uptime()
     system_stats = get_system_stats()
 
-    # Calculate statistics
-    total_users = len(users_data)
-    active_users_24h = 0
-    total_orders = len(orders_data)
+    # Calculate statistics - running counters, or repository queries for shared-state workers
+    user_stats = await admin_user_statistics(datetime.now().date())
+    total_users = user_stats['total']
+    # Users with any recorded activity (simplified)
+    active_users_24h = user_stats['with_activity']
+    total_orders = (await admin_order_statistics(datetime.now().date()))['total']
     total_tickets = len(tickets_data)
 
-    # Count active users in last 24 hours (simplified)
-    for user_data in users_data.values():
-        try:
-            if 'last_activity' in user_data:
-                # This would need proper date checking in real implementation
-                active_users_24h += 1
-        except (KeyError, ValueError, TypeError):
-            pass
-
     # Get proper start time for display
     try:
         from main import START_TIME
@@ -2159,19 +2142,18 @@ def get_bot_status_info() -> dict:
 
     return {"text": status_text, "keyboard": keyboard}
 
-def get_user_management_info() -> dict:
+async def get_user_management_info() -> dict:
     """Get user management interface"""
-    from main import load_data_from_json
-    users_data = load_data_from_json("users.json")
+    from main import repository, admin_user_statistics
 
-    total_users = len(users_data)
-    active_today = sum(1 for user in users_data.values() if user.get('status') == 'active')
-    banned_users = sum(1 for user in users_data.values() if user.get('status') == 'banned')
+    user_stats = await admin_user_statistics(datetime.now().date())
+    total_users = user_stats['total']
+    active_today = user_stats['statuses'].get('active', 0)
+    banned_users = user_stats['statuses'].get('banned', 0)
 
-    # Get recent users (last 5)
+    # Get recent users (newest 5)
     recent_users = []
-    user_list = list(users_data.items())
-    for user_id, user_data in user_list[-5:]:
+    for user_id, user_data in (await repository.user_list_page(limit=5))['users']:
         username = user_data.get('username', 'No username')
         name = user_data.get('full_name', user_data.get('first_name', 'Unknown'))
         recent_users.append(f"• {name} (@{username}) - ID: {user_id}")
@@ -2185,15 +2167,15 @@ def get_user_management_info() -> dict:
 • Total Users: {total_users}
 • Active Users: {active_today}
 • Banned Users: {banned_users}
-• New Today: {len([u for u in users_data.values() if 'today' in str(u.get('join_date', ''))])}
+• New Today: {user_stats['new_today']}
 
 📋 <b>Recent Users:</b>
 {recent_users_text}
 
 💰 <b>Financial Stats:</b>
-• Total Balance: ₹{sum(user.get('balance', 0) for user in users_data.values()):.2f}
-• Total Spent: ₹{sum(user.get('total_spent', 0) for user in users_data.values()):.2f}
-• Avg Order Value: ₹{sum(user.get('total_spent', 0) for user in users_data.values()) / max(total_users, 1):.2f}
+• Total Balance: ₹{user_stats['total_balance']:.2f}
+• Total Spent: ₹{user_stats['total_spent']:.2f}
+• Avg Order Value: ₹{user_stats['total_spent'] / max(total_users, 1):.2f}
 """
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -2255,20 +2237,17 @@ def get_error_monitor_info() -> dict:
 
     return {"text": text, "keyboard": keyboard}
 
-def get_broadcast_interface() -> dict:
+async def get_broadcast_interface() -> dict:
     """Get broadcast message interface"""
-    from main import users_data
+    from main import admin_user_statistics
 
-    total_users = len(users_data)
-    active_users = sum(1 for user in users_data.values() if user.get('status') == 'active')
+    user_stats = await admin_user_statistics(datetime.now().date())
+    total_users = user_stats['total']
+    active_users = user_stats['statuses'].get('active', 0)
 
     # Debug user data
     print(f"🔍 BROADCAST INTERFACE DEBUG: Total users in data: {total_users}")
     print(f"🔍 BROADCAST INTERFACE DEBUG: Active users: {active_users}")
-    if total_users > 0:
-        sample_users = list(users_data.items())[:3]
-        for uid, udata in sample_users:
-            print(f"   User {uid}: {udata.get('username', 'No username')} - {udata.get('status', 'No status')}")
 
     text = f"""
 📢 <b>Broadcast Message Center</b>
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Shared State
+Cross-process per-user locks and per-user session dicts kept in the SQLite database,
+so several webhook workers can serve the same bot (SHARED_STATE=1)
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+from collections import Counter
+from collections.abc import MutableMapping
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_locks (
+    user_id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS session_state (
+    namespace TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (namespace, user_id)
+);
+"""
+
+# A lock left behind by a crashed worker is taken over after this many seconds
+LOCK_TTL = float(os.getenv("SHARED_LOCK_TTL", "60"))
+# Give up waiting for another worker to finish with a user after this many seconds
+LOCK_TIMEOUT = float(os.getenv("SHARED_LOCK_TIMEOUT", "30"))
+
+
+class UserLockTimeout(Exception):
+    """Another worker held the user's lock for longer than LOCK_TIMEOUT"""
+
+
+# Users whose lock the current task already holds - nested sessions for them don't re-acquire
+_held_users: ContextVar[frozenset] = ContextVar("shared_state_held_users", default=frozenset())
+
+
+# ========== PER-USER LOCKS ==========
+class UserLocks:
+    """Per-user row locks in user_locks, plus an asyncio lock per user inside this process"""
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._local: Dict[int, asyncio.Lock] = {}
+        self._waiters: Counter = Counter()
+
+    @staticmethod
+    def _try_acquire(conn, user_id: int, owner: str, now: float, ttl: float) -> bool:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO user_locks (user_id, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE user_locks.expires_at < ? OR user_locks.owner = excluded.owner",
+                (user_id, owner, now + ttl, now)
+            )
+            return cursor.rowcount > 0
+
+    @staticmethod
+    def _release(conn, user_id: int, owner: str) -> None:
+        with conn:
+            conn.execute("DELETE FROM user_locks WHERE user_id = ? AND owner = ?", (user_id, owner))
+
+    async def _acquire(self, user_id: int) -> None:
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        delay = 0.01
+        while not await self.repository.run(self._try_acquire, user_id, self.owner, time.time(), LOCK_TTL):
+            if time.monotonic() > deadline:
+                raise UserLockTimeout(f"user {user_id} is locked by another worker")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+    @asynccontextmanager
+    async def hold(self, user_id: int):
+        """Hold user_id's lock across every worker for the duration of the block"""
+        local = self._local.setdefault(user_id, asyncio.Lock())
+        self._waiters[user_id] += 1
+        try:
+            async with local:
+                await self._acquire(user_id)
+                try:
+                    yield
+                finally:
+                    # Same sqlite thread as the session's writes - they commit before the release
+                    await self.repository.run(self._release, user_id, self.owner)
+        finally:
+            self._waiters[user_id] -= 1
+            if not self._waiters[user_id]:
+                del self._waiters[user_id]
+                self._local.pop(user_id, None)
+
+
+# ========== PER-USER SESSION DICTS ==========
+class SessionStateMap(MutableMapping):
+    """user_state / order_temp - one JSON row per user, loaded on access, written back per update"""
+
+    def __init__(self, repository, namespace: str):
+        self.repository = repository
+        self.namespace = namespace
+        # user_id -> value handlers see and mutate in place
+        self._values: Dict[int, Any] = {}
+        # user_id -> JSON text as stored (None = no row), to detect changes on persist
+        self._stored: Dict[int, Optional[str]] = {}
+
+    @staticmethod
+    def _get(conn, namespace: str, user_id: int) -> Optional[str]:
+        row = conn.execute("SELECT data FROM session_state WHERE namespace = ? AND user_id = ?",
+                           (namespace, user_id)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _user_ids(conn, namespace: str) -> List[int]:
+        return [row[0] for row in conn.execute("SELECT user_id FROM session_state WHERE namespace = ?",
+                                               (namespace,))]
+
+    @staticmethod
+    def _write(conn, namespace: str, rows: List[Tuple[int, Optional[str]]]) -> None:
+        with conn:
+            for user_id, data in rows:
+                if data is None:
+                    conn.execute("DELETE FROM session_state WHERE namespace = ? AND user_id = ?",
+                                 (namespace, user_id))
+                else:
+                    conn.execute("INSERT OR REPLACE INTO session_state (namespace, user_id, data) "
+                                 "VALUES (?, ?, ?)", (namespace, user_id, data))
+
+    def _remember(self, user_id: int, stored: Optional[str]) -> None:
+        self._stored[user_id] = stored
+        if stored is None:
+            self._values.pop(user_id, None)
+        else:
+            self._values[user_id] = json.loads(stored)
+
+    def _ensure(self, user_id: Any) -> int:
+        user_id = int(user_id)
+        if user_id not in self._stored:
+            self._remember(user_id, self.repository.run_sync(self._get, self.namespace, user_id))
+        return user_id
+
+    async def load(self, user_id: int) -> None:
+        """(Re)load a user's row off the event loop - called when their update starts"""
+        self._remember(user_id, await self.repository.run(self._get, self.namespace, user_id))
+
+    async def persist(self) -> None:
+        """Write back every loaded entry that changed since it was read"""
+        rows = []
+        for user_id, stored in self._stored.items():
+            value = self._values.get(user_id)
+            current = None if user_id not in self._values else json.dumps(value, ensure_ascii=False, default=str)
+            if current != stored:
+                rows.append((user_id, current))
+                self._stored[user_id] = current
+        if rows:
+            await self.repository.run(self._write, self.namespace, rows)
+
+    def forget(self, keep) -> None:
+        """Drop loaded entries other than keep so later reads see other workers' writes"""
+        for user_id in list(self._stored):
+            if user_id not in keep:
+                self._stored.pop(user_id, None)
+                self._values.pop(user_id, None)
+
+    def __getitem__(self, user_id: Any) -> Any:
+        user_id = self._ensure(user_id)
+        if user_id not in self._values:
+            raise KeyError(user_id)
+        return self._values[user_id]
+
+    def __setitem__(self, user_id: Any, value: Any) -> None:
+        self._values[self._ensure(user_id)] = value
+
+    def __delitem__(self, user_id: Any) -> None:
+        user_id = self._ensure(user_id)
+        if user_id not in self._values:
+            raise KeyError(user_id)
+        del self._values[user_id]
+
+    def __contains__(self, user_id: Any) -> bool:
+        try:
+            return self._ensure(user_id) in self._values
+        except (TypeError, ValueError):
+            return False
+
+    def __iter__(self) -> Iterator[int]:
+        stored_ids = set(self.repository.run_sync(self._user_ids, self.namespace))
+        # Rows deleted locally but not persisted yet are skipped, local additions included
+        deleted = {user_id for user_id in self._stored if user_id not in self._values}
+        return iter(sorted((stored_ids - deleted) | set(self._values)))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+# ========== UPDATE SESSIONS ==========
+class SharedState:
+    """Runs each update under its user's lock with fresh data, writing changes back at the end"""
+
+    def __init__(self, repository, store, users, orders, session_maps: List[SessionStateMap]):
+        self.store = store
+        self.users = users
+        self.orders = orders
+        self.session_maps = session_maps
+        self.locks = UserLocks(repository)
+        repository.run_sync(lambda conn: conn.executescript(SCHEMA))
+        # user_id -> start times of the updates currently running for them
+        self._active: Dict[int, List[float]] = {}
+
+    @asynccontextmanager
+    async def session(self, user_id: int, order_ids: Tuple[str, ...] = ()):
+        """Run a block under user_id's lock - also used by admin handlers changing another user"""
+        held = _held_users.get()
+        if user_id in held:
+            # Nested session for a user this task already holds (e.g. an admin's own order)
+            await self._refresh_orders(order_ids)
+            yield
+            return
+        async with self.locks.hold(user_id):
+            token = _held_users.set(held | {user_id})
+            started = time.monotonic()
+            self._active.setdefault(user_id, []).append(started)
+            try:
+                # Another worker may have changed this user since we last saw them
+                self.users.invalidate(user_id)
+                await self.users.preload(user_id)
+                await self._refresh_orders(order_ids)
+                for session_map in self.session_maps:
+                    await session_map.load(user_id)
+                yield
+            finally:
+                _held_users.reset(token)
+                await self._end(user_id, started)
+
+    async def _refresh_orders(self, order_ids: Tuple[str, ...]) -> None:
+        for order_id in order_ids:
+            self.orders.invalidate(order_id)
+            await self.orders.preload(order_id)
+
+    async def _end(self, user_id: int, started: float) -> None:
+        # Queue the update's record writes - they run before the lock release
+        await self.store.flush()
+        for session_map in self.session_maps:
+            await session_map.persist()
+
+        self._active[user_id].remove(started)
+        if not self._active[user_id]:
+            del self._active[user_id]
+
+        # Records last used before the oldest running update can't be held by any handler
+        cutoff = min((min(starts) for starts in self._active.values()), default=time.monotonic())
+        keep = set(self._active)
+        self.users.drop_clean(keep, cutoff)
+        self.orders.drop_clean(set(), cutoff)
+        for session_map in self.session_maps:
+            session_map.forget(keep)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Binary Snapshot Format
+Compact snapshots written next to users.json / orders.json for fast cold starts
+
+Layout: MAGIC | version (1 byte) | codec (1 byte) | payload length (8 bytes) | crc32 (4 bytes) | payload
+"""
+
+import os
+import pickle
+import struct
+import time
+import zlib
+from typing import Any, Callable, Dict, Tuple
+
+import records
+
+try:
+    import msgpack
+except ImportError:  # Optional - pickle is used when msgpack isn't installed
+    msgpack = None
+
+MAGIC = b"ISPSNAP"
+FORMAT_VERSION = 1
+CODEC_PICKLE = 1
+CODEC_MSGPACK = 2
+_HEADER = struct.Struct(">7sBBQI")
+
+# Files that get a binary snapshot written alongside their JSON (BINARY_SNAPSHOTS=1)
+ENABLED = os.getenv("BINARY_SNAPSHOTS", "0") == "1"
+SNAPSHOT_FILES = {"users.json", "orders.json"}
+
+# json path -> (source, milliseconds) for the startup timing report
+load_timings: Dict[str, Tuple[str, float]] = {}
+
+
+class SnapshotError(Exception):
+    """Snapshot is missing, truncated, corrupt or from an unknown format version"""
+
+
+def snapshot_path(json_path: str) -> str:
+    return f"{json_path}.snap"
+
+
+def _encode(data: Any) -> Tuple[int, bytes]:
+    if msgpack is not None:
+        return CODEC_MSGPACK, msgpack.packb(data, use_bin_type=True, default=records.json_default)
+    return CODEC_PICKLE, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(codec: int, payload: bytes) -> Any:
+    if codec == CODEC_PICKLE:
+        return pickle.loads(payload)
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise SnapshotError("snapshot was written with msgpack, which is not installed")
+        # Integer user IDs are kept as map keys - no str->int pass on load
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    raise SnapshotError(f"unknown snapshot codec {codec}")
+
+
+def write_snapshot(data: Any, path: str) -> None:
+    """Encode data and atomically replace path with the new snapshot (blocking)"""
+    codec, payload = _encode(data)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, codec, len(payload), zlib.crc32(payload))
+    from persistence import atomic_write
+
+    def write(f):
+        f.write(header)
+        f.write(payload)
+
+    atomic_write(path, write, binary=True)
+
+
+def read_snapshot(path: str) -> Any:
+    """Read and validate a snapshot, raising SnapshotError when it can't be trusted"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            payload = f.read()
+    except OSError as e:
+        raise SnapshotError(str(e))
+
+    if len(header) < _HEADER.size:
+        raise SnapshotError("truncated header")
+    magic, version, codec, length, checksum = _HEADER.unpack(header)
+    if magic != MAGIC:
+        raise SnapshotError("bad magic")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"unsupported format version {version}")
+    if len(payload) != length:
+        raise SnapshotError(f"truncated payload ({len(payload)}/{length} bytes)")
+    if zlib.crc32(payload) != checksum:
+        raise SnapshotError("checksum mismatch")
+    return _decode(codec, payload)
+
+
+def maybe_write_snapshot(data: Any, json_path: str) -> None:
+    """Write the binary snapshot for json_path if snapshots are enabled for it"""
+    if ENABLED and os.path.basename(json_path) in SNAPSHOT_FILES:
+        try:
+            write_snapshot(data, snapshot_path(json_path))
+        except Exception as e:
+            print(f"⚠️ Could not write binary snapshot for {json_path}: {e}")
+
+
+def load_with_snapshot(json_path: str, json_loader: Callable[[], Any]) -> Any:
+    """Load from the binary snapshot when it is valid and newer than the JSON, else from JSON"""
+    started = time.perf_counter()
+    snap_path = snapshot_path(json_path)
+    data = None
+    source = "json"
+
+    if ENABLED and os.path.exists(snap_path):
+        json_mtime = os.path.getmtime(json_path) if os.path.exists(json_path) else 0.0
+        if os.path.getmtime(snap_path) >= json_mtime:
+            try:
+                data = read_snapshot(snap_path)
+                source = "snapshot"
+            except SnapshotError as e:
+                print(f"⚠️ Ignoring snapshot {snap_path} ({e}) - falling back to JSON")
+        else:
+            print(f"📄 {json_path} is newer than its snapshot - loading JSON")
+
+    if data is None:
+        data = json_loader()
+
+    load_timings[json_path] = (source, (time.perf_counter() - started) * 1000)
+    return data
+
+
+def format_load_report() -> str:
+    """One line per file loaded at startup with its source and load time"""
+    lines = ["⏱️ Startup load timings:"]
+    total = 0.0
+    for json_path, (source, ms) in load_timings.items():
+        lines.append(f"   • {json_path}: {ms:.1f}ms ({source})")
+        total += ms
+    lines.append(f"   • total: {total:.1f}ms")
+    return "\n".join(lines)
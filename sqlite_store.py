@@ -0,0 +1,788 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - SQLite Storage Backend
+Indexed tables for users, orders, tickets and offers (WAL mode, dedicated executor)
+
+Migrate the existing JSON files with:
+    python sqlite_store.py migrate [db_path]
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
+
+import records
+from repository import Repository, order_owner
+from stats_aggregator import add_bucket
+from referrals import normalize_code
+from user_index import normalize_phone, normalize_email
+
+SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "bot_data.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    phone_number TEXT,
+    email TEXT,
+    phone_key TEXT,
+    email_key TEXT,
+    api_key TEXT,
+    status TEXT,
+    account_created INTEGER NOT NULL DEFAULT 0,
+    join_date TEXT,
+    balance REAL NOT NULL DEFAULT 0,
+    total_spent REAL NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    referral_code TEXT,
+    referred_by INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone_number);
+CREATE INDEX IF NOT EXISTS idx_users_api_key ON users(api_key);
+CREATE INDEX IF NOT EXISTS idx_users_status ON users(status);
+CREATE INDEX IF NOT EXISTS idx_users_join_date ON users(join_date);
+
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    status TEXT,
+    platform TEXT,
+    created_at TEXT,
+    total_price REAL NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
+CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_platform ON orders(platform);
+
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    status TEXT,
+    created_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_user ON tickets(user_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets(status);
+
+CREATE TABLE IF NOT EXISTS offers (
+    offer_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_offers_created ON offers(created_at);
+"""
+
+
+# Added after the first release - applied to existing databases in _migrate
+USER_KEY_COLUMNS = """
+CREATE INDEX IF NOT EXISTS idx_users_phone_key ON users(phone_key);
+CREATE INDEX IF NOT EXISTS idx_users_email_key ON users(email_key);
+CREATE INDEX IF NOT EXISTS idx_users_referral_code ON users(referral_code);
+CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users(referred_by);
+CREATE INDEX IF NOT EXISTS idx_users_undeliverable ON users(json_extract(data, '$.undeliverable.probed_at'));
+"""
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _user_row(user_id: int, user_json: str) -> Tuple:
+    user = json.loads(user_json)
+    return (
+        user_id, user.get('username'), user.get('phone_number'), user.get('email'),
+        normalize_phone(user.get('phone_number')), normalize_email(user.get('email')),
+        user.get('api_key'), user.get('status'), 1 if user.get('account_created') else 0,
+        user.get('join_date'), user.get('balance', 0.0) or 0.0, user.get('total_spent', 0.0) or 0.0,
+        user.get('orders_count', 0) or 0, normalize_code(user.get('referral_code')),
+        _as_int(user.get('referred_by')), user_json
+    )
+
+
+def _order_row(order_id: str, order_json: str) -> Tuple:
+    order = json.loads(order_json)
+    return (
+        order_id, _as_int(order_owner(order)), order.get('status'),
+        (order.get('platform') or 'unknown').lower(), order.get('created_at'),
+        order.get('total_price', 0.0) or 0.0, order_json
+    )
+
+
+def _ticket_row(ticket_id: str, ticket_json: str) -> Tuple:
+    ticket = json.loads(ticket_json)
+    return (ticket_id, _as_int(ticket.get('user_id')), ticket.get('status'),
+            ticket.get('created_at'), ticket_json)
+
+
+def _dumps(record: Any) -> str:
+    return json.dumps(record, ensure_ascii=False, default=records.json_default)
+
+
+class SQLiteRepository(Repository):
+    """SQLite backend - one connection owned by a single-thread executor"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str = SQLITE_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        # One worker thread: serializes writers and keeps sqlite off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._executor.submit(self._connect).result()
+        # Write-behind store and users_data set by attach() - saved records not yet flushed to the table
+        self._store = None
+        self._users = None
+
+    # ========== CONNECTION / EXECUTOR ==========
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            self._local.conn = conn
+        return conn
+
+    async def _run(self, fn, *args):
+        """Run fn(conn, *args) on the sqlite thread and await the result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._connect(), *args))
+
+    @staticmethod
+    def _migrate(conn) -> None:
+        """Bring databases created by older versions up to the current schema"""
+        user_columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        if "phone_key" not in user_columns:
+            with conn:
+                conn.execute("ALTER TABLE users ADD COLUMN phone_key TEXT")
+                conn.execute("ALTER TABLE users ADD COLUMN email_key TEXT")
+                rows = conn.execute("SELECT user_id, data FROM users").fetchall()
+                conn.executemany(
+                    "UPDATE users SET phone_key = ?, email_key = ? WHERE user_id = ?",
+                    [(normalize_phone(user.get('phone_number')), normalize_email(user.get('email')), user_id)
+                     for user_id, user in ((row[0], json.loads(row[1])) for row in rows)]
+                )
+            print(f"🗄️ Added normalized phone/email columns to {len(rows)} users")
+        if "referral_code" not in user_columns:
+            with conn:
+                conn.execute("ALTER TABLE users ADD COLUMN referral_code TEXT")
+                conn.execute("ALTER TABLE users ADD COLUMN referred_by INTEGER")
+                rows = conn.execute("SELECT user_id, data FROM users").fetchall()
+                conn.executemany(
+                    "UPDATE users SET referral_code = ?, referred_by = ? WHERE user_id = ?",
+                    [(normalize_code(user.get('referral_code')), _as_int(user.get('referred_by')), user_id)
+                     for user_id, user in ((row[0], json.loads(row[1])) for row in rows)]
+                )
+            print(f"🗄️ Added referral columns to {len(rows)} users")
+        conn.executescript(USER_KEY_COLUMNS)
+
+    async def run(self, fn, *args):
+        """Public _run for modules that keep their own tables in this database"""
+        return await self._run(fn, *args)
+
+    def _submit(self, fn, *args) -> Future:
+        """Queue fn(conn, *args) on the sqlite thread without waiting (writes)"""
+        future = self._executor.submit(lambda: fn(self._connect(), *args))
+        future.add_done_callback(self._log_failure)
+        return future
+
+    def run_sync(self, fn, *args):
+        """Run fn(conn, *args) on the sqlite thread and block for the result (scripts, startup)"""
+        return self._executor.submit(lambda: fn(self._connect(), *args)).result()
+
+    @staticmethod
+    def _log_failure(future: Future) -> None:
+        error = future.exception()
+        if error:
+            print(f"❌ SQLite write failed: {error}")
+
+    # ========== BULK LOAD ==========
+    @staticmethod
+    def _load_users(conn) -> Dict[int, Dict[str, Any]]:
+        return {row[0]: json.loads(row[1]) for row in conn.execute("SELECT user_id, data FROM users")}
+
+    @staticmethod
+    def _load_orders(conn) -> Dict[str, Dict[str, Any]]:
+        return {row[0]: json.loads(row[1]) for row in conn.execute("SELECT order_id, data FROM orders")}
+
+    @staticmethod
+    def _load_tickets(conn) -> Dict[str, Dict[str, Any]]:
+        return {row[0]: json.loads(row[1]) for row in conn.execute("SELECT ticket_id, data FROM tickets")}
+
+    @staticmethod
+    def _load_offers(conn) -> List[Dict[str, Any]]:
+        return [json.loads(row[0]) for row in conn.execute("SELECT data FROM offers ORDER BY position")]
+
+    # ========== PER-USER ACCESS (lazy user cache) ==========
+    @staticmethod
+    def _get_user(conn, user_id: int) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _user_page(conn, after_id: Optional[int], limit: int) -> List[Tuple[int, str]]:
+        if after_id is None:
+            return conn.execute("SELECT user_id, data FROM users ORDER BY user_id LIMIT ?", (limit,)).fetchall()
+        return conn.execute(
+            "SELECT user_id, data FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?", (after_id, limit)
+        ).fetchall()
+
+    @staticmethod
+    def _user_records_page(conn, after_id: Optional[int], limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        return [(user_id, json.loads(user_json)) for user_id, user_json in
+                SQLiteRepository._user_page(conn, after_id, limit)]
+
+    @staticmethod
+    def _count_users(conn) -> int:
+        return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    @staticmethod
+    def _delete_user(conn, user_id: int) -> None:
+        with conn:
+            conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get_user, user_id)
+
+    def get_user_sync(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self.run_sync(self._get_user, user_id)
+
+    def count_users_sync(self) -> int:
+        return self.run_sync(self._count_users)
+
+    async def count_users(self) -> int:
+        return await self._run(self._count_users)
+
+    async def user_records_page(self, after_id: Optional[int], limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """One page of iter_users, read and decoded on the sqlite thread"""
+        return await self._run(self._user_records_page, after_id, limit)
+
+    def delete_user(self, user_id: int) -> Future:
+        return self._submit(self._delete_user, user_id)
+
+    def iter_users(self, batch_size: int = 1000):
+        """Stream (user_id, record) pairs in user_id order, one page in memory at a time"""
+        after_id = None
+        while True:
+            page = self.run_sync(self._user_page, after_id, batch_size)
+            if not page:
+                return
+            for user_id, user_json in page:
+                yield user_id, json.loads(user_json)
+            after_id = page[-1][0]
+
+    # ========== PER-ORDER ACCESS (shared state mode) ==========
+    @staticmethod
+    def _get_order(conn, order_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT data FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _order_page(conn, after_id: Optional[str], limit: int) -> List[Tuple[str, str]]:
+        if after_id is None:
+            return conn.execute("SELECT order_id, data FROM orders ORDER BY order_id LIMIT ?", (limit,)).fetchall()
+        return conn.execute(
+            "SELECT order_id, data FROM orders WHERE order_id > ? ORDER BY order_id LIMIT ?", (after_id, limit)
+        ).fetchall()
+
+    @staticmethod
+    def _order_records_page(conn, after_id: Optional[str], limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        return [(order_id, json.loads(order_json)) for order_id, order_json in
+                SQLiteRepository._order_page(conn, after_id, limit)]
+
+    @staticmethod
+    def _count_orders(conn) -> int:
+        return conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    async def get_order(self, order_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get_order, order_id)
+
+    def get_order_sync(self, order_id: str) -> Optional[Dict[str, Any]]:
+        return self.run_sync(self._get_order, order_id)
+
+    def count_orders_sync(self) -> int:
+        return self.run_sync(self._count_orders)
+
+    async def count_orders(self) -> int:
+        return await self._run(self._count_orders)
+
+    async def order_records_page(self, after_id: Optional[str], limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """One page of iter_orders, read and decoded on the sqlite thread"""
+        return await self._run(self._order_records_page, after_id, limit)
+
+    def delete_order(self, order_id: str) -> Future:
+        return self.save_orders({order_id: None})
+
+    def iter_orders(self, batch_size: int = 1000):
+        """Stream (order_id, record) pairs in order_id order, one page in memory at a time"""
+        after_id = None
+        while True:
+            page = self.run_sync(self._order_page, after_id, batch_size)
+            if not page:
+                return
+            for order_id, order_json in page:
+                yield order_id, json.loads(order_json)
+            after_id = page[-1][0]
+
+    def load_offers_sync(self) -> List[Dict[str, Any]]:
+        return self.run_sync(self._load_offers)
+
+    async def load_users(self) -> Dict[int, Dict[str, Any]]:
+        return await self._run(self._load_users)
+
+    async def load_orders(self) -> Dict[str, Dict[str, Any]]:
+        return await self._run(self._load_orders)
+
+    async def load_tickets(self) -> Dict[str, Dict[str, Any]]:
+        return await self._run(self._load_tickets)
+
+    async def load_offers(self) -> List[Dict[str, Any]]:
+        return await self._run(self._load_offers)
+
+    # ========== WRITES ==========
+    # Records are serialized to JSON text on the caller's thread so the worker
+    # never reads dicts the event loop may be mutating.
+    @staticmethod
+    def _upsert_users(conn, rows: List[Tuple[int, str]]) -> None:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO users (user_id, username, phone_number, email, phone_key, email_key, "
+                "api_key, status, account_created, join_date, balance, total_spent, orders_count, referral_code, "
+                "referred_by, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [_user_row(user_id, user_json) for user_id, user_json in rows]
+            )
+
+    @staticmethod
+    def _upsert_orders(conn, rows: List[Tuple[str, Optional[str]]]) -> None:
+        with conn:
+            for order_id, order_json in rows:
+                if order_json is None:
+                    conn.execute("DELETE FROM orders WHERE order_id = ?", (order_id,))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO orders (order_id, user_id, status, platform, created_at, "
+                        "total_price, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        _order_row(order_id, order_json)
+                    )
+
+    @staticmethod
+    def _upsert_tickets(conn, rows: List[Tuple[str, str]]) -> None:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO tickets (ticket_id, user_id, status, created_at, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [_ticket_row(ticket_id, ticket_json) for ticket_id, ticket_json in rows]
+            )
+
+    @staticmethod
+    def _replace_offers(conn, offers_json: List[str]) -> None:
+        with conn:
+            conn.execute("DELETE FROM offers")
+            for position, offer_json in enumerate(offers_json):
+                offer = json.loads(offer_json)
+                conn.execute(
+                    "INSERT OR REPLACE INTO offers (offer_id, position, is_active, created_at, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (offer.get('offer_id') or f"offer-{position}", position,
+                     1 if offer.get('is_active', True) else 0, offer.get('created_at'), offer_json)
+                )
+
+    def save_users(self, users: Dict[Any, Dict[str, Any]]) -> Future:
+        rows = [(int(user_id), _dumps(user)) for user_id, user in users.items() if _as_int(user_id) is not None]
+        return self._submit(self._upsert_users, rows)
+
+    def save_orders(self, orders: Dict[str, Optional[Dict[str, Any]]]) -> Future:
+        rows = [(order_id, None if order is None else _dumps(order)) for order_id, order in orders.items()]
+        return self._submit(self._upsert_orders, rows)
+
+    def save_tickets(self, tickets: Dict[str, Dict[str, Any]]) -> Future:
+        rows = [(ticket_id, _dumps(ticket)) for ticket_id, ticket in tickets.items()]
+        return self._submit(self._upsert_tickets, rows)
+
+    def save_offers(self, offers: List[Dict[str, Any]]) -> Future:
+        return self._submit(self._replace_offers, [_dumps(offer) for offer in offers])
+
+    def attach(self, store, users=None) -> None:
+        """Route write-behind flushes of users.json / tickets.json to upserts of the dirty rows;
+        lookups also check users saved since the last flush"""
+        self._store = store
+        self._users = users
+
+        def sink_for(save):
+            def sink(data: Dict[Any, Any], dirty_keys) -> None:
+                if dirty_keys:
+                    changed = {key: data[key] for key in dirty_keys if key in data}
+                else:
+                    # No keys means a caller saved the whole dict - upsert everything held in
+                    # memory (a lazy user cache only holds its resident records)
+                    resident = getattr(data, "resident", None)
+                    changed = resident() if resident else data
+                save(changed)
+            return sink
+
+        store.register_sink("users.json", sink_for(self.save_users))
+        store.register_sink("tickets.json", sink_for(self.save_tickets))
+
+    # ========== INDEXED QUERIES ==========
+    @staticmethod
+    def _orders_for_user(conn, user_id: int) -> List[Dict[str, Any]]:
+        rows = conn.execute(
+            "SELECT data FROM orders WHERE user_id = ? ORDER BY created_at DESC", (user_id,)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    @staticmethod
+    def _order_history_page(conn, user_id: int, older_than: Optional[str], newer_than: Optional[str],
+                            limit: int) -> Dict[str, Any]:
+        # Rows ordered by (created_at, order_id) - the same key the in-memory order index uses
+        columns = "COALESCE(created_at, ''), order_id"
+        key = f"({columns})"
+        newest_first, oldest_first = "COALESCE(created_at, '') DESC, order_id DESC", columns
+        cursor = None
+        if older_than or newer_than:
+            cursor = conn.execute(f"SELECT {columns} FROM orders "
+                                  "WHERE order_id = ? AND user_id = ?", (older_than or newer_than, user_id)).fetchone()
+        if cursor is None:
+            rows = conn.execute(f"SELECT {columns}, data FROM orders WHERE user_id = ? ORDER BY {newest_first} LIMIT ?",
+                                (user_id, limit + 1)).fetchall()
+            has_newer, has_older = False, len(rows) > limit
+        elif older_than:
+            rows = conn.execute(f"SELECT {columns}, data FROM orders WHERE user_id = ? AND {key} < (?, ?) "
+                                f"ORDER BY {newest_first} LIMIT ?", (user_id, *cursor, limit + 1)).fetchall()
+            has_newer, has_older = True, len(rows) > limit
+        else:
+            rows = conn.execute(f"SELECT {columns}, data FROM orders WHERE user_id = ? AND {key} > (?, ?) "
+                                f"ORDER BY {oldest_first} LIMIT ?", (user_id, *cursor, limit + 1)).fetchall()
+            has_newer, has_older = len(rows) > limit, True
+            rows = rows[:limit][::-1]
+        rows = rows[:limit]
+
+        total = conn.execute("SELECT COUNT(*) FROM orders WHERE user_id = ?", (user_id,)).fetchone()[0]
+        offset = 0
+        if rows and has_newer:
+            offset = conn.execute(f"SELECT COUNT(*) FROM orders WHERE user_id = ? AND {key} > (?, ?)",
+                                  (user_id, rows[0][0], rows[0][1])).fetchone()[0]
+        orders = [json.loads(row[2]) for row in rows]
+        return {'orders': orders, 'total': total, 'offset': offset, 'has_newer': has_newer, 'has_older': has_older}
+
+    @staticmethod
+    def _order_statistics(conn, day: date) -> Dict[str, Any]:
+        start, end = day.isoformat(), (day + timedelta(days=1)).isoformat()
+        total = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        completed = conn.execute("SELECT COUNT(*) FROM orders WHERE status = 'completed'").fetchone()[0]
+        today_count, today_revenue = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(CASE WHEN status = 'completed' THEN total_price END), 0) "
+            "FROM orders WHERE created_at >= ? AND created_at < ?", (start, end)
+        ).fetchone()
+        platforms = {
+            platform: (count, revenue) for platform, count, revenue in conn.execute(
+                "SELECT platform, COUNT(*), COALESCE(SUM(CASE WHEN status = 'completed' THEN total_price END), 0) "
+                "FROM orders GROUP BY platform"
+            )
+        }
+        return {
+            'total': total,
+            'completed': completed,
+            'today_count': today_count,
+            'today_revenue': today_revenue,
+            'platforms': platforms,
+        }
+
+    @staticmethod
+    def _user_list_page(conn, sort: str, created: Optional[bool], status: Optional[str],
+                        older_than: Optional[int], newer_than: Optional[int], limit: int) -> Dict[str, Any]:
+        value = "COALESCE(join_date, '')" if sort == "joined" else "COALESCE(json_extract(data, '$.last_activity'), '')"
+        filters, params = [], []
+        if created is not None:
+            filters.append("account_created = ?")
+            params.append(int(created))
+        if status is not None:
+            filters.append("status = ?")
+            params.append(status)
+        where = " AND ".join(filters) or "1"
+        total = conn.execute(f"SELECT COUNT(*) FROM users WHERE {where}", params).fetchone()[0]
+
+        cursor_id = older_than if older_than is not None else newer_than
+        cursor = None
+        if cursor_id is not None:
+            cursor = conn.execute(f"SELECT {value} FROM users WHERE user_id = ?", (cursor_id,)).fetchone()
+        if cursor is not None and newer_than is not None:
+            rows = conn.execute(f"SELECT user_id, data FROM users WHERE {where} AND ({value}, user_id) > (?, ?) "
+                                f"ORDER BY {value}, user_id LIMIT ?", (*params, cursor[0], cursor_id, limit + 1)).fetchall()
+            has_newer, has_older = len(rows) > limit, True
+            rows = rows[:limit][::-1]
+        else:
+            condition, bounds = "", ()
+            if cursor is not None:
+                condition, bounds = f" AND ({value}, user_id) < (?, ?)", (cursor[0], cursor_id)
+            rows = conn.execute(f"SELECT user_id, data FROM users WHERE {where}{condition} "
+                                f"ORDER BY {value} DESC, user_id DESC LIMIT ?", (*params, *bounds, limit + 1)).fetchall()
+            has_newer, has_older = cursor is not None, len(rows) > limit
+            rows = rows[:limit]
+        return {'users': [(user_id, json.loads(data)) for user_id, data in rows], 'total': total,
+                'has_newer': has_newer, 'has_older': has_older}
+
+    @staticmethod
+    def _platform_user_ids(conn, platform: str) -> set:
+        rows = conn.execute("SELECT DISTINCT user_id FROM orders WHERE platform = ? AND user_id IS NOT NULL",
+                            (platform.lower(),)).fetchall()
+        return {row[0] for row in rows}
+
+    @staticmethod
+    def _select_user_ids(conn, keep: Callable[[Any, Dict[str, Any]], bool], skip: Set[int]) -> List[int]:
+        return [user_id for user_id, user_json in conn.execute("SELECT user_id, data FROM users ORDER BY user_id")
+                if user_id not in skip and keep(user_id, json.loads(user_json))]
+
+    @staticmethod
+    def _undeliverable_user_ids(conn, probed_before: str, limit: int) -> List[int]:
+        # Same expression as idx_users_undeliverable - unflagged users are NULL and never match
+        rows = conn.execute("SELECT user_id FROM users WHERE json_extract(data, '$.undeliverable.probed_at') < ? "
+                            "ORDER BY json_extract(data, '$.undeliverable.probed_at') LIMIT ?",
+                            (probed_before, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _search_users(conn, prefix: str, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        starts, word = f"{escaped}%", f"% {escaped}%"
+        names = ["LOWER(json_extract(data, '$.full_name'))", "LOWER(json_extract(data, '$.first_name'))"]
+        conditions = ["CAST(user_id AS TEXT) LIKE ? ESCAPE '\\'", "LOWER(LTRIM(username, '@')) LIKE ? ESCAPE '\\'"]
+        params = [starts, starts]
+        for name in names:
+            conditions += [f"{name} LIKE ? ESCAPE '\\'", f"{name} LIKE ? ESCAPE '\\'"]
+            params += [starts, word]
+        # Same tiers as match_rank - exact, then ID/username, then name prefix - so LIMIT keeps the best
+        fields = ["CAST(user_id AS TEXT)", "LOWER(LTRIM(username, '@'))"]
+        order = (f"CASE WHEN ? IN ({', '.join(fields + names)}) THEN 0"
+                 f" WHEN {conditions[0]} OR {conditions[1]} THEN 1"
+                 f" WHEN {conditions[2]} OR {conditions[4]} THEN 2 ELSE 3 END, user_id")
+        rows = conn.execute(f"SELECT user_id, data FROM users WHERE {' OR '.join(conditions)} "
+                            f"ORDER BY {order} LIMIT ?",
+                            (*params, prefix, starts, starts, starts, starts, limit))
+        return [(user_id, json.loads(data)) for user_id, data in rows]
+
+    @staticmethod
+    def _order_rollup(conn, start: date, end: date) -> Dict[str, Any]:
+        rows = conn.execute(
+            "SELECT substr(created_at, 1, 10) AS day, COALESCE(LOWER(platform), 'unknown'), "
+            "COALESCE(json_extract(data, '$.service_id'), 'unknown'), COUNT(*), "
+            "SUM(status = 'completed'), COALESCE(SUM(json_extract(data, '$.quantity')), 0), "
+            "COALESCE(SUM(CASE WHEN status = 'completed' THEN total_price END), 0) "
+            "FROM orders WHERE created_at >= ? AND created_at < ? GROUP BY 1, 2, 3",
+            (start.isoformat(), (end + timedelta(days=1)).isoformat())
+        )
+        days, platforms, services = {}, {}, {}
+        total = [0, 0, 0, 0.0]
+        for day, platform, service_id, *bucket in rows:
+            day = date.fromisoformat(day)
+            add_bucket(days, day, bucket)
+            add_bucket(platforms, platform, bucket)
+            add_bucket(services, (platform, str(service_id)), bucket)
+            for i, value in enumerate(bucket):
+                total[i] += value
+        return {'start': start, 'end': end, 'total': total, 'days': days,
+                'platforms': platforms, 'services': services}
+
+    @staticmethod
+    def _user_statistics(conn, day: date) -> Dict[str, Any]:
+        start, end = day.isoformat(), (day + timedelta(days=1)).isoformat()
+        total, total_balance, total_spent = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(balance), 0), COALESCE(SUM(total_spent), 0) FROM users"
+        ).fetchone()
+        active = conn.execute("SELECT COUNT(*) FROM users WHERE orders_count > 0").fetchone()[0]
+        new_today = conn.execute(
+            "SELECT COUNT(*) FROM users WHERE join_date >= ? AND join_date < ?", (start, end)
+        ).fetchone()[0]
+        statuses = dict(conn.execute("SELECT NULLIF(status, ''), COUNT(*) FROM users GROUP BY 1"))
+        with_activity = conn.execute(
+            "SELECT COUNT(*) FROM users WHERE json_type(data, '$.last_activity') IS NOT NULL"
+        ).fetchone()[0]
+        return {
+            'total': total,
+            'active': active,
+            'new_today': new_today,
+            'total_balance': total_balance,
+            'total_spent': total_spent,
+            'statuses': statuses,
+            'with_activity': with_activity,
+        }
+
+    @staticmethod
+    def _find_user_id(conn, phone_number: Optional[str], api_key: Optional[str],
+                      email: Optional[str], referral_code: Optional[str] = None) -> Optional[int]:
+        # Lowest user ID wins if older data holds duplicates
+        phone_key = normalize_phone(phone_number)
+        if phone_key:
+            row = conn.execute("SELECT user_id FROM users WHERE phone_key = ? ORDER BY user_id LIMIT 1",
+                               (phone_key,)).fetchone()
+            if row:
+                return row[0]
+        email_key = normalize_email(email)
+        if email_key:
+            row = conn.execute("SELECT user_id FROM users WHERE email_key = ? ORDER BY user_id LIMIT 1",
+                               (email_key,)).fetchone()
+            if row:
+                return row[0]
+        if api_key:
+            row = conn.execute("SELECT user_id FROM users WHERE api_key = ? LIMIT 1", (api_key,)).fetchone()
+            if row:
+                return row[0]
+        code = normalize_code(referral_code)
+        if code:
+            row = conn.execute("SELECT user_id FROM users WHERE referral_code = ? ORDER BY user_id LIMIT 1",
+                               (code,)).fetchone()
+            if row:
+                return row[0]
+        return None
+
+    @staticmethod
+    def _referral_stats(conn, user_id: int, recent: int) -> Dict[str, Any]:
+        referrals, accounts, revenue = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(account_created), 0), COALESCE(SUM(total_spent), 0) "
+            "FROM users WHERE referred_by = ? AND user_id != ?", (user_id, user_id)).fetchone()
+        rows = conn.execute("SELECT user_id FROM users WHERE referred_by = ? AND user_id != ? "
+                            "ORDER BY COALESCE(join_date, '') DESC, user_id DESC LIMIT ?",
+                            (user_id, user_id, recent)).fetchall()
+        return {'referrals': referrals, 'accounts': accounts, 'revenue': revenue,
+                'recent': [row[0] for row in rows]}
+
+    async def orders_for_user(self, user_id: int) -> List[Dict[str, Any]]:
+        return await self._run(self._orders_for_user, user_id)
+
+    async def order_history_page(self, user_id: int, older_than: Optional[str] = None,
+                                 newer_than: Optional[str] = None, limit: int = 10) -> Dict[str, Any]:
+        return await self._run(self._order_history_page, user_id, older_than, newer_than, limit)
+
+    async def order_statistics(self, day: date) -> Dict[str, Any]:
+        return await self._run(self._order_statistics, day)
+
+    async def user_statistics(self, day: date) -> Dict[str, Any]:
+        return await self._run(self._user_statistics, day)
+
+    async def order_rollup(self, start: date, end: date) -> Dict[str, Any]:
+        return await self._run(self._order_rollup, start, end)
+
+    async def user_list_page(self, sort: str = "joined", created: Optional[bool] = None,
+                             status: Optional[str] = None, older_than: Optional[int] = None,
+                             newer_than: Optional[int] = None, limit: int = 20) -> Dict[str, Any]:
+        return await self._run(self._user_list_page, sort, created, status, older_than, newer_than, limit)
+
+    async def platform_user_ids(self, platform: str) -> set:
+        return await self._run(self._platform_user_ids, platform)
+
+    async def select_user_ids(self, keep: Callable[[Any, Dict[str, Any]], bool]) -> List[int]:
+        # Rows are decoded and tested on the sqlite thread; users not flushed yet are tested here
+        unsaved = dict(self._unsaved_users())
+        selected = await self._run(self._select_user_ids, keep, set(unsaved))
+        return selected + [user_id for user_id, user in unsaved.items() if keep(user_id, user)]
+
+    async def undeliverable_user_ids(self, probed_before: str, limit: int) -> List[int]:
+        unsaved = dict(self._unsaved_users())
+        due = [user_id for user_id in await self._run(self._undeliverable_user_ids, probed_before, limit)
+               if user_id not in unsaved]
+        for user_id, user in unsaved.items():
+            flag = user.get('undeliverable')
+            if flag and (flag.get('probed_at') or '') < probed_before:
+                due.append(user_id)
+        return due[:limit]
+
+    async def search_users(self, prefix: str, limit: int = 200) -> List[Tuple[int, str, int]]:
+        from user_search import normalize_term, rank_users
+        prefix = normalize_term(prefix)
+        # LIKE narrows the candidates, ranking matches the in-memory index
+        candidates = await self._run(self._search_users, prefix, limit)
+        return rank_users(prefix, candidates)
+
+    def _unsaved_users(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Users saved in the current flush window - dirty records stay resident, so no reads"""
+        if self._store is None or self._users is None:
+            return []
+        unsaved = []
+        for user_id in sorted(self._store.dirty_keys("users.json")):
+            user = self._users.get(user_id)
+            if user is not None:
+                unsaved.append((user_id, user))
+        return unsaved
+
+    async def find_user_id(self, phone_number: Optional[str] = None, api_key: Optional[str] = None,
+                           email: Optional[str] = None, referral_code: Optional[str] = None) -> Optional[int]:
+        phone_key, email_key = normalize_phone(phone_number), normalize_email(email)
+        code = normalize_code(referral_code)
+        for user_id, user in self._unsaved_users():
+            if ((phone_key and normalize_phone(user.get('phone_number')) == phone_key)
+                    or (email_key and normalize_email(user.get('email')) == email_key)
+                    or (api_key and user.get('api_key') == api_key)
+                    or (code and normalize_code(user.get('referral_code')) == code)):
+                return user_id
+        return await self._run(self._find_user_id, phone_number, api_key, email, referral_code)
+
+    async def referral_stats(self, user_id: int, recent: int = 5) -> Dict[str, Any]:
+        return await self._run(self._referral_stats, user_id, recent)
+
+    def close_sync(self) -> None:
+        """Wait for queued writes, then close the connection"""
+        def _close(conn):
+            conn.close()
+            self._local.conn = None
+        self._executor.submit(lambda: _close(self._connect())).result()
+        self._executor.shutdown(wait=True)
+
+    async def close(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.close_sync)
+
+
+# ========== JSON MIGRATION ==========
+def _read_json(filename: str, default: Any) -> Any:
+    if not os.path.exists(filename):
+        print(f"📄 {filename} not found, skipping")
+        return default
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f) or default
+    except ValueError as e:
+        print(f"❌ Could not parse {filename}: {e}")
+        return default
+
+
+def migrate_json_files(db_path: str = SQLITE_DB_PATH) -> None:
+    """Import users.json, orders.json (+ journal), tickets.json and offers.json into SQLite"""
+    from order_journal import OrderJournal
+
+    repo = SQLiteRepository(db_path)
+    users = _read_json("users.json", {})
+    orders = OrderJournal().load()
+    tickets = _read_json("tickets.json", {})
+    offers = _read_json("offers.json", [])
+
+    repo.save_users(users).result()
+    repo.save_orders(orders).result()
+    repo.save_tickets(tickets).result()
+    if isinstance(offers, list):
+        repo.save_offers(offers).result()
+    repo.close_sync()
+
+    print(f"✅ Migrated {len(users)} users, {len(orders)} orders, {len(tickets)} tickets, "
+          f"{len(offers)} offers into {db_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        migrate_json_files(sys.argv[2] if len(sys.argv) >= 3 else SQLITE_DB_PATH)
+    else:
+        print("Usage: python sqlite_store.py migrate [db_path]")
@@ -31,6 +31,7 @@ class AdminSendOfferStates(StatesGroup):
     getting_offer_id = State()
     choosing_target = State()
     getting_specific_user_id = State()
+    getting_segment = State()
 
 
 class OfferOrderStates(StatesGroup):
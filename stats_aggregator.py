@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Statistics Aggregator
+Admin counters (totals, statuses, balances, per-platform and per-day buckets) kept up to date
+on every user/order save, so /static and the admin panels read them without scanning
+"""
+
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from repository import parse_iso_date
+
+# Per-record contributions remembered so a save can take the old values back out
+UserContribution = Tuple[Optional[str], bool, bool, Optional[date], float, float]
+OrderContribution = Tuple[bool, Optional[date], float, str, str, int]
+# Rollup bucket fields: [orders, completed, quantity, completed revenue]
+ROLLUP_FIELDS = ("orders", "completed", "quantity", "revenue")
+
+
+def _amount(value: Any) -> float:
+    try:
+        return float(value or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _rounded(value: Any) -> Any:
+    """Round float counters (and those inside dicts/tuples) to paise for comparisons"""
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {key: _rounded(item) for key, item in value.items() if item}
+    if isinstance(value, (tuple, list)):
+        return tuple(_rounded(item) for item in value)
+    return value
+
+
+def _user_contribution(user: Dict[str, Any]) -> UserContribution:
+    """(status, active, has last_activity, join day, balance, total spent)"""
+    try:
+        active = (user.get('orders_count', 0) or 0) > 0
+    except TypeError:
+        active = False
+    status = user.get('status')
+    return (str(status) if status else None, active, 'last_activity' in user,
+            parse_iso_date(user.get('join_date')), _amount(user.get('balance')), _amount(user.get('total_spent')))
+
+
+def _quantity(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _order_contribution(order: Dict[str, Any]) -> OrderContribution:
+    """(completed, created day, price, platform, service_id, quantity)"""
+    return (order.get('status') == 'completed', parse_iso_date(order.get('created_at')),
+            _amount(order.get('total_price')), str(order.get('platform') or 'unknown').lower(),
+            str(order.get('service_id') or 'unknown'), _quantity(order.get('quantity')))
+
+
+def add_bucket(buckets: Dict[Any, List[float]], key: Any, values) -> None:
+    """Add (orders, completed, quantity, revenue) into buckets[key]"""
+    bucket = buckets.get(key)
+    if bucket is None:
+        bucket = buckets[key] = [0, 0, 0, 0.0]
+    for i, value in enumerate(values):
+        bucket[i] += value
+
+
+class StatsAggregator:
+    """Running totals over users_data / orders_data, adjusted by each record's before/after delta"""
+
+    def __init__(self):
+        # False until rebuild() - shared-state workers never go live (other workers write too)
+        self.live = False
+        self._users: Dict[Any, UserContribution] = {}
+        self._orders: Dict[Any, OrderContribution] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        self._users.clear()
+        self._orders.clear()
+        self.user_statuses: Counter = Counter()
+        self.active_users = 0
+        self.users_with_activity = 0
+        self.total_balance = 0.0
+        self.total_spent = 0.0
+        # join day -> new users
+        self.users_by_day: Counter = Counter()
+
+        self.completed_orders = 0
+        # created day -> [orders, completed revenue]
+        self.orders_by_day: Dict[Optional[date], List[float]] = {}
+        # platform -> [orders, completed revenue]
+        self.platforms: Dict[str, List[float]] = {}
+        # created day -> (platform, service_id) -> [orders, completed, quantity, completed revenue]
+        self.rollups: Dict[Optional[date], Dict[Tuple[str, str], List[float]]] = {}
+
+    # ========== MAINTENANCE ==========
+    def rebuild(self, users, orders) -> None:
+        """Recount everything from scratch - on startup and from /rebuildstats"""
+        self._reset()
+        for user_id, user in users.items():
+            self.update_user(user_id, user)
+        for order_id, order in orders.items():
+            self.update_order(order_id, order)
+        self.live = True
+        print(f"📈 Statistics counted: {len(self._users)} users, {len(self._orders)} orders")
+
+    def _apply_user(self, contribution: UserContribution, sign: int) -> None:
+        status, active, has_activity, join_day, balance, spent = contribution
+        self.user_statuses[status] += sign
+        self.active_users += sign * active
+        self.users_with_activity += sign * has_activity
+        self.users_by_day[join_day] += sign
+        self.total_balance += sign * balance
+        self.total_spent += sign * spent
+
+    def _apply_order(self, contribution: OrderContribution, sign: int) -> None:
+        completed, day, price, platform, service_id, quantity = contribution
+        revenue = price if completed else 0.0
+        self.completed_orders += sign * completed
+        bucket = self.orders_by_day.setdefault(day, [0, 0.0])
+        bucket[0] += sign
+        bucket[1] += sign * revenue
+        bucket = self.platforms.setdefault(platform, [0, 0.0])
+        bucket[0] += sign
+        bucket[1] += sign * revenue
+        if not self.platforms[platform][0]:
+            del self.platforms[platform]
+
+        day_rollup = self.rollups.setdefault(day, {})
+        key = (platform, service_id)
+        add_bucket(day_rollup, key, (sign, sign * completed, sign * quantity, sign * revenue))
+        if not day_rollup[key][0]:
+            del day_rollup[key]
+            if not day_rollup:
+                del self.rollups[day]
+
+    def update_user(self, user_id: Any, user: Optional[Dict[str, Any]]) -> None:
+        """Count a user create/change (None = deleted)"""
+        old = self._users.pop(user_id, None)
+        if old is not None:
+            self._apply_user(old, -1)
+        if user:
+            new = self._users[user_id] = _user_contribution(user)
+            self._apply_user(new, +1)
+
+    def update_order(self, order_id: Any, order: Optional[Dict[str, Any]]) -> None:
+        """Count an order insert/status change (None = deleted)"""
+        old = self._orders.pop(order_id, None)
+        if old is not None:
+            self._apply_order(old, -1)
+        if order:
+            new = self._orders[order_id] = _order_contribution(order)
+            self._apply_order(new, +1)
+
+    # ========== READS ==========
+    def user_statistics(self, day: date) -> Dict[str, Any]:
+        """Same shape as Repository.user_statistics plus status counts"""
+        return {
+            'total': len(self._users),
+            'active': self.active_users,
+            'new_today': self.users_by_day.get(day, 0),
+            'total_balance': self.total_balance,
+            'total_spent': self.total_spent,
+            'statuses': dict(self.user_statuses),
+            'with_activity': self.users_with_activity,
+        }
+
+    def order_statistics(self, day: date) -> Dict[str, Any]:
+        """Same shape as Repository.order_statistics"""
+        today_count, today_revenue = self.orders_by_day.get(day, (0, 0.0))
+        return {
+            'total': len(self._orders),
+            'completed': self.completed_orders,
+            'today_count': today_count,
+            'today_revenue': today_revenue,
+            'platforms': {platform: (count, revenue) for platform, (count, revenue) in self.platforms.items()},
+        }
+
+    def order_rollup(self, start: date, end: date) -> Dict[str, Any]:
+        """Per-day, per-platform and per-service buckets for orders created start..end (inclusive)"""
+        days: Dict[date, List[float]] = {}
+        platforms: Dict[str, List[float]] = {}
+        services: Dict[Tuple[str, str], List[float]] = {}
+        total = [0, 0, 0, 0.0]
+        day = start
+        while day <= end:
+            for (platform, service_id), bucket in self.rollups.get(day, {}).items():
+                add_bucket(days, day, bucket)
+                add_bucket(platforms, platform, bucket)
+                add_bucket(services, (platform, service_id), bucket)
+                for i, value in enumerate(bucket):
+                    total[i] += value
+            day += timedelta(days=1)
+        return {'start': start, 'end': end, 'total': total, 'days': days,
+                'platforms': platforms, 'services': services}
+
+    def differences(self, other: "StatsAggregator", day: date) -> List[str]:
+        """Counters that differ from another aggregator (a fresh rebuild) - empty when consistent"""
+        found = []
+        for kind in ("user_statistics", "order_statistics"):
+            mine, theirs = getattr(self, kind)(day), getattr(other, kind)(day)
+            for key in mine:
+                a, b = _rounded(mine[key]), _rounded(theirs[key])
+                if a != b:
+                    found.append(f"{kind.split('_')[0]}.{key}: {a} → {b}")
+        drifted_days = [day for day in set(self.rollups) | set(other.rollups)
+                        if _rounded(self.rollups.get(day, {})) != _rounded(other.rollups.get(day, {}))]
+        if drifted_days:
+            found.append(f"rollups: {len(drifted_days)} day(s) differ")
+        return found
+
+
+# Shared aggregator over main.users_data / main.orders_data
+aggregator = StatsAggregator()
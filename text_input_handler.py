@@ -146,12 +146,12 @@ async def handle_screenshot_upload(message: Message,
         }
 
         # Store order in both temp and permanent storage
-        from main import orders_data, send_admin_notification, save_data_to_json
+        from main import orders_data, send_admin_notification, save_order
         order_temp[user_id] = order_record
         orders_data[order_id] = order_record  # Also store in permanent orders_data
 
         # Save order data to persistent storage
-        save_data_to_json(orders_data, "orders.json")
+        save_order(order_id)
 
         print(f"✅ Screenshot order {order_id} stored in both temp and permanent storage")
 
@@ -273,12 +273,9 @@ async def handle_text_input(message: Message,
         # Handle login phone verification
         phone = message.text.strip()
 
-        # Find user with matching phone number
-        matching_user = None
-        for uid, data in users_data.items():
-            if data.get('phone_number') == phone:
-                matching_user = uid
-                break
+        # Find user with matching phone number (normalized phone index)
+        from main import find_user_id_by
+        matching_user = await find_user_id_by(phone_number=phone)
 
         if matching_user and matching_user == user_id:
             # Phone matches, complete login
@@ -286,7 +283,7 @@ async def handle_text_input(message: Message,
 
             # Save user data to persistent storage
             from main import save_data_to_json
-            save_data_to_json(users_data, "users.json")
+            save_data_to_json(users_data, "users.json", user_id)
 
             # Only clear state if it's not an admin broadcast operation
             current_step = user_state[user_id].get("current_step")
@@ -598,6 +595,11 @@ async def handle_text_input(message: Message,
         # All validations passed
         validated_phone = phone_cleaned
 
+        # Phone numbers are unique per account
+        from main import ensure_contact_available
+        if not await ensure_contact_available(message, user_id, phone_number=phone_input):
+            return
+
         # Initialize user state if not exists
         if user_id not in user_state:
             user_state[user_id] = {"current_step": None, "data": {}}
@@ -656,6 +658,10 @@ async def handle_text_input(message: Message,
         if user_id not in user_state:
             user_state[user_id] = {"current_step": None, "data": {}}
 
+        from main import ensure_contact_available
+        if not await ensure_contact_available(message, user_id, phone_number=message.text.strip()):
+            return
+
         # Store phone and ask for email
         user_state[user_id]["data"]["phone_number"] = message.text.strip()
         user_state[user_id]["current_step"] = "waiting_email"
@@ -736,6 +742,11 @@ async def handle_text_input(message: Message,
             )
             return
 
+        # Emails are unique per account
+        from main import ensure_contact_available
+        if not await ensure_contact_available(message, user_id, email=email_cleaned):
+            return
+
         # Store email and complete account creation
         validated_email = email_cleaned
 
@@ -750,7 +761,7 @@ async def handle_text_input(message: Message,
 
         # Save user data to persistent storage
         from main import save_data_to_json
-        save_data_to_json(users_data, "users.json")
+        save_data_to_json(users_data, "users.json", user_id)
 
         # Clear user state
         user_state[user_id]["current_step"] = None
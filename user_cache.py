@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - Lazy Record Cache
+Dict-compatible users_data / orders_data that load records from per-record storage
+on first access and keep only a bounded LRU set resident
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Dict, Any, AsyncIterator, Iterator, List, Optional, Set, Tuple
+
+# Resident records kept before least-recently-used ones are evicted
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "5000"))
+# Records touched this recently may still be held by a handler - they are never evicted, so the
+# cache can run over max_size for a while (raise USER_CACHE_SIZE if overflows keep happening)
+EVICT_GRACE_SECONDS = float(os.getenv("USER_CACHE_GRACE", "300"))
+
+
+class _StreamView:
+    """Iterable view over all records that pages through storage instead of the cache"""
+
+    def __init__(self, cache: "LazyRecordCache", mode: str):
+        self._cache = cache
+        self._mode = mode
+
+    def __iter__(self):
+        for key, record in self._cache.stream():
+            if self._mode == "keys":
+                yield key
+            elif self._mode == "values":
+                yield record
+            else:
+                yield key, record
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+class LazyRecordCache(MutableMapping):
+    """Mapping over a repository table - subclasses plug in the per-record storage calls"""
+
+    filename = ""
+
+    def __init__(self, repository, store, max_size: int = USER_CACHE_SIZE):
+        self.repository = repository
+        self.store = store
+        self.max_size = max_size
+        # key -> [record, last access time], least recently used first
+        self._resident: "OrderedDict[Any, list]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.overflows = 0
+
+    # ========== STORAGE HOOKS ==========
+    def _key(self, key: Any) -> Any:
+        """Normalize a key, raising TypeError/ValueError for keys that can't exist"""
+        return key
+
+    def _fetch_sync(self, key: Any) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def _fetch(self, key: Any) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _iter_storage(self) -> Iterator:
+        raise NotImplementedError
+
+    def _count(self) -> int:
+        raise NotImplementedError
+
+    async def _fetch_page(self, after: Any, limit: int) -> List[Tuple[Any, Dict[str, Any]]]:
+        """Up to limit (key, record) pairs with keys after after (None = from the start), read off the loop"""
+        raise NotImplementedError
+
+    async def _count_async(self) -> int:
+        raise NotImplementedError
+
+    def _save(self, key: Any, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def _delete(self, key: Any) -> None:
+        raise NotImplementedError
+
+    # ========== CACHE MECHANICS ==========
+    def _touch(self, key: int) -> Dict[str, Any]:
+        entry = self._resident[key]
+        entry[1] = time.monotonic()
+        self._resident.move_to_end(key)
+        return entry[0]
+
+    def _admit(self, key: int, record: Dict[str, Any]) -> None:
+        self._resident[key] = [record, time.monotonic()]
+        self._resident.move_to_end(key)
+        self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used clean records down to max_size - unsaved and recently used ones stay over it"""
+        excess = len(self._resident) - self.max_size
+        if excess <= 0:
+            return
+        dirty = self.store.dirty_keys(self.filename)
+        cutoff = time.monotonic() - EVICT_GRACE_SECONDS
+        victims = []
+        for key, (record, last_access) in self._resident.items():
+            if len(victims) >= excess:
+                break
+            if last_access > cutoff:
+                # Least recently used first - everything from here on is still in its grace period
+                self.overflows += 1
+                break
+            if key in dirty:
+                continue
+            victims.append(key)
+        for key in victims:
+            del self._resident[key]
+        self.evictions += len(victims)
+
+    def _load(self, key: Any) -> Optional[Dict[str, Any]]:
+        try:
+            key = self._key(key)
+        except (TypeError, ValueError):
+            return None
+        if key in self._resident:
+            self.hits += 1
+            return self._touch(key)
+        self.misses += 1
+        record = self._fetch_sync(key)
+        if record is not None:
+            self._admit(key, record)
+        return record
+
+    async def preload(self, key: Any) -> None:
+        """Load a record off the event loop so the handler's dict access is a cache hit"""
+        key = self._key(key)
+        if key in self._resident:
+            return
+        record = await self._fetch(key)
+        if record is not None and key not in self._resident:
+            self._admit(key, record)
+
+    def invalidate(self, key: Any) -> None:
+        """Forget a resident record so the next access re-reads it (kept while it has unsaved changes)"""
+        key = self._key(key)
+        if key not in self.store.dirty_keys(self.filename):
+            self._resident.pop(key, None)
+
+    def drop_clean(self, keep: Set[Any], used_before: float) -> None:
+        """Forget clean resident records outside keep that were last used before used_before"""
+        keep = keep | self.store.dirty_keys(self.filename)
+        for key, (record, last_access) in list(self._resident.items()):
+            if key not in keep and last_access < used_before:
+                del self._resident[key]
+
+    def resident(self) -> Dict[Any, Dict[str, Any]]:
+        """Records currently held in memory"""
+        return {key: entry[0] for key, entry in self._resident.items()}
+
+    def stream(self) -> Iterator:
+        """Every record from storage in key order, preferring the resident (newer) copy"""
+        seen = set()
+        for key, record in self._iter_storage():
+            seen.add(key)
+            entry = self._resident.get(key)
+            yield key, entry[0] if entry else record
+        # New records not flushed to storage yet
+        for key, entry in list(self._resident.items()):
+            if key not in seen:
+                yield key, entry[0]
+
+    async def stream_async(self, batch_size: int = 1000) -> AsyncIterator[Tuple[Any, Dict[str, Any]]]:
+        """stream() for the event loop - each page is read and decoded on the storage thread"""
+        seen = set()
+        after = None
+        while True:
+            page = await self._fetch_page(after, batch_size)
+            if not page:
+                break
+            for key, record in page:
+                seen.add(key)
+                entry = self._resident.get(key)
+                yield key, entry[0] if entry else record
+            after = page[-1][0]
+        for key, entry in list(self._resident.items()):
+            if key not in seen:
+                yield key, entry[0]
+
+    async def count_async(self) -> int:
+        """len() for the event loop"""
+        return await self._count_async()
+
+    # ========== MAPPING INTERFACE ==========
+    def __getitem__(self, key: Any) -> Dict[str, Any]:
+        record = self._load(key)
+        if record is None:
+            raise KeyError(key)
+        return record
+
+    def __contains__(self, key: Any) -> bool:
+        return self._load(key) is not None
+
+    def __setitem__(self, key: Any, record: Dict[str, Any]) -> None:
+        key = self._key(key)
+        self._admit(key, record)
+        # Write new/replaced records through so storage-side counts and scans see them
+        self._save(key, record)
+
+    def __delitem__(self, key: Any) -> None:
+        key = self._key(key)
+        existed = self._resident.pop(key, None) is not None
+        if self._fetch_sync(key) is None and not existed:
+            raise KeyError(key)
+        self._delete(key)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        # Queued writes run before this count on the storage thread
+        return self._count()
+
+    def keys(self):
+        return _StreamView(self, "keys")
+
+    def values(self):
+        return _StreamView(self, "values")
+
+    def items(self):
+        return _StreamView(self, "items")
+
+    def update(self, *args, **kwargs) -> None:
+        for key, record in dict(*args, **kwargs).items():
+            self[key] = record
+
+    def stats_text(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total else 0.0
+        return (f"{len(self._resident)}/{self.max_size} resident, "
+                f"{hit_rate:.1f}% hit rate, {self.evictions} evictions, {self.overflows} overflows")
+
+
+class LazyUserCache(LazyRecordCache):
+    """users_data backed by the SQLite users table"""
+
+    filename = "users.json"
+
+    def _key(self, key: Any) -> int:
+        return int(key)
+
+    def _fetch_sync(self, key: int) -> Optional[Dict[str, Any]]:
+        return self.repository.get_user_sync(key)
+
+    async def _fetch(self, key: int) -> Optional[Dict[str, Any]]:
+        return await self.repository.get_user(key)
+
+    def _iter_storage(self) -> Iterator:
+        return self.repository.iter_users()
+
+    def _count(self) -> int:
+        return self.repository.count_users_sync()
+
+    async def _fetch_page(self, after: Optional[int], limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        return await self.repository.user_records_page(after, limit)
+
+    async def _count_async(self) -> int:
+        return await self.repository.count_users()
+
+    def _save(self, key: int, record: Dict[str, Any]) -> None:
+        self.repository.save_users({key: record})
+
+    def _delete(self, key: int) -> None:
+        self.repository.delete_user(key)
+
+
+class LazyOrderCache(LazyRecordCache):
+    """orders_data backed by the SQLite orders table (shared state mode)"""
+
+    filename = "orders.json"
+
+    def _key(self, key: Any) -> str:
+        if not isinstance(key, str):
+            raise TypeError("order IDs are strings")
+        return key
+
+    def _fetch_sync(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.repository.get_order_sync(key)
+
+    async def _fetch(self, key: str) -> Optional[Dict[str, Any]]:
+        return await self.repository.get_order(key)
+
+    def _iter_storage(self) -> Iterator:
+        return self.repository.iter_orders()
+
+    def _count(self) -> int:
+        return self.repository.count_orders_sync()
+
+    async def _fetch_page(self, after: Optional[str], limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        return await self.repository.order_records_page(after, limit)
+
+    async def _count_async(self) -> int:
+        return await self.repository.count_orders()
+
+    def _save(self, key: str, record: Dict[str, Any]) -> None:
+        self.repository.save_orders({key: record})
+
+    def _delete(self, key: str) -> None:
+        self.repository.delete_order(key)
+
+
+# ========== EVENT-LOOP HELPERS ==========
+async def iter_records(records, batch_size: int = 1000) -> AsyncIterator[Tuple[Any, Dict[str, Any]]]:
+    """(key, record) pairs of users_data/orders_data without blocking the loop - a lazy cache
+    pages through storage off the loop, a plain dict lets other tasks run between batches"""
+    stream = getattr(records, "stream_async", None)
+    if stream is not None:
+        async for item in stream(batch_size):
+            yield item
+        return
+    for position, item in enumerate(list(records.items()), 1):
+        yield item
+        if position % batch_size == 0:
+            await asyncio.sleep(0)
+
+
+async def count_records(records) -> int:
+    """len(users_data/orders_data) without a blocking storage count"""
+    count = getattr(records, "count_async", None)
+    return await count() if count is not None else len(records)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - User Directory Index
+users_data kept sorted by join date and by last activity, with account_created/status
+counts, so the admin /userlist pages are read one screen at a time
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+# Sort name -> user field holding an ISO timestamp
+SORT_FIELDS = {"joined": "join_date", "active": "last_activity"}
+
+
+def _sort_value(user: Dict[str, Any], field: str) -> str:
+    value = user.get(field)
+    return value if isinstance(value, str) else ""
+
+
+def _attributes(user: Dict[str, Any]) -> Tuple[Tuple[str, ...], bool, Optional[str]]:
+    """(sort values in SORT_FIELDS order, account_created, status)"""
+    status = user.get('status')
+    return (tuple(_sort_value(user, field) for field in SORT_FIELDS.values()),
+            bool(user.get('account_created', False)), str(status) if status else None)
+
+
+class UserDirectory:
+    """Per-sort [(timestamp, user_id), ...] lists, oldest first, updated on every user save"""
+
+    def __init__(self):
+        self._sorted: Dict[str, List[Tuple[str, int]]] = {sort: [] for sort in SORT_FIELDS}
+        self._attrs: Dict[int, Tuple[Tuple[str, ...], bool, Optional[str]]] = {}
+        # (account_created, status) -> users
+        self._counts: Counter = Counter()
+
+    def rebuild(self, users) -> None:
+        """Index every user - called once after users_data is loaded"""
+        self._attrs.clear()
+        self._counts.clear()
+        for user_id, user in users.items():
+            attrs = self._attrs[user_id] = _attributes(user)
+            self._counts[attrs[1:]] += 1
+        for position, sort in enumerate(SORT_FIELDS):
+            self._sorted[sort] = sorted((attrs[0][position], user_id) for user_id, attrs in self._attrs.items())
+        print(f"📇 User directory built: {len(self._attrs)} users")
+
+    def update(self, user_id: Any, user: Optional[Dict[str, Any]]) -> None:
+        """Re-index one user after a save (None = deleted)"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return
+        new = _attributes(user) if user else None
+        old = self._attrs.pop(user_id, None)
+        if old == new:
+            if new is not None:
+                self._attrs[user_id] = new
+            return
+        for position, sort in enumerate(SORT_FIELDS):
+            entries = self._sorted[sort]
+            if old is not None:
+                entry = (old[0][position], user_id)
+                index = bisect_left(entries, entry)
+                if index < len(entries) and entries[index] == entry:
+                    del entries[index]
+            if new is not None:
+                insort(entries, (new[0][position], user_id))
+        if old is not None:
+            self._counts[old[1:]] -= 1
+        if new is not None:
+            self._attrs[user_id] = new
+            self._counts[new[1:]] += 1
+
+    def count(self, created: Optional[bool] = None, status: Optional[str] = None) -> int:
+        """Users matching the filters - summed over the (account_created, status) counts"""
+        return sum(count for (is_created, user_status), count in self._counts.items()
+                   if (created is None or is_created == created) and (status is None or user_status == status))
+
+    def _matches(self, user_id: int, created: Optional[bool], status: Optional[str]) -> bool:
+        _values, is_created, user_status = self._attrs[user_id]
+        return (created is None or is_created == created) and (status is None or user_status == status)
+
+    def page(self, sort: str = "joined", created: Optional[bool] = None, status: Optional[str] = None,
+             older_than: Optional[int] = None, newer_than: Optional[int] = None, limit: int = 20) -> Dict[str, Any]:
+        """One page of user IDs, newest first, next to a cursor user ID - only the page's entries are visited"""
+        entries = self._sorted[sort]
+        position = list(SORT_FIELDS).index(sort)
+        cursor = self._attrs.get(older_than if older_than is not None else newer_than)
+        found: List[int] = []
+
+        if cursor is not None and newer_than is not None:
+            # Walk towards newer entries, then flip to newest first
+            index = bisect_right(entries, (cursor[0][position], newer_than))
+            while index < len(entries) and len(found) <= limit:
+                if self._matches(entries[index][1], created, status):
+                    found.append(entries[index][1])
+                index += 1
+            has_newer, has_older = len(found) > limit, True
+            found = found[:limit][::-1]
+        else:
+            if cursor is not None:
+                index = bisect_left(entries, (cursor[0][position], older_than)) - 1
+            else:
+                index = len(entries) - 1
+            while index >= 0 and len(found) <= limit:
+                if self._matches(entries[index][1], created, status):
+                    found.append(entries[index][1])
+                index -= 1
+            has_newer, has_older = cursor is not None, len(found) > limit
+            found = found[:limit]
+
+        return {'user_ids': found, 'total': self.count(created, status),
+                'has_newer': has_newer, 'has_older': has_older}
+
+
+# Shared directory over main.users_data
+directory = UserDirectory()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - User Lookup Indexes
+Normalized phone-number and email hash indexes over users_data for O(1) login lookups
+"""
+
+import re
+from typing import Dict, Any, Optional
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(phone: Any) -> Optional[str]:
+    """Canonical +<country><number> form - '+91 98765-43210', '09876543210' and '9876543210' match"""
+    if not phone or not isinstance(phone, str):
+        return None
+    digits = _NON_DIGITS.sub("", phone)
+    if len(digits) == 11 and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == 10:
+        # Bare Indian mobile number
+        digits = f"91{digits}"
+    if len(digits) < 8:
+        return None
+    return f"+{digits}"
+
+
+def normalize_email(email: Any) -> Optional[str]:
+    if not email or not isinstance(email, str):
+        return None
+    email = email.strip().lower()
+    return email if "@" in email else None
+
+
+class UserIndex:
+    """Unique phone -> user_id and email -> user_id maps kept in step with users_data saves"""
+
+    def __init__(self):
+        self.by_phone: Dict[str, int] = {}
+        self.by_email: Dict[str, int] = {}
+        # user_id -> (phone key, email key) currently indexed for that user
+        self._keys: Dict[int, tuple] = {}
+        self.conflicts = 0
+
+    def rebuild(self, users: Dict[int, Dict[str, Any]]) -> None:
+        """Index every user - called once after users_data is loaded"""
+        self.by_phone.clear()
+        self.by_email.clear()
+        self._keys.clear()
+        self.conflicts = 0
+        for user_id, user in users.items():
+            self.update(user_id, user)
+        print(f"🔎 User indexes built: {len(self.by_phone)} phones, {len(self.by_email)} emails"
+              + (f" ({self.conflicts} duplicates skipped)" if self.conflicts else ""))
+
+    def _set(self, index: Dict[str, int], key: Optional[str], user_id: int, claim: bool) -> Optional[str]:
+        if key is None:
+            return None
+        owner = index.get(key)
+        if owner is not None and owner != user_id and not claim:
+            # First account keeps the number/address - duplicates are rejected at input time
+            self.conflicts += 1
+            print(f"⚠️ {key} already belongs to user {owner} - not indexed for user {user_id}")
+            return None
+        index[key] = user_id
+        return key
+
+    def update(self, user_id: Any, user: Optional[Dict[str, Any]], claim: bool = False) -> None:
+        """Re-index one user after a save; claim=True takes over keys held by another user"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return
+        self.remove(user_id)
+        if not user:
+            return
+        phone_key = self._set(self.by_phone, normalize_phone(user.get('phone_number')), user_id, claim)
+        email_key = self._set(self.by_email, normalize_email(user.get('email')), user_id, claim)
+        if phone_key or email_key:
+            self._keys[user_id] = (phone_key, email_key)
+
+    def remove(self, user_id: int) -> None:
+        phone_key, email_key = self._keys.pop(user_id, (None, None))
+        if phone_key and self.by_phone.get(phone_key) == user_id:
+            del self.by_phone[phone_key]
+        if email_key and self.by_email.get(email_key) == user_id:
+            del self.by_email[email_key]
+
+    def find_by_phone(self, phone: Any) -> Optional[int]:
+        key = normalize_phone(phone)
+        return self.by_phone.get(key) if key else None
+
+    def find_by_email(self, email: Any) -> Optional[int]:
+        key = normalize_email(email)
+        return self.by_email.get(key) if key else None
+
+
+# Shared index over main.users_data
+index = UserIndex()
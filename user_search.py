@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+India Social Panel - User Search Index
+Prefix index over username, first_name, full_name (and each name word) and the user ID
+for admin /finduser lookups, kept in step with users_data saves
+"""
+
+from bisect import bisect_left, insort
+from typing import Dict, Any, List, Optional, Tuple
+
+# Field ranks - lower ranks list first among equally good matches
+FIELD_ID, FIELD_USERNAME, FIELD_FULL_NAME, FIELD_FIRST_NAME, FIELD_NAME_WORD = range(5)
+FIELD_LABELS = {
+    FIELD_ID: "ID",
+    FIELD_USERNAME: "username",
+    FIELD_FULL_NAME: "name",
+    FIELD_FIRST_NAME: "first name",
+    FIELD_NAME_WORD: "name",
+}
+
+# Stop walking matches after this many terms - a one-letter prefix would otherwise visit everyone
+MAX_SCANNED_TERMS = 5000
+
+
+def normalize_term(value: Any) -> str:
+    return " ".join(str(value).lower().lstrip("@").split()) if value else ""
+
+
+def user_terms(user_id: Any, user: Dict[str, Any]) -> List[Tuple[str, int]]:
+    """(term, field) pairs a user can be found by"""
+    terms = {(str(user_id), FIELD_ID)}
+    username = normalize_term(user.get('username'))
+    if username:
+        terms.add((username, FIELD_USERNAME))
+    for field, key in ((FIELD_FULL_NAME, 'full_name'), (FIELD_FIRST_NAME, 'first_name')):
+        name = normalize_term(user.get(key))
+        if not name:
+            continue
+        terms.add((name, field))
+        # Later words too, so "kumar" finds "Raj Kumar"
+        for word in name.split()[1:]:
+            terms.add((word, FIELD_NAME_WORD))
+    return sorted(terms)
+
+
+def match_rank(prefix: str, term: str, field: int) -> Tuple[int, int, int]:
+    """Exact matches first, then by field, then shorter (closer) terms"""
+    return (0 if term == prefix else 1, field, len(term))
+
+
+class UserSearchIndex:
+    """Sorted (term, field, user_id) list - bisect gives a trie's prefix ranges at list memory cost"""
+
+    def __init__(self):
+        self._entries: List[Tuple[str, int, int]] = []
+        # user_id -> entries currently indexed for that user
+        self._user_entries: Dict[int, List[Tuple[str, int, int]]] = {}
+
+    def rebuild(self, users) -> None:
+        """Index every user - called once after users_data is loaded"""
+        self._user_entries.clear()
+        entries = []
+        for user_id, user in users.items():
+            user_entries = [(term, field, user_id) for term, field in user_terms(user_id, user)]
+            self._user_entries[user_id] = user_entries
+            entries.extend(user_entries)
+        entries.sort()
+        self._entries = entries
+        print(f"🔎 User search index built: {len(entries)} terms for {len(self._user_entries)} users")
+
+    def update(self, user_id: Any, user: Optional[Dict[str, Any]]) -> None:
+        """Re-index one user after a save (None = deleted)"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return
+        new_entries = [(term, field, user_id) for term, field in user_terms(user_id, user)] if user else []
+        old_entries = self._user_entries.pop(user_id, [])
+        if old_entries == new_entries:
+            if new_entries:
+                self._user_entries[user_id] = new_entries
+            return
+        for entry in old_entries:
+            position = bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+        for entry in new_entries:
+            insort(self._entries, entry)
+        if new_entries:
+            self._user_entries[user_id] = new_entries
+
+    def search(self, prefix: str) -> List[Tuple[int, str, int]]:
+        """Matching (user_id, matched term, field), best match per user, best users first"""
+        prefix = normalize_term(prefix)
+        if not prefix:
+            return []
+        best: Dict[int, Tuple[Tuple[int, int, int], str, int]] = {}
+        position = bisect_left(self._entries, (prefix,))
+        scanned = 0
+        while position < len(self._entries) and scanned < MAX_SCANNED_TERMS:
+            term, field, user_id = self._entries[position]
+            if not term.startswith(prefix):
+                break
+            rank = match_rank(prefix, term, field)
+            if user_id not in best or rank < best[user_id][0]:
+                best[user_id] = (rank, term, field)
+            position += 1
+            scanned += 1
+        ranked = sorted(best.items(), key=lambda item: (item[1][0], item[0]))
+        return [(user_id, term, field) for user_id, (_rank, term, field) in ranked]
+
+
+def rank_users(prefix: str, users: List[Tuple[int, Dict[str, Any]]]) -> List[Tuple[int, str, int]]:
+    """Rank already-fetched candidates (SQLite search) the same way as the index"""
+    prefix = normalize_term(prefix)
+    ranked = []
+    for user_id, user in users:
+        matches = [(match_rank(prefix, term, field), term, field)
+                   for term, field in user_terms(user_id, user) if term.startswith(prefix)]
+        if matches:
+            rank, term, field = min(matches)
+            ranked.append((rank, user_id, term, field))
+    ranked.sort()
+    return [(user_id, term, field) for _rank, user_id, term, field in ranked]
+
+
+# Shared index over main.users_data
+index = UserSearchIndex()